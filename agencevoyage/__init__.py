@@ -1,2 +1,3 @@
 from . import models
+from . import controllers
 # Les rapports sont définis dans les fichiers XML, pas besoin d'importer
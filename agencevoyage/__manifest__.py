@@ -18,24 +18,37 @@
     'data': [
         'data/ir_sequence_data.xml',
         'data/email_templates.xml',
+        'data/ir_cron_data.xml',
+        'data/caisse_registre_data.xml',
         'views/client_views.xml',
+        'views/client_doublon_views.xml',
         'views/destination_views.xml',
         'views/voyage_views.xml',
         'views/fournisseur_views.xml',
         'views/achat_views.xml',
         'views/reservation_views.xml',
+        'views/option_place_views.xml',
         'views/paiement_views.xml',
         'views/caisse_views.xml',
+        'views/releve_bancaire_views.xml',
+        'views/ir_sequence_views.xml',
+        'views/balance_agee_views.xml',
+        'views/recalcul_prix_views.xml',
+        'views/import_groupe_views.xml',
         'views/dashboard_views.xml',  # Fichier temporaire vide pour permettre la mise à jour
         'security/ir.model.access.csv',
+        'security/export_job_security.xml',
+        'views/export_job_views.xml',
         'views/menu_views.xml',
         # Rapports
         'reports/reservation_report.xml',
         'reports/caisse_report.xml',
         'reports/paiement_report.xml',
+        'reports/balance_agee_report.xml',
         'report/reservation_template.xml',
         'report/caisse_template.xml',
         'report/paiement_template.xml',
+        'report/balance_agee_template.xml',
     ],
     'installable': True,
     'application': True,
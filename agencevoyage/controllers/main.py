@@ -0,0 +1,35 @@
+from odoo import http
+from odoo.http import request, content_disposition
+from werkzeug.exceptions import NotFound
+from werkzeug.wsgi import wrap_file
+
+
+class AgenceVoyageExport(http.Controller):
+
+    @http.route('/agencevoyage/export/<int:demande_id>', type='http', auth='user')
+    def telecharger_export(self, demande_id, **kwargs):
+        """Sert le fichier d'une demande d'export en le lisant par blocs depuis le disque"""
+        demande = request.env['agencevoyage.export.demande'].browse(demande_id).exists()
+        if not demande or demande.create_uid != request.env.user:
+            raise NotFound()
+        fichier, nom_fichier, mimetype = demande._generer_fichier()
+        fichier.seek(0, 2)
+        taille = fichier.tell()
+        fichier.seek(0)
+        return request.make_response(wrap_file(request.httprequest.environ, fichier), headers=[
+            ('Content-Type', mimetype),
+            ('Content-Length', taille),
+            ('Content-Disposition', content_disposition(nom_fichier)),
+        ])
+
+
+class AgenceVoyagePaiementApi(http.Controller):
+
+    @http.route('/agencevoyage/api/paiements', type='json', auth='user', methods=['POST'])
+    def recevoir_paiements(self, paiements, source='en_ligne', **kwargs):
+        """Reçoit un lot de paiements d'un terminal ou d'une passerelle (JSON-RPC).
+
+        Le lot peut être renvoyé sans risque après une erreur réseau : les
+        paiements déjà enregistrés sont reconnus par leur clé d'idempotence.
+        """
+        return {'resultats': request.env['agencevoyage.paiement'].ingerer_paiements(paiements, source)}
@@ -1,4 +1,11 @@
+from . import ir_sequence
+from . import ir_actions_report
+from . import mail_mail
+from . import export_mixin
+from . import export_demande
+from . import export_job
 from . import client
+from . import client_doublon
 from . import destination
 from . import voyage
 from . import programme_jour
@@ -13,5 +20,16 @@ from . import ligne_achat
 from . import reservation
 from . import voyageur
 from . import chambre_reservation
+from . import option_place
+from . import balance_agee
+from . import recalcul_prix
+from . import recalcul_prix_ligne
+from . import import_groupe
 from . import paiement
+from . import releve_bancaire
+from . import releve_bancaire_ligne
 from . import caisse
+from . import caisse_checkpoint
+from . import caisse_recalcul
+from . import caisse_registre
+from . import caisse_cloture
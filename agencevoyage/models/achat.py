@@ -5,14 +5,16 @@ from odoo.exceptions import ValidationError, UserError
 class Achat(models.Model):
     _name = 'agencevoyage.achat'
     _description = 'Achat'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'agencevoyage.export.mixin']
     _rec_name = 'name'
+    _export_nom_fichier = 'achats'
     _order = 'date_achat desc'
 
     name = fields.Char(
         string='ID Achat',
         required=True,
-        default=lambda self: self.env['ir.sequence'].next_by_code('agencevoyage.achat') or 'Nouveau',
+        default='Nouveau',
+        copy=False,
         tracking=True,
         readonly=True
     )
@@ -219,9 +221,28 @@ class Achat(models.Model):
                 raise ValidationError(_('Un achat en statut "%s" doit avoir au moins une ligne d\'achat.') % dict(record._fields['statut'].selection)[record.statut])
     
     @api.model
-    def create(self, vals):
-        """Génère automatiquement le numéro d'achat"""
-        if vals.get('name', 'Nouveau') == 'Nouveau':
-            vals['name'] = self.env['ir.sequence'].next_by_code('agencevoyage.achat') or 'Nouveau'
-        return super(Achat, self).create(vals)
+    def _get_colonnes_export(self):
+        """Colonnes de l'export Excel / CSV des achats"""
+        return [
+            (_('Numéro'), 'name'),
+            (_('Date'), 'date_achat'),
+            (_('Voyage'), 'voyage_id.titre_voyage'),
+            (_('Fournisseur'), 'fournisseur_id.display_name'),
+            (_('Type'), 'type_fournisseur'),
+            (_('Statut'), 'statut'),
+            (_('Montant HT'), 'montant_ht'),
+            (_('Montant TVA'), 'montant_tva'),
+            (_('Montant TTC'), 'montant_ttc'),
+            (_('Montant Payé'), 'montant_paye'),
+            (_('Reste à Payer'), 'reste_a_payer'),
+        ]
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Génère automatiquement les numéros d'achat, en un seul appel à la séquence"""
+        sans_numero = [vals for vals in vals_list if vals.get('name', 'Nouveau') == 'Nouveau']
+        numeros = self.env['ir.sequence']._next_by_code_lot('agencevoyage.achat', len(sans_numero))
+        for vals, numero in zip(sans_numero, numeros):
+            vals['name'] = numero or 'Nouveau'
+        return super(Achat, self).create(vals_list)
 
@@ -0,0 +1,98 @@
+from odoo import models, fields, tools
+
+
+class BalanceAgee(models.Model):
+    _name = 'agencevoyage.balance.agee'
+    _description = 'Balance âgée des clients'
+    _auto = False
+    _rec_name = 'client_id'
+    _order = 'montant_total desc'
+
+    client_id = fields.Many2one(
+        'agencevoyage.client',
+        string='Client',
+        readonly=True
+    )
+    base_calcul = fields.Selection(
+        [
+            ('reservation', 'Date de réservation'),
+            ('depart', 'Date de départ'),
+        ],
+        string='Ancienneté depuis',
+        readonly=True
+    )
+    nombre_reservations = fields.Integer(
+        string='Réservations',
+        readonly=True
+    )
+    montant_0_30 = fields.Float(
+        string='0-30 jours',
+        digits=(16, 2),
+        readonly=True,
+        help='Inclut les départs à venir pour l\'ancienneté depuis la date de départ'
+    )
+    montant_31_60 = fields.Float(
+        string='31-60 jours',
+        digits=(16, 2),
+        readonly=True
+    )
+    montant_61_90 = fields.Float(
+        string='61-90 jours',
+        digits=(16, 2),
+        readonly=True
+    )
+    montant_plus_90 = fields.Float(
+        string='Plus de 90 jours',
+        digits=(16, 2),
+        readonly=True
+    )
+    montant_total = fields.Float(
+        string='Total dû',
+        digits=(16, 2),
+        readonly=True
+    )
+    anciennete_max = fields.Integer(
+        string='Ancienneté max (jours)',
+        readonly=True,
+        group_operator='max'
+    )
+
+    def init(self):
+        """Vue SQL : reste à payer des réservations confirmées, par client et par tranche d'ancienneté.
+
+        Chaque réservation est comptée une fois par base de calcul (date de
+        réservation et date de départ) ; le regroupement par client est fait
+        par une seule requête, recalculée à chaque lecture du rapport.
+        """
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute("""
+            CREATE OR REPLACE VIEW %s AS (
+                WITH creances AS (
+                    SELECT r.client_id,
+                           base.base_calcul,
+                           CURRENT_DATE - CASE base.base_calcul
+                                              WHEN 'reservation' THEN r.date_reservation
+                                              ELSE COALESCE(v.date_debut, r.date_reservation)
+                                          END AS anciennete,
+                           r.reste_a_payer
+                      FROM agencevoyage_reservation r
+                 LEFT JOIN agencevoyage_voyage v ON v.id = r.voyage_id
+                CROSS JOIN (VALUES ('reservation'), ('depart')) AS base(base_calcul)
+                     WHERE r.statut = 'confirmee'
+                       AND r.client_id IS NOT NULL
+                       AND r.reste_a_payer > 0.005
+                )
+                SELECT client_id * 2 + (base_calcul = 'depart')::int AS id,
+                       client_id,
+                       base_calcul,
+                       COUNT(*) AS nombre_reservations,
+                       COALESCE(SUM(reste_a_payer) FILTER (WHERE anciennete <= 30), 0) AS montant_0_30,
+                       COALESCE(SUM(reste_a_payer) FILTER (WHERE anciennete BETWEEN 31 AND 60), 0) AS montant_31_60,
+                       COALESCE(SUM(reste_a_payer) FILTER (WHERE anciennete BETWEEN 61 AND 90), 0) AS montant_61_90,
+                       COALESCE(SUM(reste_a_payer) FILTER (WHERE anciennete > 90), 0) AS montant_plus_90,
+                       SUM(reste_a_payer) AS montant_total,
+                       MAX(anciennete) AS anciennete_max
+                  FROM creances
+              GROUP BY client_id, base_calcul
+            )
+        """ % self._table)
@@ -1,21 +1,78 @@
-from odoo import models, fields, api, _
+from odoo import models, fields, api, SUPERUSER_ID, _
 from odoo.exceptions import ValidationError, UserError
-import io
-import base64
-from datetime import datetime
+from odoo.modules.registry import Registry
+from odoo.tools.sql import create_index
+import logging
+from datetime import timedelta
+from functools import partial
+
+_logger = logging.getLogger(__name__)
+
+
+# Solde des opérations validées du registre %(registre)s précédant la position
+# (%(date)s, %(id)s) du journal : on part de la dernière clôture journalière
+# antérieure du registre et on ne somme que la suite.
+SQL_SOLDE_BASE = """
+    checkpoint AS (
+        SELECT date, solde
+          FROM agencevoyage_caisse_checkpoint
+         WHERE registre_id = %(registre)s
+           AND date < %(date)s
+         ORDER BY date DESC
+         LIMIT 1
+    ), base AS (
+        SELECT COALESCE((SELECT solde FROM checkpoint), 0)
+             + COALESCE(SUM(CASE WHEN type_operation = 'encaissement' THEN montant ELSE -montant END), 0) AS solde
+          FROM agencevoyage_caisse
+         WHERE registre_id = %(registre)s
+           AND statut = 'valide'
+           AND date_operation > COALESCE((SELECT date FROM checkpoint), '-infinity'::date)
+           AND (date_operation, id) < (%(date)s, %(id)s)
+    )
+"""
+
+# Clé des données de séquencement de la transaction courante (cr.postcommit.data)
+SEQUENCEMENT_CLE = 'agencevoyage.caisse.sequencement'
+
+
+def _sequencer_registres(dbname, positions):
+    """Séquence les registres donnés, chacun dans sa propre transaction.
+
+    Exécuté après la validation de la transaction qui a écrit les opérations
+    (ou par la tâche planifiée) : les transactions des caissiers n'écrivent
+    ainsi jamais de ligne partagée, même pour une opération antidatée, modifiée
+    ou supprimée, et ne peuvent pas entrer en conflit entre elles. Le
+    séquencement verrouille la ligne du registre ; il s'exécute en READ
+    COMMITTED pour voir les opérations validées par les autres caissiers
+    pendant l'attente du verrou.
+
+    :param positions: dictionnaire {registre_id: (date_operation, id) ou None}
+    """
+    registry = Registry(dbname)
+    for registre_id in sorted(positions):
+        try:
+            with registry.cursor() as cr:
+                cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                env['agencevoyage.caisse']._sequencer_registre(registre_id, positions[registre_id])
+        except Exception:
+            # La tâche planifiée reprendra les opérations restées à séquencer
+            _logger.exception("Échec du séquencement du registre de caisse %s", registre_id)
 
 
 class Caisse(models.Model):
     _name = 'agencevoyage.caisse'
     _description = 'Caisse'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'agencevoyage.export.mixin']
     _rec_name = 'name'
+    _export_nom_fichier = 'caisse'
     _order = 'date_operation desc, id desc'
 
     name = fields.Char(
         string='Numéro d\'opération',
         required=True,
-        default=lambda self: self.env['ir.sequence'].next_by_code('agencevoyage.caisse') or 'Nouveau',
+        default='Nouveau',
+        copy=False,
         tracking=True,
         readonly=True
     )
@@ -35,6 +92,16 @@ class Caisse(models.Model):
         default='encaissement',
         tracking=True
     )
+    registre_id = fields.Many2one(
+        'agencevoyage.caisse.registre',
+        string='Registre de caisse',
+        required=True,
+        index=True,
+        ondelete='restrict',
+        default=lambda self: self.env['agencevoyage.caisse.registre']._get_registre_utilisateur(),
+        tracking=True,
+        help='Guichet ou caisse sur lequel l\'opération est enregistrée'
+    )
     
     # Encaissement
     paiement_client_id = fields.Many2one(
@@ -105,7 +172,41 @@ class Caisse(models.Model):
         compute='_compute_solde_actuel',
         store=False,
         digits=(16, 2),
-        help='Solde total actuel de la caisse (toutes opérations validées)'
+        help='Solde actuel du registre de caisse (toutes opérations validées)'
+    )
+    solde_consolide = fields.Float(
+        string='Solde consolidé',
+        compute='_compute_solde_actuel',
+        store=False,
+        digits=(16, 2),
+        help='Somme des soldes actuels de tous les registres de caisse'
+    )
+    
+    periode_cloturee = fields.Boolean(
+        string='Période clôturée',
+        compute='_compute_periode_cloturee',
+        help='L\'opération appartient à une période de caisse clôturée et ne peut plus être modifiée'
+    )
+    
+    # Séquencement du journal (voir _sequencer_registre)
+    sequence_registre = fields.Integer(
+        string='N° d\'ordre',
+        readonly=True,
+        copy=False,
+        help='Numéro d\'ordre de l\'opération dans son registre, attribué après son enregistrement'
+    )
+    a_sequencer = fields.Boolean(
+        string='À séquencer',
+        default=True,
+        readonly=True,
+        copy=False
+    )
+    mouvement_comptabilise = fields.Float(
+        string='Mouvement comptabilisé',
+        readonly=True,
+        copy=False,
+        digits=(16, 2),
+        help='Mouvement de l\'opération inclus dans le solde enregistré du registre'
     )
     
     _sql_constraints = [
@@ -113,74 +214,310 @@ class Caisse(models.Model):
          'Le montant doit être strictement positif!'),
     ]
     
-    @api.depends('type_operation', 'montant', 'statut', 'date_operation')
+    @api.depends('registre_id', 'type_operation', 'montant', 'statut', 'date_operation')
     def _compute_solde(self):
+        soldes_avant = self._get_soldes_avant()
         for record in self:
-            if not record.date_operation:
+            if not record.date_operation or not record.registre_id:
                 record.solde_avant = 0.0
                 record.solde_apres = 0.0
                 continue
-                
-            # Calculer le solde avant cette opération
-            # Construire le domaine de recherche
-            domain = [
-                ('date_operation', '<=', record.date_operation),
-                ('statut', '=', 'valide')
-            ]
-            
-            # Exclure l'enregistrement actuel seulement s'il a un ID réel (pas un NewId)
-            if isinstance(record.id, int):
-                # Pour les opérations à la même date, exclure celles avec un ID supérieur ou égal
-                # Utiliser un domaine OR pour exclure: date < OU (date = ET id <)
-                domain = [
-                    ('statut', '=', 'valide'),
-                    '|',
-                    ('date_operation', '<', record.date_operation),
-                    '&',
-                    ('date_operation', '=', record.date_operation),
-                    ('id', '<', record.id)
-                ]
-            # Pour les nouveaux enregistrements, inclure toutes les opérations à la même date
-            # car elles seront triées par ID
-            
-            # Rechercher les opérations précédentes, triées par date puis ID
-            operations_precedentes = self.search(domain, order='date_operation asc, id asc')
             
-            solde_initial = 0.0
-            for op in operations_precedentes:
-                if op.type_operation == 'encaissement':
-                    solde_initial += op.montant
-                else:
-                    solde_initial -= op.montant
-            
-            record.solde_avant = solde_initial
+            if record.id in soldes_avant:
+                record.solde_avant = soldes_avant[record.id]
+            else:
+                # Nouvel enregistrement (NewId) : toutes les opérations à la même date le précèdent
+                record.solde_avant = self._get_solde_jusqua(record.registre_id.id, record.date_operation)
             
             # Calculer le solde après cette opération
-            if record.statut == 'valide':
-                if record.type_operation == 'encaissement':
-                    record.solde_apres = record.solde_avant + record.montant
-                else:
-                    record.solde_apres = record.solde_avant - record.montant
-            else:
-                record.solde_apres = record.solde_avant
+            record.solde_apres = record.solde_avant + record._get_mouvement()
+    
+    @api.depends('date_operation')
+    def _compute_periode_cloturee(self):
+        date_verrouillage = self.env['agencevoyage.caisse.cloture']._get_date_verrouillage()
+        for record in self:
+            record.periode_cloturee = bool(
+                date_verrouillage and record.date_operation and record.date_operation <= date_verrouillage
+            )
     
     @api.model
-    def _compute_solde_actuel(self):
-        """Calcule le solde actuel total de la caisse"""
-        operations_validees = self.search([
-            ('statut', '=', 'valide')
-        ], order='date_operation asc, id asc')
+    def _check_periode_ouverte(self, dates):
+        """Empêche toute modification du journal dans une période clôturée"""
+        date_verrouillage = self.env['agencevoyage.caisse.cloture']._get_date_verrouillage()
+        if date_verrouillage and any(d and d <= date_verrouillage for d in dates):
+            raise UserError(_(
+                'La caisse est clôturée jusqu\'au %s : les opérations de cette période '
+                'ne peuvent plus être créées, modifiées, annulées ou supprimées.'
+            ) % date_verrouillage)
+    
+    def _get_mouvement(self):
+        """Retourne l'impact signé de l'opération sur le solde (0 si non validée)"""
+        self.ensure_one()
+        if self.statut != 'valide':
+            return 0.0
+        return self.montant if self.type_operation == 'encaissement' else -self.montant
+    
+    def _get_position(self):
+        """Retourne la position (date_operation, id) de l'opération dans le journal de son registre"""
+        self.ensure_one()
+        return (self.date_operation, self.id)
+    
+    def _get_positions_par_registre(self, positions=None):
+        """Retourne la première position de self dans chaque registre.
         
-        solde_total = 0.0
-        for op in operations_validees:
-            if op.type_operation == 'encaissement':
-                solde_total += op.montant
-            else:
-                solde_total -= op.montant
+        :param positions: dictionnaire {registre_id: position} à compléter
+        :return: dictionnaire {registre_id: (date_operation, id)}
+        """
+        positions = dict(positions or {})
+        for record in self:
+            if not record.date_operation or not record.registre_id:
+                continue
+            position = record._get_position()
+            registre_id = record.registre_id.id
+            if registre_id not in positions or position < positions[registre_id]:
+                positions[registre_id] = position
+        return positions
+    
+    def _get_mouvements_comptabilises_par_registre(self):
+        """Retourne la somme des mouvements de self inclus dans le solde de chaque registre"""
+        mouvements = {}
+        for record in self:
+            registre_id = record.registre_id.id
+            mouvements[registre_id] = mouvements.get(registre_id, 0.0) + record.mouvement_comptabilise
+        return mouvements
+    
+    @api.model
+    def _get_solde_jusqua(self, registre_id, date_operation):
+        """Solde des opérations validées du registre jusqu'à la date donnée incluse"""
+        return self._get_solde_avant_position(registre_id, date_operation + timedelta(days=1))
+    
+    @api.model
+    def _get_solde_consolide_jusqua(self, date_operation):
+        """Solde de tous les registres jusqu'à la date donnée incluse"""
+        registres = self.env['agencevoyage.caisse.registre'].sudo().with_context(active_test=False).search([])
+        return sum(self._get_solde_jusqua(registre.id, date_operation) for registre in registres)
+    
+    @api.model
+    def _get_solde_avant_position(self, registre_id, date_operation, operation_id=0):
+        """Solde des opérations validées du registre précédant la position (date_operation, operation_id)"""
+        self.flush_model(['registre_id', 'date_operation', 'type_operation', 'montant', 'statut'])
+        self.env.cr.execute("""
+            WITH {base}
+            SELECT solde FROM base
+        """.format(base=SQL_SOLDE_BASE), {'registre': registre_id, 'date': date_operation, 'id': operation_id})
+        return self.env.cr.fetchone()[0]
+    
+    def _get_soldes_avant(self):
+        """Calcule les soldes avant de toutes les opérations de self, une requête par registre.
+        
+        Le solde de départ est la somme des opérations validées du registre qui
+        précèdent la première opération du lot, à partir de la dernière clôture
+        journalière ; les opérations du lot sont ensuite cumulées par une somme
+        glissante ordonnée par (date_operation, id).
+        
+        :return: dictionnaire {id: solde_avant}
+        """
+        operations = self.filtered(lambda r: isinstance(r.id, int) and r.date_operation and r.registre_id)
+        if not operations:
+            return {}
+        self.flush_model(['registre_id', 'date_operation', 'type_operation', 'montant', 'statut'])
+        soldes_avant = {}
+        for registre in operations.registre_id:
+            operations_registre = operations.filtered(lambda r: r.registre_id == registre)
+            positions = [op._get_position() for op in operations_registre]
+            debut, fin = min(positions), max(positions)
+            self.env.cr.execute("""
+                WITH {base}, cumul AS (
+                    SELECT c.id,
+                           base.solde + SUM(
+                               CASE WHEN c.statut != 'valide' THEN 0
+                                    WHEN c.type_operation = 'encaissement' THEN c.montant
+                                    ELSE -c.montant END
+                           ) OVER (ORDER BY c.date_operation, c.id ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS solde_precedent,
+                           base.solde AS solde_base
+                      FROM agencevoyage_caisse c, base
+                     WHERE c.registre_id = %(registre)s
+                       AND (c.date_operation, c.id) >= (%(date)s, %(id)s)
+                       AND (c.date_operation, c.id) <= (%(date_fin)s, %(id_fin)s)
+                )
+                SELECT id, COALESCE(solde_precedent, solde_base)
+                  FROM cumul
+                 WHERE id IN %(ids)s
+            """.format(base=SQL_SOLDE_BASE), {
+                'registre': registre.id,
+                'date': debut[0],
+                'id': debut[1],
+                'date_fin': fin[0],
+                'id_fin': fin[1],
+                'ids': tuple(operations_registre.ids),
+            })
+            soldes_avant.update(self.env.cr.fetchall())
+        return soldes_avant
+    
+    @api.model
+    def _recalculer_soldes_depuis(self, registre_id, date_operation, operation_id=0):
+        """Recalcule en une passe les soldes d'un registre à partir d'une position.
         
-        # Assigner à tous les enregistrements dans self
+        Seul le suffixe du journal du registre à partir de (date_operation,
+        operation_id) est réécrit ; les lignes dont les soldes sont déjà corrects ne
+        sont pas modifiées. Appelé par le séquencement, sous le verrou du registre.
+        """
+        if not date_operation or not registre_id:
+            return
+        # Le journal d'une période clôturée est figé : on ne remonte jamais avant la clôture
+        date_verrouillage = self.env['agencevoyage.caisse.cloture']._get_date_verrouillage()
+        if date_verrouillage and date_operation <= date_verrouillage:
+            date_operation, operation_id = date_verrouillage + timedelta(days=1), 0
+        self.env['agencevoyage.caisse.checkpoint']._invalider_depuis(registre_id, date_operation)
+        self.flush_model()
+        self.env.cr.execute("""
+            WITH {base}, cumul AS (
+                SELECT c.id,
+                       base.solde + SUM(
+                           CASE WHEN c.statut != 'valide' THEN 0
+                                WHEN c.type_operation = 'encaissement' THEN c.montant
+                                ELSE -c.montant END
+                       ) OVER (ORDER BY c.date_operation, c.id) AS solde_apres,
+                       CASE WHEN c.statut != 'valide' THEN 0
+                            WHEN c.type_operation = 'encaissement' THEN c.montant
+                            ELSE -c.montant END AS mouvement
+                  FROM agencevoyage_caisse c, base
+                 WHERE c.registre_id = %(registre)s
+                   AND (c.date_operation, c.id) >= (%(date)s, %(id)s)
+            )
+            UPDATE agencevoyage_caisse c
+               SET solde_avant = cumul.solde_apres - cumul.mouvement,
+                   solde_apres = cumul.solde_apres
+              FROM cumul
+             WHERE c.id = cumul.id
+               AND (c.solde_avant IS DISTINCT FROM cumul.solde_apres - cumul.mouvement
+                    OR c.solde_apres IS DISTINCT FROM cumul.solde_apres)
+        """.format(base=SQL_SOLDE_BASE), {'registre': registre_id, 'date': date_operation, 'id': operation_id})
+        self.invalidate_model(['solde_avant', 'solde_apres'])
+    
+    @api.model
+    def _get_sequencement_planifie(self):
+        """Retourne le séquencement planifié par la transaction courante"""
+        return self.env.cr.postcommit.data.get(SEQUENCEMENT_CLE) or {'positions': {}, 'suppressions': {}}
+    
+    @api.model
+    def _planifier_sequencement(self, positions, suppressions=None):
+        """Programme le séquencement des registres modifiés après la validation de la transaction
+        
+        :param positions: dictionnaire {registre_id: (date_operation, id)}
+        :param suppressions: dictionnaire {registre_id: mouvement} à retrancher du
+            solde enregistré tant que le séquencement n'a pas eu lieu
+        """
+        donnees = self.env.cr.postcommit.data
+        if SEQUENCEMENT_CLE not in donnees:
+            donnees[SEQUENCEMENT_CLE] = {'positions': {}, 'suppressions': {}}
+            self.env.cr.postcommit.add(partial(
+                _sequencer_registres, self.env.cr.dbname, donnees[SEQUENCEMENT_CLE]['positions']))
+        planifie = donnees[SEQUENCEMENT_CLE]
+        for registre_id, position in positions.items():
+            if registre_id not in planifie['positions'] or position < planifie['positions'][registre_id]:
+                planifie['positions'][registre_id] = position
+        for registre_id, mouvement in (suppressions or {}).items():
+            planifie['suppressions'][registre_id] = planifie['suppressions'].get(registre_id, 0.0) + mouvement
+        # Soldes non stockés déjà lus dans la transaction : relus au prochain accès
+        self.invalidate_model(['solde_actuel', 'solde_consolide'])
+    
+    @api.model
+    def _sequencer_registre(self, registre_id, position=None):
+        """Intègre au registre les opérations en attente de séquencement.
+        
+        Sous le verrou du registre : attribue les numéros d'ordre, reporte le
+        mouvement des opérations dans le solde enregistré du registre, recalcule
+        les soldes du journal depuis la première position modifiée (opérations
+        à séquencer et positions libérées, voir agencevoyage.caisse.recalcul) et
+        écrit les clôtures journalières des journées terminées.
+        
+        Le solde enregistré et le marquage des opérations sont écrits par une
+        seule requête, donc sur un même instantané du journal : le solde reste
+        égal à la somme des mouvements comptabilisés.
+        """
+        cr = self.env.cr
+        self.flush_model()
+        cr.execute("""
+            SELECT derniere_sequence
+              FROM agencevoyage_caisse_registre
+             WHERE id = %s
+               FOR NO KEY UPDATE
+        """, (registre_id,))
+        ligne = cr.fetchone()
+        if not ligne:
+            return
+        recalcul = self.env['agencevoyage.caisse.recalcul']._consommer(registre_id)
+        cr.execute("""
+            WITH {base}, a_marquer AS (
+                SELECT id,
+                       CASE WHEN sequence_registre IS NULL
+                            THEN ROW_NUMBER() OVER (PARTITION BY sequence_registre IS NULL ORDER BY id)
+                       END AS rang
+                  FROM agencevoyage_caisse
+                 WHERE registre_id = %(registre)s
+                   AND a_sequencer
+            ), marquees AS (
+                UPDATE agencevoyage_caisse c
+                   SET a_sequencer = FALSE,
+                       mouvement_comptabilise = CASE WHEN c.statut != 'valide' THEN 0
+                                                     WHEN c.type_operation = 'encaissement' THEN c.montant
+                                                     ELSE -c.montant END,
+                       sequence_registre = COALESCE(c.sequence_registre, %(derniere)s + a_marquer.rang)
+                  FROM a_marquer
+                 WHERE c.id = a_marquer.id
+                   AND c.a_sequencer
+             RETURNING c.date_operation, c.id
+            ), registre AS (
+                UPDATE agencevoyage_caisse_registre
+                   SET solde = (SELECT solde FROM base),
+                       derniere_sequence = %(derniere)s + (SELECT COUNT(rang) FROM a_marquer)
+                 WHERE id = %(registre)s
+            )
+            SELECT date_operation, id FROM marquees ORDER BY date_operation, id LIMIT 1
+        """.format(base=SQL_SOLDE_BASE), {
+            'registre': registre_id,
+            'date': 'infinity',
+            'id': 0,
+            'derniere': ligne[0] or 0,
+        })
+        premiere = cr.fetchone()
+        positions = [p for p in (position, premiere and tuple(premiere), recalcul) if p]
+        if positions:
+            self._recalculer_soldes_depuis(registre_id, *min(positions))
+        self.env['agencevoyage.caisse.checkpoint']._creer_checkpoints(registre_ids=[registre_id])
+        # Séquencement dans la transaction courante : ses suppressions sont dans le solde enregistré
+        self._get_sequencement_planifie()['suppressions'].pop(registre_id, None)
+        self.invalidate_model(['a_sequencer', 'mouvement_comptabilise', 'sequence_registre',
+                               'solde_actuel', 'solde_consolide'])
+        self.env['agencevoyage.caisse.registre'].invalidate_model(['solde', 'derniere_sequence'])
+    
+    @api.model
+    def _get_registres_a_sequencer(self):
+        """Registres ayant des opérations à séquencer ou des positions à recalculer"""
+        self.flush_model(['a_sequencer'])
+        self.env['agencevoyage.caisse.recalcul'].flush_model()
+        self.env.cr.execute("""
+            SELECT registre_id FROM agencevoyage_caisse WHERE a_sequencer
+             UNION
+            SELECT registre_id FROM agencevoyage_caisse_recalcul
+        """)
+        return [registre_id for registre_id, in self.env.cr.fetchall()]
+    
+    @api.model
+    def _cron_sequencer(self):
+        """Tâche planifiée : séquence les opérations dont le séquencement n'a pas abouti"""
+        registre_ids = self._get_registres_a_sequencer()
+        if registre_ids:
+            _sequencer_registres(self.env.cr.dbname, dict.fromkeys(registre_ids))
+    
+    @api.depends('registre_id')
+    def _compute_solde_actuel(self):
+        """Lit les soldes maintenus sur les registres de caisse"""
+        solde_consolide = self.env['agencevoyage.caisse.registre']._get_solde_consolide()
         for record in self:
-            record.solde_actuel = solde_total
+            record.solde_actuel = record.registre_id.sudo()._get_solde() if record.registre_id else 0.0
+            record.solde_consolide = solde_consolide
     
     @api.onchange('paiement_client_id')
     def _onchange_paiement_client_id(self):
@@ -247,142 +584,112 @@ class Caisse(models.Model):
     
     @api.constrains('paiement_client_id', 'paiement_fournisseur_id')
     def _check_paiement_unique(self):
-        """Vérifie qu'un paiement n'est utilisé qu'une seule fois"""
-        for record in self:
-            if record.paiement_client_id:
-                domain = [('paiement_client_id', '=', record.paiement_client_id.id)]
-                if isinstance(record.id, int):
-                    domain.append(('id', '!=', record.id))
-                existing = self.search(domain)
-                if existing:
-                    raise ValidationError(_(
-                        'Le paiement client %s est déjà utilisé dans l\'opération %s.'
-                    ) % (record.paiement_client_id.name, existing[0].name))
-            
-            if record.paiement_fournisseur_id:
-                domain = [('paiement_fournisseur_id', '=', record.paiement_fournisseur_id.id)]
-                if isinstance(record.id, int):
-                    domain.append(('id', '!=', record.id))
-                existing = self.search(domain)
-                if existing:
-                    raise ValidationError(_(
-                        'Le paiement fournisseur %s est déjà utilisé dans l\'opération %s.'
-                    ) % (record.paiement_fournisseur_id.name, existing[0].name))
+        """Vérifie qu'un paiement n'est utilisé qu'une seule fois (un regroupement par type de paiement)"""
+        messages = {
+            'paiement_client_id': _('Le paiement client %s est déjà utilisé dans l\'opération %s.'),
+            'paiement_fournisseur_id': _('Le paiement fournisseur %s est déjà utilisé dans l\'opération %s.'),
+        }
+        for champ, message in messages.items():
+            paiements = self[champ]
+            if not paiements:
+                continue
+            for paiement, operation_ids in self._read_group(
+                    [(champ, 'in', paiements.ids)], [champ], ['id:array_agg']):
+                if len(operation_ids) > 1:
+                    operations = self.browse(sorted(operation_ids))
+                    existing = (operations - self) or operations[1:]
+                    raise ValidationError(message % (paiement.name, existing[0].name))
     
     def action_annuler(self):
-        """Action pour annuler une opération de caisse"""
-        for record in self:
-            if record.statut == 'annule':
-                raise UserError(_('Cette opération est déjà annulée.'))
-            if record.statut == 'valide':
-                record.statut = 'annule'
-                record.message_post(body=_('Opération annulée par %s') % self.env.user.name)
-                return {
-                    'type': 'ir.actions.client',
-                    'tag': 'display_notification',
-                    'params': {
-                        'title': _('Opération annulée'),
-                        'message': _('L\'opération %s a été annulée avec succès.') % record.name,
-                        'type': 'success',
-                        'sticky': False,
-                    }
-                }
-        return True
-    
-    @api.model
-    def create(self, vals):
-        """Génère automatiquement le numéro d'opération"""
-        if vals.get('name', 'Nouveau') == 'Nouveau':
-            vals['name'] = self.env['ir.sequence'].next_by_code('agencevoyage.caisse') or 'Nouveau'
-        return super(Caisse, self).create(vals)
-    
-    def action_export_excel(self):
-        """Exporte les opérations de caisse en Excel"""
-        try:
-            import xlsxwriter
-        except ImportError:
-            raise UserError(_('Le module xlsxwriter n\'est pas installé. Veuillez l\'installer avec: pip install xlsxwriter'))
-        
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-        worksheet = workbook.add_worksheet('Caisse')
-        
-        # En-têtes
-        headers = ['Numéro', 'Date', 'Type', 'Montant', 'Mode Paiement', 'Solde Avant', 'Solde Après', 'Statut']
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header)
-        
-        # Données
-        for row, record in enumerate(self, start=1):
-            worksheet.write(row, 0, record.name or '')
-            worksheet.write(row, 1, record.date_operation.strftime('%d/%m/%Y') if record.date_operation else '')
-            worksheet.write(row, 2, dict(record._fields['type_operation'].selection).get(record.type_operation, ''))
-            worksheet.write(row, 3, record.montant)
-            worksheet.write(row, 4, dict(record._fields['mode_paiement'].selection).get(record.mode_paiement, ''))
-            worksheet.write(row, 5, record.solde_avant)
-            worksheet.write(row, 6, record.solde_apres)
-            worksheet.write(row, 7, dict(record._fields['statut'].selection).get(record.statut, ''))
-        
-        workbook.close()
-        output.seek(0)
-        
-        # Créer l'attachement
-        filename = f'caisse_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'type': 'binary',
-            'datas': base64.b64encode(output.read()),
-            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        })
-        
+        """Action pour annuler une ou plusieurs opérations de caisse"""
+        if self.filtered(lambda r: r.statut == 'annule'):
+            raise UserError(_('Cette opération est déjà annulée.'))
+        self._check_periode_ouverte(self.mapped('date_operation'))
+        operations = self.filtered(lambda r: r.statut == 'valide')
+        if not operations:
+            return True
+        operations.statut = 'annule'
+        for record in operations:
+            record.message_post(body=_('Opération annulée par %s') % self.env.user.name)
         return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Opération annulée'),
+                'message': _('L\'opération %s a été annulée avec succès.') % ', '.join(operations.mapped('name')),
+                'type': 'success',
+                'sticky': False,
+            }
         }
     
-    def action_export_csv(self):
-        """Exporte les opérations de caisse en CSV"""
-        import csv
-        
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';')
-        
-        # En-têtes
-        writer.writerow(['Numéro', 'Date', 'Type', 'Montant', 'Mode Paiement', 'Solde Avant', 'Solde Après', 'Statut'])
-        
-        # Données
-        for record in self:
-            writer.writerow([
-                record.name or '',
-                record.date_operation.strftime('%d/%m/%Y') if record.date_operation else '',
-                dict(record._fields['type_operation'].selection).get(record.type_operation, ''),
-                record.montant,
-                dict(record._fields['mode_paiement'].selection).get(record.mode_paiement, ''),
-                record.solde_avant,
-                record.solde_apres,
-                dict(record._fields['statut'].selection).get(record.statut, ''),
-            ])
-        
-        output.seek(0)
-        
-        # Créer l'attachement
-        filename = f'caisse_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'type': 'binary',
-            'datas': base64.b64encode(output.getvalue().encode('utf-8-sig')),
-            'mimetype': 'text/csv',
-        })
-        
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Génère automatiquement les numéros d'opération, en un seul appel à la séquence"""
+        self._check_periode_ouverte([
+            fields.Date.to_date(vals.get('date_operation')) or fields.Date.today() for vals in vals_list
+        ])
+        sans_numero = [vals for vals in vals_list if vals.get('name', 'Nouveau') == 'Nouveau']
+        numeros = self.env['ir.sequence']._next_by_code_lot('agencevoyage.caisse', len(sans_numero))
+        for vals, numero in zip(sans_numero, numeros):
+            vals['name'] = numero or 'Nouveau'
+        operations = super(Caisse, self).create(vals_list)
+        # Le solde du registre et les soldes des opérations suivantes (opération antidatée)
+        # sont mis à jour après la validation de la transaction
+        positions = operations._get_positions_par_registre()
+        self._planifier_sequencement(positions)
+        return operations
+    
+    @api.model
+    def _get_colonnes_export(self):
+        """Colonnes de l'export Excel / CSV du journal de caisse"""
+        return [
+            (_('Numéro'), 'name'),
+            (_('Date'), 'date_operation'),
+            (_('Registre'), 'registre_id.name'),
+            (_('Type'), 'type_operation'),
+            (_('Montant'), 'montant'),
+            (_('Mode Paiement'), 'mode_paiement'),
+            (_('Solde Avant'), 'solde_avant'),
+            (_('Solde Après'), 'solde_apres'),
+            (_('Statut'), 'statut'),
+        ]
     
     def write(self, vals):
-        """Le recalcul des soldes est géré automatiquement par les dépendances @api.depends"""
-        return super(Caisse, self).write(vals)
+        """Planifie le recalcul des soldes du journal à partir de la première position modifiée"""
+        if set(vals) - {'message_main_attachment_id'}:
+            dates = self.mapped('date_operation')
+            if vals.get('date_operation'):
+                dates.append(fields.Date.to_date(vals['date_operation']))
+            self._check_periode_ouverte(dates)
+        champs_solde = {'registre_id', 'date_operation', 'type_operation', 'montant', 'statut'}
+        if not champs_solde.intersection(vals):
+            return super(Caisse, self).write(vals)
+        anciennes_positions = self._get_positions_par_registre()
+        result = super(Caisse, self).write(dict(vals, a_sequencer=True))
+        # L'ancienne position (autre date, autre registre) n'est plus portée par l'opération
+        self.env['agencevoyage.caisse.recalcul']._enregistrer(anciennes_positions)
+        positions = self._get_positions_par_registre(anciennes_positions)
+        self._planifier_sequencement(positions)
+        return result
+    
+    def unlink(self):
+        """Planifie le recalcul des soldes des opérations qui suivaient les opérations supprimées"""
+        self._check_periode_ouverte(self.mapped('date_operation'))
+        positions = self._get_positions_par_registre()
+        suppressions = {
+            registre_id: -mouvement
+            for registre_id, mouvement in self._get_mouvements_comptabilises_par_registre().items()
+        }
+        result = super(Caisse, self).unlink()
+        self.env['agencevoyage.caisse.recalcul']._enregistrer(positions)
+        self._planifier_sequencement(positions, suppressions)
+        return result
+    
+    def init(self):
+        """Index utilisé par le calcul des soldes cumulés (ordre du journal de chaque registre)"""
+        create_index(self.env.cr, 'agencevoyage_caisse_registre_date_operation_id_index',
+                     self._table, ['registre_id', 'date_operation', 'id'])
+        create_index(self.env.cr, 'agencevoyage_caisse_a_sequencer_index',
+                     self._table, ['registre_id'], where='a_sequencer')
 
 
@@ -0,0 +1,106 @@
+from odoo import models, fields, api
+from datetime import date, timedelta
+
+
+class CaisseCheckpoint(models.Model):
+    _name = 'agencevoyage.caisse.checkpoint'
+    _description = 'Clôture journalière de caisse'
+    _rec_name = 'date'
+    _order = 'date desc, registre_id'
+
+    registre_id = fields.Many2one(
+        'agencevoyage.caisse.registre',
+        string='Registre de caisse',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    date = fields.Date(
+        string='Date',
+        required=True,
+        readonly=True,
+        help='Journée clôturée'
+    )
+    solde = fields.Float(
+        string='Solde de clôture',
+        required=True,
+        readonly=True,
+        digits=(16, 2),
+        help='Solde du registre à la fin de la journée (opérations validées)'
+    )
+    nombre_operations = fields.Integer(
+        string='Opérations validées',
+        readonly=True,
+        help='Nombre d\'opérations validées de la journée'
+    )
+
+    _sql_constraints = [
+        ('date_unique', 'UNIQUE(registre_id, date)',
+         'Une seule clôture journalière est autorisée par registre et par date!'),
+    ]
+
+    @api.model
+    def _creer_checkpoints(self, jusqua=None, registre_ids=None):
+        """Écrit les soldes de clôture des journées terminées qui n'en ont pas encore.
+
+        Pour chaque registre, seules les journées postérieures à sa dernière clôture
+        existante sont agrégées, en une requête groupée par registre et par date.
+
+        :param registre_ids: registres à clôturer (tous par défaut) ; le séquencement
+            d'un registre n'écrit que les clôtures du registre qu'il a verrouillé
+        """
+        jusqua = jusqua or fields.Date.today() - timedelta(days=1)
+        self.env['agencevoyage.caisse'].flush_model(['registre_id', 'date_operation', 'type_operation', 'montant', 'statut'])
+        self.flush_model()
+        self.env.cr.execute("""
+            WITH dernier AS (
+                SELECT DISTINCT ON (registre_id) registre_id, date, solde
+                  FROM agencevoyage_caisse_checkpoint
+                 WHERE date <= %(jusqua)s
+                   AND (%(registres)s::integer[] IS NULL OR registre_id = ANY(%(registres)s::integer[]))
+                 ORDER BY registre_id, date DESC
+            )
+            SELECT c.registre_id,
+                   c.date_operation,
+                   SUM(CASE WHEN c.type_operation = 'encaissement' THEN c.montant ELSE -c.montant END),
+                   COUNT(*),
+                   COALESCE(MAX(d.solde), 0)
+              FROM agencevoyage_caisse c
+              LEFT JOIN dernier d ON d.registre_id = c.registre_id
+             WHERE c.statut = 'valide'
+               AND c.date_operation > COALESCE(d.date, '-infinity'::date)
+               AND c.date_operation <= %(jusqua)s
+               AND (%(registres)s::integer[] IS NULL OR c.registre_id = ANY(%(registres)s::integer[]))
+             GROUP BY c.registre_id, c.date_operation
+             ORDER BY c.registre_id, c.date_operation
+        """, {'jusqua': jusqua, 'registres': list(registre_ids) if registre_ids else None})
+        journees = self.env.cr.fetchall()
+        if not journees:
+            return
+        soldes = {}
+        valeurs = []
+        for registre_id, jour, mouvement, nombre, solde_depart in journees:
+            solde = soldes.get(registre_id, solde_depart) + mouvement
+            soldes[registre_id] = solde
+            valeurs.append((registre_id, jour, solde, nombre, self.env.uid, self.env.uid))
+        # Deux premières opérations simultanées d'une journée peuvent écrire la même clôture
+        self.env.cr.execute("""
+            INSERT INTO agencevoyage_caisse_checkpoint
+                   (registre_id, date, solde, nombre_operations, create_uid, write_uid, create_date, write_date)
+            SELECT v.registre_id, v.date, v.solde, v.nombre, v.create_uid, v.write_uid,
+                   NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC'
+              FROM (VALUES %s) AS v(registre_id, date, solde, nombre, create_uid, write_uid)
+            ON CONFLICT (registre_id, date) DO NOTHING
+        """ % ', '.join(['(%s::integer, %s::date, %s::numeric, %s::integer, %s::integer, %s::integer)'] * len(valeurs)),
+            [param for ligne in valeurs for param in ligne])
+        self.invalidate_model()
+
+    @api.model
+    def _invalider_depuis(self, registre_id, date_operation):
+        """Supprime les clôtures d'un registre à partir de la date d'une opération modifiée"""
+        self.sudo().search([('registre_id', '=', registre_id), ('date', '>=', date_operation)]).unlink()
+
+    @api.model
+    def _cron_creer_checkpoints(self):
+        """Tâche planifiée : clôture les journées terminées"""
+        self._creer_checkpoints()
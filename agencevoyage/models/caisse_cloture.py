@@ -0,0 +1,97 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError, UserError
+from datetime import timedelta
+
+
+class CaisseCloture(models.Model):
+    _name = 'agencevoyage.caisse.cloture'
+    _description = 'Clôture de période de caisse'
+    _inherit = ['mail.thread']
+    _rec_name = 'date_cloture'
+    _order = 'date_cloture desc'
+
+    date_cloture = fields.Date(
+        string='Clôturé jusqu\'au',
+        required=True,
+        default=fields.Date.today,
+        tracking=True,
+        help='Les opérations de caisse datées de ce jour ou avant ne peuvent plus être modifiées'
+    )
+    type_cloture = fields.Selection(
+        [
+            ('journaliere', 'Journalière'),
+            ('mensuelle', 'Mensuelle'),
+        ],
+        string='Type de clôture',
+        required=True,
+        default='mensuelle'
+    )
+    solde = fields.Float(
+        string='Solde à la clôture',
+        readonly=True,
+        digits=(16, 2),
+        help='Solde consolidé de tous les registres à la date de clôture'
+    )
+    user_id = fields.Many2one(
+        'res.users',
+        string='Clôturé par',
+        default=lambda self: self.env.user,
+        readonly=True
+    )
+
+    _sql_constraints = [
+        ('date_cloture_unique', 'UNIQUE(date_cloture)',
+         'Cette période est déjà clôturée!'),
+    ]
+
+    @api.model
+    def _get_date_verrouillage(self):
+        """Retourne la date de la dernière clôture (False si aucune)"""
+        return self.sudo().search([], order='date_cloture desc', limit=1).date_cloture
+
+    @api.onchange('type_cloture')
+    def _onchange_type_cloture(self):
+        """Propose le dernier jour du mois précédent pour une clôture mensuelle"""
+        if self.type_cloture == 'mensuelle':
+            self.date_cloture = fields.Date.today().replace(day=1) - timedelta(days=1)
+        else:
+            self.date_cloture = fields.Date.today()
+
+    @api.constrains('date_cloture')
+    def _check_date_cloture(self):
+        """Vérifie que les clôtures sont successives et ne portent pas sur le futur"""
+        for record in self:
+            if record.date_cloture > fields.Date.today():
+                raise ValidationError(_('Une période future ne peut pas être clôturée.'))
+            if self.search_count([('date_cloture', '>', record.date_cloture)]):
+                raise ValidationError(_('Une clôture plus récente existe déjà.'))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Fige le solde à la date de clôture et écrit la clôture journalière correspondante"""
+        Caisse = self.env['agencevoyage.caisse']
+        # Les soldes du journal et les clôtures journalières doivent inclure les
+        # modifications validées qui n'ont pas encore été séquencées
+        for registre_id in Caisse._get_registres_a_sequencer():
+            Caisse._sequencer_registre(registre_id)
+        for vals in vals_list:
+            date_cloture = fields.Date.to_date(vals.get('date_cloture')) or fields.Date.today()
+            if Caisse.search_count([('date_operation', '<=', date_cloture), ('statut', '=', 'en_attente')]):
+                raise UserError(_('Des opérations en attente existent avant le %s. Validez-les ou annulez-les avant la clôture.') % date_cloture)
+            # Le calcul des soldes repartira de cette clôture journalière
+            self.env['agencevoyage.caisse.checkpoint']._creer_checkpoints(date_cloture)
+            vals['solde'] = Caisse._get_solde_consolide_jusqua(date_cloture)
+        return super(CaisseCloture, self).create(vals_list)
+
+    def write(self, vals):
+        """Une clôture ne peut pas être modifiée"""
+        if set(vals) - {'message_main_attachment_id'}:
+            raise UserError(_('Une clôture de caisse ne peut pas être modifiée.'))
+        return super(CaisseCloture, self).write(vals)
+
+    def unlink(self):
+        """Seule la dernière clôture peut être supprimée (réouverture de la période)"""
+        derniere = self.search([], order='date_cloture desc', limit=1)
+        if self - derniere:
+            raise UserError(_('Seule la dernière clôture peut être supprimée.'))
+        return super(CaisseCloture, self).unlink()
@@ -0,0 +1,59 @@
+from odoo import models, fields, api
+
+
+class CaisseRecalcul(models.Model):
+    _name = 'agencevoyage.caisse.recalcul'
+    _description = 'Recalcul du journal de caisse en attente'
+    _order = 'registre_id, date_operation, operation_id'
+
+    registre_id = fields.Many2one(
+        'agencevoyage.caisse.registre',
+        string='Registre de caisse',
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete='cascade'
+    )
+    date_operation = fields.Date(
+        string='Date d\'opération',
+        required=True,
+        readonly=True
+    )
+    operation_id = fields.Integer(
+        string='Opération',
+        readonly=True,
+        help='Identifiant de l\'opération modifiée ou supprimée (position dans le journal)'
+    )
+
+    @api.model
+    def _enregistrer(self, positions):
+        """Garde les positions du journal libérées par une modification ou une suppression.
+
+        Une opération modifiée ou supprimée ne laisse pas forcément d'opération
+        à séquencer à son ancienne position : la position est conservée ici,
+        par une simple insertion, jusqu'au séquencement du registre.
+
+        :param positions: dictionnaire {registre_id: (date_operation, id)}
+        """
+        if positions:
+            self.sudo().create([{
+                'registre_id': registre_id,
+                'date_operation': date_operation,
+                'operation_id': operation_id,
+            } for registre_id, (date_operation, operation_id) in positions.items()])
+
+    @api.model
+    def _consommer(self, registre_id):
+        """Supprime les positions en attente d'un registre et retourne la première
+
+        :return: (date_operation, id) ou None
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            DELETE FROM agencevoyage_caisse_recalcul
+             WHERE registre_id = %s
+         RETURNING date_operation, operation_id
+        """, (registre_id,))
+        positions = [(date_operation, operation_id or 0) for date_operation, operation_id in self.env.cr.fetchall()]
+        self.invalidate_model()
+        return min(positions) if positions else None
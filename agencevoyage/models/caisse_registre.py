@@ -0,0 +1,128 @@
+from odoo import models, fields, api, _
+from datetime import date
+
+
+class CaisseRegistre(models.Model):
+    _name = 'agencevoyage.caisse.registre'
+    _description = 'Registre de caisse'
+    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _rec_name = 'name'
+    _order = 'sequence, name'
+
+    name = fields.Char(
+        string='Nom',
+        required=True,
+        tracking=True,
+        help='Nom du guichet ou de la caisse'
+    )
+    code = fields.Char(
+        string='Code',
+        tracking=True
+    )
+    sequence = fields.Integer(
+        string='Séquence',
+        default=10
+    )
+    active = fields.Boolean(
+        string='Actif',
+        default=True,
+        tracking=True
+    )
+    user_ids = fields.Many2many(
+        'res.users',
+        'agencevoyage_caisse_registre_users_rel',
+        'registre_id',
+        'user_id',
+        string='Caissiers',
+        help='Utilisateurs dont les opérations sont enregistrées par défaut sur ce registre'
+    )
+    operation_ids = fields.One2many(
+        'agencevoyage.caisse',
+        'registre_id',
+        string='Opérations'
+    )
+    solde = fields.Float(
+        string='Solde actuel',
+        readonly=True,
+        digits=(16, 2),
+        help='Solde des opérations validées du registre au dernier séquencement du journal'
+    )
+    derniere_sequence = fields.Integer(
+        string='Dernier numéro d\'ordre',
+        readonly=True,
+        help='Dernier numéro d\'ordre attribué aux opérations du registre'
+    )
+
+    _sql_constraints = [
+        ('code_unique', 'UNIQUE(code)',
+         'Le code du registre doit être unique!'),
+    ]
+
+    @api.model
+    def _get_registre_utilisateur(self):
+        """Retourne le registre de l'utilisateur courant, à défaut le registre principal"""
+        registre = self.search([('user_ids', 'in', self.env.uid)], limit=1)
+        if not registre:
+            registre = self.env.ref('agencevoyage.registre_principal', raise_if_not_found=False)
+        if not registre:
+            registre = self.search([], limit=1)
+        return registre
+
+    def _get_solde(self):
+        """Retourne le solde actuel du registre.
+
+        Le solde enregistré n'est écrit que par le séquencement du journal ; on y
+        ajoute l'écart des opérations pas encore séquencées (dont celles de la
+        transaction courante) et des suppressions de la transaction courante.
+        """
+        self.ensure_one()
+        Caisse = self.env['agencevoyage.caisse']
+        Caisse.flush_model(['registre_id', 'type_operation', 'montant', 'statut', 'a_sequencer', 'mouvement_comptabilise'])
+        self.env.cr.execute("""
+            SELECT COALESCE(SUM(CASE WHEN statut != 'valide' THEN 0
+                                     WHEN type_operation = 'encaissement' THEN montant
+                                     ELSE -montant END - mouvement_comptabilise), 0)
+              FROM agencevoyage_caisse
+             WHERE registre_id = %s
+               AND a_sequencer
+        """, (self.id,))
+        ecart = self.env.cr.fetchone()[0]
+        suppressions = Caisse._get_sequencement_planifie()['suppressions'].get(self.id, 0.0)
+        return self.solde + ecart + suppressions
+
+    @api.model
+    def _get_solde_consolide(self):
+        """Solde consolidé : somme des soldes de tous les registres, archivés compris"""
+        registres = self.sudo().with_context(active_test=False).search([])
+        return sum(registre._get_solde() for registre in registres)
+
+    @api.model
+    def _rattacher_operations_orphelines(self):
+        """Rattache au registre principal les opérations antérieures aux registres"""
+        registre = self.env.ref('agencevoyage.registre_principal', raise_if_not_found=False)
+        if not registre:
+            return
+        self.env.cr.execute("""
+            UPDATE agencevoyage_caisse
+               SET registre_id = %s, a_sequencer = TRUE
+             WHERE registre_id IS NULL
+        """, (registre.id,))
+        # Les clôtures journalières sans registre ne sont plus exploitables
+        self.env.cr.execute("DELETE FROM agencevoyage_caisse_checkpoint WHERE registre_id IS NULL")
+        self.env['agencevoyage.caisse'].invalidate_model(['registre_id', 'a_sequencer'])
+
+    def action_recalculer_solde(self):
+        """Recalcule les soldes du journal et le solde des registres depuis le début"""
+        Caisse = self.env['agencevoyage.caisse']
+        for record in self:
+            Caisse._sequencer_registre(record.id, (date.min, 0))
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Solde recalculé'),
+                'message': _('Le solde des registres a été recalculé depuis le journal.'),
+                'type': 'success',
+                'sticky': False,
+            }
+        }
@@ -1,5 +1,54 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.osv import expression
+from odoo.tools import SQL
+import re
+import unicodedata
+
+# Identifiants comparés à la saisie pour retrouver un client au guichet
+CHAMPS_RECHERCHE = ('nom_complet', 'telephone', 'numero_cin', 'numero_passport')
+
+# Coordonnées d'un doublon reprises par le client conservé lors d'une fusion, s'il ne les a pas
+CHAMPS_REPRIS_FUSION = ('email', 'numero_cin', 'numero_passport', 'numero_bancaire', 'photo')
+
+# Codes Soundex des consonnes (les voyelles, h, w et y ne sont pas codés)
+CODES_SOUNDEX = dict(
+    [(lettre, '1') for lettre in 'bfpv'] + [(lettre, '2') for lettre in 'cgjkqsxz']
+    + [(lettre, '3') for lettre in 'dt'] + [('l', '4')] + [(lettre, '5') for lettre in 'mn'] + [('r', '6')]
+)
+
+
+def _soundex(mot):
+    """Code Soundex d'un mot en lettres minuscules sans accents (ex. dupont -> D153)"""
+    code = mot[0].upper()
+    precedent = CODES_SOUNDEX.get(mot[0])
+    for lettre in mot[1:]:
+        chiffre = CODES_SOUNDEX.get(lettre)
+        if chiffre and chiffre != precedent:
+            code += chiffre
+        if lettre not in 'hw':
+            precedent = chiffre
+    return (code + '000')[:4]
+
+
+def _cle_phonetique(nom):
+    """Clé phonétique d'un nom : Soundex de chaque mot, dans l'ordre alphabétique
+    (« Jean Dupont » et « DUPONT Jean » ont la même clé)"""
+    texte = unicodedata.normalize('NFKD', nom or '').encode('ascii', 'ignore').decode().lower()
+    mots = re.findall(r'[a-z]+', texte)
+    return ' '.join(sorted(_soundex(mot) for mot in mots)) or False
+
+
+def _cle_identifiant(valeur, longueur_min=4):
+    """Identifiant en majuscules sans espaces ni séparateurs (False s'il est trop court pour être fiable)"""
+    valeur = re.sub(r'[^A-Z0-9]', '', (valeur or '').upper())
+    return valeur if len(valeur) >= longueur_min else False
+
+
+def _cle_telephone(telephone):
+    """Neuf derniers chiffres du numéro : indicatif pays et 0 initial ignorés"""
+    chiffres = re.sub(r'[^0-9]', '', telephone or '')
+    return chiffres[-9:] if len(chiffres) >= 8 else False
 
 
 class Client(models.Model):
@@ -26,6 +75,7 @@ class Client(models.Model):
         string='Nom complet',
         compute='_compute_nom_complet',
         store=True,
+        index='trigram',
         help='Nom complet calculé automatiquement'
     )
     sexe = fields.Selection(
@@ -54,6 +104,7 @@ class Client(models.Model):
         string='Téléphone',
         required=True,
         tracking=True,
+        index='trigram',
         help='Numéro de téléphone du client'
     )
     adresse = fields.Text(
@@ -76,11 +127,13 @@ class Client(models.Model):
     numero_cin = fields.Char(
         string='Numéro CIN',
         help='Numéro de la carte d\'identité nationale',
+        index='trigram',
         tracking=True
     )
     numero_passport = fields.Char(
         string='Numéro passeport',
         help='Numéro de passeport',
+        index='trigram',
         tracking=True
     )
     
@@ -91,6 +144,70 @@ class Client(models.Model):
         tracking=True
     )
     
+    # Clés de blocage de la détection des doublons (seuls les clients d'une même clé sont comparés)
+    cle_nom = fields.Char(
+        string='Clé phonétique du nom',
+        compute='_compute_cles_doublons',
+        store=True,
+        index='btree_not_null'
+    )
+    cle_telephone = fields.Char(
+        string='Clé téléphone',
+        compute='_compute_cles_doublons',
+        store=True,
+        index='btree_not_null'
+    )
+    cle_email = fields.Char(
+        string='Clé email',
+        compute='_compute_cles_doublons',
+        store=True,
+        index='btree_not_null'
+    )
+    cle_cin = fields.Char(
+        string='Clé CIN',
+        compute='_compute_cles_doublons',
+        store=True,
+        index='btree_not_null'
+    )
+    cle_passport = fields.Char(
+        string='Clé passeport',
+        compute='_compute_cles_doublons',
+        store=True,
+        index='btree_not_null'
+    )
+    
+    @api.depends('nom_complet', 'telephone', 'email', 'numero_cin', 'numero_passport')
+    def _compute_cles_doublons(self):
+        for record in self:
+            record.cle_nom = _cle_phonetique(record.nom_complet)
+            record.cle_telephone = _cle_telephone(record.telephone)
+            record.cle_email = (record.email or '').strip().lower() or False
+            record.cle_cin = _cle_identifiant(record.numero_cin)
+            record.cle_passport = _cle_identifiant(record.numero_passport)
+    
+    @api.model
+    def _name_search(self, name, domain=None, operator='ilike', limit=None, order=None):
+        """Recherche un client par son nom, son téléphone, sa CIN ou son passeport.
+
+        Une seule requête filtre tous les identifiants (index trigrammes) ; les
+        clients sont classés du plus ressemblant au moins ressemblant à la saisie.
+        """
+        if not name or operator != 'ilike':
+            return super(Client, self)._name_search(name, domain, operator, limit, order)
+        domaine_nom = expression.OR([[(champ, 'ilike', name)] for champ in CHAMPS_RECHERCHE])
+        query = self._search(expression.AND([domain or [], domaine_nom]), limit=limit)
+        if self.env.registry.has_trigram:
+            colonnes = [SQL.identifier(self._table, champ) for champ in CHAMPS_RECHERCHE]
+            query.order = SQL(
+                "GREATEST(%s) DESC, similarity(%s, %s) DESC, %s",
+                SQL(', ').join(SQL("word_similarity(%s, %s)", name, colonne) for colonne in colonnes),
+                name, colonnes[0],
+                SQL.identifier(self._table, 'id'),
+            )
+        else:
+            query.order = SQL("%s, %s", SQL.identifier(self._table, 'nom_complet'), SQL.identifier(self._table, 'id'))
+        return query
+    
     @api.depends('nom', 'prenom')
     def _compute_nom_complet(self):
         """Calcule le nom complet à partir du prénom et du nom"""
@@ -116,4 +233,50 @@ class Client(models.Model):
         """Valide que le téléphone n'est pas vide"""
         for record in self:
             if not record.telephone or not record.telephone.strip():
-                raise ValidationError("Le numéro de téléphone est obligatoire.")
\ No newline at end of file
+                raise ValidationError("Le numéro de téléphone est obligatoire.")
+
+    @api.model
+    def _champs_vers_client(self):
+        """Champs many2one stockés qui pointent vers un client : (modèle, champ)"""
+        return [
+            (model_name, field.name)
+            for model_name, model in self.env.registry.items()
+            if model._auto and not model._abstract and not model._transient
+            for field in model._fields.values()
+            if field.type == 'many2one' and field.comodel_name == self._name and field.store
+        ]
+
+    def _fusionner(self, doublons):
+        """Fusionne les clients `doublons` dans ce client, qui est conservé.
+
+        Les réservations, paiements et autres enregistrements des doublons sont
+        rattachés à ce client par une écriture par modèle, ainsi que leur
+        historique ; ce client reprend les coordonnées qui lui manquent, puis
+        les doublons sont supprimés.
+        """
+        self.ensure_one()
+        doublons = doublons - self
+        if not doublons:
+            return
+        for model_name, champ in self._champs_vers_client():
+            lies = self.env[model_name].sudo().with_context(active_test=False).search([(champ, 'in', doublons.ids)])
+            if lies:
+                lies.with_context(tracking_disable=True).write({champ: self.id})
+        self.env['mail.message'].sudo().search([
+            ('model', '=', self._name), ('res_id', 'in', doublons.ids),
+        ]).write({'res_id': self.id})
+        self.env['mail.activity'].sudo().search([
+            ('res_model', '=', self._name), ('res_id', 'in', doublons.ids),
+        ]).write({'res_id': self.id})
+
+        repris = {}
+        for champ in CHAMPS_REPRIS_FUSION:
+            if not self[champ]:
+                valeur = next((doublon[champ] for doublon in doublons if doublon[champ]), False)
+                if valeur:
+                    repris[champ] = valeur
+        noms = ', '.join(doublons.mapped('nom_complet'))
+        doublons.unlink()
+        if repris:
+            self.write(repris)
+        self.message_post(body=_('Clients fusionnés dans cette fiche : %s') % noms)
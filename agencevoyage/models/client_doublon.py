@@ -0,0 +1,203 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL, split_every
+from itertools import combinations
+
+# Clés de blocage et poids de chaque clé commune dans le score d'une paire de clients
+POIDS_CLES = {
+    'cle_cin': 60,
+    'cle_passport': 60,
+    'cle_telephone': 30,
+    'cle_email': 30,
+    'cle_nom': 30,
+}
+LIBELLES_CLES = {
+    'cle_cin': 'CIN',
+    'cle_passport': 'Passeport',
+    'cle_telephone': 'Téléphone',
+    'cle_email': 'Email',
+    'cle_nom': 'Nom',
+}
+# Score à partir duquel deux clients sont proposés à la fusion (même CIN, ou même nom et même téléphone...)
+SEUIL_DOUBLON = 60
+# Au-delà, un bloc (numéro générique, nom très courant) ne génère pas de paires : la comparaison
+# serait quadratique ; ses clients restent comparés par leurs autres clés
+BLOC_MAX = 50
+# Lignes lues à la fois lors de la détection
+LECTURE_LOT = 10000
+
+
+class ClientDoublon(models.Model):
+    _name = 'agencevoyage.client.doublon'
+    _description = 'Doublons de clients'
+    _order = 'score desc, id'
+
+    name = fields.Char(
+        string='Doublon',
+        readonly=True
+    )
+    client_ids = fields.Many2many(
+        'agencevoyage.client',
+        'agencevoyage_client_doublon_rel',
+        'doublon_id',
+        'client_id',
+        string='Clients'
+    )
+    client_principal_id = fields.Many2one(
+        'agencevoyage.client',
+        string='Client conservé',
+        ondelete='set null',
+        help='Fiche conservée lors de la fusion : les réservations et paiements des autres fiches y sont rattachés'
+    )
+    nombre_clients = fields.Integer(
+        string='Fiches',
+        readonly=True
+    )
+    score = fields.Integer(
+        string='Score',
+        readonly=True,
+        help='Somme des poids des identifiants communs (CIN, passeport : 60 ; téléphone, email, nom : 30)'
+    )
+    raisons = fields.Char(
+        string='Identifiants communs',
+        readonly=True
+    )
+    state = fields.Selection(
+        [
+            ('propose', 'Proposé'),
+            ('fusionne', 'Fusionné'),
+            ('ignore', 'Ignoré'),
+        ],
+        string='État',
+        default='propose',
+        required=True,
+        readonly=True
+    )
+
+    @api.model
+    def _detecter(self):
+        """Détecte les groupes de clients en double et les propose à la fusion.
+
+        Seuls les clients partageant une clé de blocage (téléphone, email, CIN,
+        passeport normalisés, clé phonétique du nom) sont comparés, à l'intérieur
+        de chaque bloc : le coût suit le nombre de doublons possibles, pas le
+        carré du nombre de clients. Les paires dont le score atteint le seuil
+        sont regroupées (A~B et B~C donnent un groupe A, B, C).
+
+        :return: groupes de doublons créés
+        """
+        self.env['agencevoyage.client'].flush_model(list(POIDS_CLES))
+        self.flush_model()
+        cr = self.env.cr
+
+        paires = set()
+        for cle in POIDS_CLES:
+            colonne = SQL.identifier(cle)
+            cr.execute(SQL("""
+                SELECT array_agg(id ORDER BY id)
+                  FROM agencevoyage_client
+                 WHERE %s IS NOT NULL
+              GROUP BY %s
+                HAVING COUNT(*) BETWEEN 2 AND %s
+            """, colonne, colonne, BLOC_MAX))
+            while True:
+                blocs = cr.fetchmany(LECTURE_LOT)
+                if not blocs:
+                    break
+                for client_ids, in blocs:
+                    paires.update(combinations(client_ids, 2))
+
+        # Paires déjà traitées : clients d'une proposition en cours, ou groupe ignoré
+        proposes = set()
+        ignores = set()
+        for groupe in self.search([('state', 'in', ('propose', 'ignore'))]):
+            if groupe.state == 'propose':
+                proposes.update(groupe.client_ids.ids)
+            else:
+                ignores.update(combinations(sorted(groupe.client_ids.ids), 2))
+        paires = {
+            paire for paire in paires
+            if paire not in ignores and paire[0] not in proposes and paire[1] not in proposes
+        }
+
+        # Score des paires candidates, d'après toutes leurs clés
+        cles = {}
+        for client_ids in split_every(LECTURE_LOT, {client_id for paire in paires for client_id in paire}, list):
+            cr.execute(SQL(
+                "SELECT id, %s FROM agencevoyage_client WHERE id = ANY(%s)",
+                SQL(', ').join(SQL.identifier(cle) for cle in POIDS_CLES), client_ids,
+            ))
+            for ligne in cr.fetchall():
+                cles[ligne[0]] = dict(zip(POIDS_CLES, ligne[1:]))
+        parents = {}
+
+        def racine(client_id):
+            while parents.setdefault(client_id, client_id) != client_id:
+                parents[client_id] = parents[parents[client_id]]
+                client_id = parents[client_id]
+            return client_id
+
+        retenues = []
+        for a, b in paires:
+            communes = [cle for cle in POIDS_CLES if cles[a][cle] and cles[a][cle] == cles[b][cle]]
+            score = sum(POIDS_CLES[cle] for cle in communes)
+            if score >= SEUIL_DOUBLON:
+                retenues.append((a, b, score, communes))
+                parents[racine(a)] = racine(b)
+
+        groupes = {}
+        for a, b, score, communes in retenues:
+            groupe = groupes.setdefault(racine(a), {'ids': set(), 'score': 0, 'cles': set()})
+            groupe['ids'].update((a, b))
+            groupe['score'] = max(groupe['score'], score)
+            groupe['cles'].update(communes)
+
+        noms = {}
+        client_ids = [client_id for groupe in groupes.values() for client_id in groupe['ids']]
+        for lot in split_every(LECTURE_LOT, client_ids, list):
+            cr.execute("SELECT id, nom_complet FROM agencevoyage_client WHERE id = ANY(%s)", (lot,))
+            noms.update(cr.fetchall())
+        return self.create([{
+            'name': _('%s (%d fiches)') % (noms.get(min(groupe['ids'])) or '', len(groupe['ids'])),
+            'client_ids': [(6, 0, sorted(groupe['ids']))],
+            'client_principal_id': min(groupe['ids']),
+            'nombre_clients': len(groupe['ids']),
+            'score': groupe['score'],
+            'raisons': ', '.join(LIBELLES_CLES[cle] for cle in POIDS_CLES if cle in groupe['cles']),
+        } for groupe in groupes.values()])
+
+    @api.model
+    def _cron_detecter_doublons(self):
+        return len(self._detecter())
+
+    def action_detecter(self):
+        """Lance la détection et affiche les doublons proposés"""
+        groupes = self._detecter()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Détection des doublons'),
+                'message': _('%d groupe(s) de doublons proposé(s).') % len(groupes),
+                'type': 'success' if groupes else 'info',
+                'sticky': False,
+            }
+        }
+
+    def action_fusionner(self):
+        """Fusionne les fiches de chaque groupe dans le client conservé"""
+        for record in self:
+            if record.state != 'propose':
+                raise UserError(_('Seuls les doublons proposés peuvent être fusionnés.'))
+            clients = record.client_ids
+            principal = record.client_principal_id or clients[:1]
+            if not principal or principal not in clients:
+                raise UserError(_('Le client conservé doit faire partie des fiches du doublon.'))
+            principal._fusionner(clients - principal)
+            record.state = 'fusionne'
+        return True
+
+    def action_ignorer(self):
+        """Écarte le groupe : ses fiches ne seront plus proposées ensemble"""
+        self.filtered(lambda r: r.state == 'propose').state = 'ignore'
+        return True
@@ -0,0 +1,55 @@
+from odoo import models, fields
+from odoo.tools.safe_eval import safe_eval
+from datetime import datetime
+import tempfile
+
+MIMETYPES_EXPORT = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+
+class ExportDemande(models.TransientModel):
+    _name = 'agencevoyage.export.demande'
+    _description = 'Demande d\'export'
+
+    model_name = fields.Char(
+        string='Modèle',
+        required=True
+    )
+    format_export = fields.Selection(
+        [
+            ('xlsx', 'Excel'),
+            ('csv', 'CSV'),
+        ],
+        string='Format',
+        required=True,
+        default='xlsx'
+    )
+    domaine = fields.Text(
+        string='Domaine',
+        default='[]'
+    )
+
+    def _get_nom_fichier(self):
+        self.ensure_one()
+        prefixe = self.env[self.model_name]._export_nom_fichier
+        return f'{prefixe}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{self.format_export}'
+
+    def _generer_fichier(self):
+        """Écrit l'export dans un fichier temporaire (supprimé à sa fermeture).
+
+        Les enregistrements sont recherchés avec les droits de l'utilisateur.
+
+        :return: (fichier positionné au début, nom du fichier, type MIME)
+        """
+        self.ensure_one()
+        records = self.env[self.model_name].search(safe_eval(self.domaine or '[]'))
+        fichier = tempfile.TemporaryFile()
+        try:
+            records._ecrire_export(fichier, self.format_export)
+        except Exception:
+            fichier.close()
+            raise
+        fichier.seek(0)
+        return fichier, self._get_nom_fichier(), MIMETYPES_EXPORT[self.format_export]
@@ -0,0 +1,270 @@
+from odoo import models, fields, api, _
+from odoo.tools.safe_eval import safe_eval
+from .export_demande import MIMETYPES_EXPORT
+from datetime import datetime
+import json
+import logging
+import tempfile
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Nombre d'enregistrements écrits dans chaque partie d'un export en arrière-plan
+EXPORT_JOB_PARTIE = 10000
+
+
+class ExportJob(models.Model):
+    """Export Excel / CSV exécuté en arrière-plan par une tâche planifiée.
+
+    Les enregistrements sont lus par ordre d'identifiant, une partie à la
+    fois ; chaque partie est enregistrée en pièce jointe avec la position
+    atteinte et validée en base. Après un arrêt du serveur, l'export reprend
+    à la dernière partie enregistrée. Le fichier final est assemblé à partir
+    des parties.
+    """
+    _name = 'agencevoyage.export.job'
+    _description = 'Export en arrière-plan'
+    _inherit = ['mail.thread']
+    _order = 'id desc'
+
+    name = fields.Char(
+        string='Export',
+        required=True,
+        default=lambda self: _('Nouvel export')
+    )
+    user_id = fields.Many2one(
+        'res.users',
+        string='Demandé par',
+        required=True,
+        readonly=True,
+        default=lambda self: self.env.user
+    )
+    model_name = fields.Selection(
+        [
+            ('agencevoyage.reservation', 'Réservations'),
+            ('agencevoyage.caisse', 'Caisse'),
+            ('agencevoyage.paiement', 'Paiements'),
+            ('agencevoyage.achat', 'Achats'),
+        ],
+        string='Données',
+        required=True,
+        default='agencevoyage.reservation'
+    )
+    format_export = fields.Selection(
+        [
+            ('xlsx', 'Excel'),
+            ('csv', 'CSV'),
+        ],
+        string='Format',
+        required=True,
+        default='xlsx'
+    )
+    domaine = fields.Text(
+        string='Filtre',
+        default='[]'
+    )
+    state = fields.Selection(
+        [
+            ('en_attente', 'En attente'),
+            ('en_cours', 'En cours'),
+            ('termine', 'Terminé'),
+            ('erreur', 'Erreur'),
+        ],
+        string='État',
+        required=True,
+        default='en_attente',
+        readonly=True,
+        tracking=True
+    )
+    total = fields.Integer(
+        string='Lignes à exporter',
+        readonly=True
+    )
+    nombre_lignes = fields.Integer(
+        string='Lignes exportées',
+        readonly=True
+    )
+    progression = fields.Float(
+        string='Progression',
+        compute='_compute_progression'
+    )
+    dernier_id = fields.Integer(
+        string='Dernier enregistrement exporté',
+        readonly=True,
+        help='Position de reprise de l\'export'
+    )
+    partie_ids = fields.Many2many(
+        'ir.attachment',
+        'agencevoyage_export_job_partie_rel',
+        'job_id',
+        'attachment_id',
+        string='Parties',
+        readonly=True
+    )
+    attachment_id = fields.Many2one(
+        'ir.attachment',
+        string='Pièce jointe',
+        readonly=True,
+        ondelete='set null'
+    )
+    fichier = fields.Binary(
+        string='Fichier',
+        related='attachment_id.datas'
+    )
+    nom_fichier = fields.Char(
+        string='Nom du fichier',
+        related='attachment_id.name'
+    )
+    message_erreur = fields.Text(
+        string='Erreur',
+        readonly=True
+    )
+
+    @api.depends('total', 'nombre_lignes', 'state')
+    def _compute_progression(self):
+        for record in self:
+            if record.state == 'termine':
+                record.progression = 100.0
+            else:
+                record.progression = 100.0 * record.nombre_lignes / record.total if record.total else 0.0
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if not vals.get('name'):
+                modele = self.env[vals.get('model_name') or 'agencevoyage.reservation']
+                vals['name'] = _('Export %s du %s') % (modele._description, datetime.now().strftime('%d/%m/%Y %H:%M'))
+        jobs = super(ExportJob, self).create(vals_list)
+        self._declencher()
+        return jobs
+
+    def unlink(self):
+        self.sudo().partie_ids.unlink()
+        return super(ExportJob, self).unlink()
+
+    @api.model
+    def _declencher(self):
+        """Lance la tâche planifiée des exports dès que possible"""
+        cron = self.env.ref('agencevoyage.ir_cron_export_job', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    def action_relancer(self):
+        """Reprend un export en erreur à partir de la dernière partie enregistrée"""
+        self.filtered(lambda r: r.state == 'erreur').write({
+            'state': 'en_cours',
+            'message_erreur': False,
+        })
+        self._declencher()
+        return True
+
+    def _get_records(self, apres_id=0, limit=None):
+        """Enregistrements à exporter, lus avec les droits du demandeur"""
+        self.ensure_one()
+        modele = self.env[self.model_name].with_user(self.user_id)
+        domaine = safe_eval(self.domaine or '[]')
+        return modele.search(domaine + [('id', '>', apres_id)], order='id', limit=limit)
+
+    def _traiter_partie(self):
+        """Exporte la partie suivante ; assemble le fichier final quand tout est exporté.
+
+        :return: True s'il reste des enregistrements à exporter
+        """
+        self.ensure_one()
+        if self.state == 'en_attente':
+            self.write({
+                'state': 'en_cours',
+                'total': self.env[self.model_name].with_user(self.user_id).search_count(
+                    safe_eval(self.domaine or '[]')),
+            })
+        records = self._get_records(self.dernier_id, limit=EXPORT_JOB_PARTIE)
+        if not records:
+            self._finaliser()
+            return False
+        colonnes = records._get_colonnes_export()
+        contenu = '\n'.join(json.dumps(ligne) for ligne in records._lire_lignes_export(colonnes))
+        partie = self.env['ir.attachment'].sudo().create({
+            'name': '%s.part%05d.jsonl' % (self.name, len(self.partie_ids) + 1),
+            'raw': contenu.encode(),
+            'mimetype': 'application/json',
+        })
+        self.write({
+            'partie_ids': [(4, partie.id)],
+            'dernier_id': records.ids[-1],
+            'nombre_lignes': self.nombre_lignes + len(records),
+        })
+        return True
+
+    def _lire_parties(self):
+        """Génère les lignes enregistrées dans les parties, dans l'ordre"""
+        for partie in self.partie_ids.sorted('id'):
+            # Une seule partie en mémoire à la fois
+            partie = partie.with_prefetch()
+            contenu = partie.raw.decode()
+            partie.invalidate_recordset(['raw', 'datas'])
+            for ligne in contenu.splitlines():
+                yield json.loads(ligne)
+
+    def _finaliser(self):
+        """Assemble le fichier final, le joint à l'export et prévient le demandeur"""
+        self.ensure_one()
+        modele = self.env[self.model_name]
+        entetes = [titre for titre, chemin in modele._get_colonnes_export()]
+        with tempfile.TemporaryFile() as fichier:
+            modele._ecrire_fichier_export(fichier, self.format_export, entetes, self._lire_parties())
+            fichier.seek(0)
+            contenu = fichier.read()
+        attachment = self.env['ir.attachment'].sudo().create({
+            'name': f'{modele._export_nom_fichier}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{self.format_export}',
+            'raw': contenu,
+            'mimetype': MIMETYPES_EXPORT[self.format_export],
+            'res_model': self._name,
+            'res_id': self.id,
+        })
+        parties = self.partie_ids
+        self.write({
+            'state': 'termine',
+            'attachment_id': attachment.id,
+            'partie_ids': [(5, 0, 0)],
+        })
+        parties.sudo().unlink()
+        self.message_post(
+            body=_('L\'export est terminé : %s lignes exportées.') % self.nombre_lignes,
+            attachment_ids=[attachment.id],
+            partner_ids=self.user_id.partner_id.ids,
+        )
+
+    @api.model
+    def _cron_traiter_jobs(self, duree_max=60):
+        """Tâche planifiée : exporte les parties en attente, une transaction par partie.
+
+        Chaque partie est validée en base avant de passer à la suivante ; quand la
+        durée allouée est écoulée, la tâche se relance pour continuer.
+        """
+        debut = time.monotonic()
+        while time.monotonic() - debut < duree_max:
+            # SKIP LOCKED : plusieurs workers peuvent traiter des exports différents
+            self.env.cr.execute("""
+                SELECT id
+                  FROM agencevoyage_export_job
+                 WHERE state IN ('en_attente', 'en_cours')
+                 ORDER BY id
+                 LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+            """)
+            ligne = self.env.cr.fetchone()
+            if not ligne:
+                return
+            job = self.browse(ligne[0])
+            try:
+                job._traiter_partie()
+            except Exception as e:
+                _logger.exception("Échec de l'export %s", job.id)
+                self.env.cr.rollback()
+                job.write({'state': 'erreur', 'message_erreur': str(e)})
+                job.message_post(
+                    body=_('L\'export a échoué : %s') % e,
+                    partner_ids=job.user_id.partner_id.ids,
+                )
+            self.env.cr.commit()
+        self._declencher()
@@ -0,0 +1,138 @@
+from odoo import models, api, _
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+import csv
+import io
+
+# Nombre d'enregistrements lus (et gardés en cache) à la fois pendant un export
+EXPORT_LOT = 1000
+# Au-delà, l'export est confié à une tâche en arrière-plan (agencevoyage.export.job)
+EXPORT_LIMITE_DIRECT = 20000
+
+
+class ExportMixin(models.AbstractModel):
+    """Export Excel / CSV des enregistrements d'un modèle.
+
+    Les modèles héritant de ce mixin définissent leurs colonnes dans
+    `_get_colonnes_export`. Le fichier est écrit sur disque par lots
+    d'enregistrements et servi par le contrôleur /agencevoyage/export : la
+    mémoire utilisée ne dépend pas du nombre de lignes exportées.
+    """
+    _name = 'agencevoyage.export.mixin'
+    _description = 'Export Excel / CSV'
+
+    # Préfixe du nom des fichiers exportés
+    _export_nom_fichier = 'export'
+
+    @api.model
+    def _get_colonnes_export(self):
+        """Retourne les colonnes à exporter : liste de (en-tête, chemin du champ)"""
+        return [(_('Numéro'), 'display_name')]
+
+    def action_export_excel(self):
+        """Exporte les enregistrements en Excel"""
+        return self._action_export('xlsx')
+
+    def action_export_csv(self):
+        """Exporte les enregistrements en CSV"""
+        return self._action_export('csv')
+
+    def _action_export(self, format_export):
+        if len(self) > EXPORT_LIMITE_DIRECT:
+            return self._action_export_job(format_export)
+        demande = self.env['agencevoyage.export.demande'].create({
+            'model_name': self._name,
+            'format_export': format_export,
+            'domaine': str([('id', 'in', self.ids)]),
+        })
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/agencevoyage/export/{demande.id}',
+            'target': 'self',
+        }
+
+    def _action_export_job(self, format_export):
+        """Confie l'export à une tâche en arrière-plan"""
+        # Toute la liste est sélectionnée : on conserve son filtre plutôt que la liste des identifiants
+        domaine = self.env.context.get('active_domain')
+        if domaine is None or self.search_count(domaine) != len(self):
+            domaine = [('id', 'in', self.ids)]
+        self.env['agencevoyage.export.job'].create({
+            'model_name': self._name,
+            'format_export': format_export,
+            'domaine': str(domaine),
+        })
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Export en arrière-plan'),
+                'message': _('%s lignes à exporter : vous serez notifié quand le fichier sera prêt (menu Exports).') % len(self),
+                'type': 'info',
+                'sticky': False,
+            }
+        }
+
+    @api.model
+    def _get_formateur_export(self, chemin):
+        """Retourne la fonction qui calcule la valeur exportée d'une colonne.
+
+        Les libellés des champs de sélection ne sont calculés qu'une fois par export.
+        """
+        noms = chemin.split('.')
+        modele = self
+        for nom in noms[:-1]:
+            modele = self.env[modele._fields[nom].comodel_name]
+        champ = modele._fields[noms[-1]]
+        libelles = dict(champ._description_selection(self.env)) if champ.type == 'selection' else None
+
+        def formater(record):
+            valeur = record
+            for nom in noms:
+                valeur = valeur[nom]
+            if libelles is not None:
+                return libelles.get(valeur, '')
+            if champ.type == 'date':
+                return valeur.strftime('%d/%m/%Y') if valeur else ''
+            if champ.type in ('integer', 'float', 'monetary'):
+                return valeur
+            return valeur or ''
+        return formater
+
+    def _lire_lignes_export(self, colonnes):
+        """Génère les lignes à exporter, par lots de EXPORT_LOT enregistrements"""
+        formateurs = [self._get_formateur_export(chemin) for titre, chemin in colonnes]
+        for ids in split_every(EXPORT_LOT, self.ids):
+            for record in self.browse(ids):
+                yield [formater(record) for formater in formateurs]
+            # Le cache du lot est libéré avant de lire le suivant
+            self.env.invalidate_all()
+
+    def _ecrire_export(self, fichier, format_export):
+        """Écrit l'export de self dans le fichier binaire ouvert `fichier`"""
+        colonnes = self._get_colonnes_export()
+        self._ecrire_fichier_export(
+            fichier, format_export, [titre for titre, chemin in colonnes], self._lire_lignes_export(colonnes))
+
+    @api.model
+    def _ecrire_fichier_export(self, fichier, format_export, entetes, lignes):
+        """Écrit les en-têtes puis les lignes (itérable) dans le fichier binaire ouvert `fichier`"""
+        if format_export == 'xlsx':
+            try:
+                import xlsxwriter
+            except ImportError:
+                raise UserError(_('Le module xlsxwriter n\'est pas installé. Veuillez l\'installer avec: pip install xlsxwriter'))
+            # constant_memory : chaque ligne est écrite sur disque dès que la suivante commence
+            workbook = xlsxwriter.Workbook(fichier, {'constant_memory': True})
+            worksheet = workbook.add_worksheet(self._description[:31])
+            worksheet.write_row(0, 0, entetes)
+            for row, ligne in enumerate(lignes, start=1):
+                worksheet.write_row(row, 0, ligne)
+            workbook.close()
+        else:
+            texte = io.TextIOWrapper(fichier, encoding='utf-8-sig', newline='')
+            writer = csv.writer(texte, delimiter=';')
+            writer.writerow(entetes)
+            writer.writerows(lignes)
+            texte.flush()
+            texte.detach()
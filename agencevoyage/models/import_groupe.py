@@ -0,0 +1,265 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from .tools import normaliser
+import base64
+import csv
+import io
+import math
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Voyageurs lus avant chaque création en lot
+IMPORT_LOT = 500
+
+# Noms de colonnes reconnus dans les fichiers de groupe
+COLONNES_GROUPE = {
+    'groupe': {'groupe', 'reservation', 'famille', 'dossier', 'chambree'},
+    'nom': {'nom', 'nom complet', 'voyageur', 'name'},
+    'prenom': {'prenom', 'first name'},
+    'type_voyageur': {'type', 'type voyageur', 'categorie'},
+    'age': {'age'},
+    'chambre': {'chambre', 'type chambre', 'type de chambre'},
+}
+
+# Valeurs reconnues pour le type de voyageur et le type de chambre
+TYPES_VOYAGEUR = {
+    'adulte': 'adulte', 'adult': 'adulte', 'a': 'adulte',
+    'enfant': 'enfant', 'child': 'enfant', 'e': 'enfant',
+}
+TYPES_CHAMBRE = {
+    'simple': 'simple', 'single': 'simple', 'individuelle': 'simple',
+    'double': 'double', 'twin': 'double',
+    'triple': 'triple',
+    'suite': 'suite',
+}
+# Voyageurs par chambre, pour déduire le nombre de chambres des voyageurs
+OCCUPATION_CHAMBRE = {'simple': 1, 'double': 2, 'triple': 3, 'suite': 2}
+
+
+class ImportGroupe(models.TransientModel):
+    _name = 'agencevoyage.import.groupe'
+    _description = 'Import d\'un groupe de voyageurs'
+
+    voyage_id = fields.Many2one(
+        'agencevoyage.voyage',
+        string='Voyage',
+        required=True,
+        ondelete='cascade'
+    )
+    client_id = fields.Many2one(
+        'agencevoyage.client',
+        string='Client',
+        required=True,
+        ondelete='cascade',
+        help='Client des réservations créées (école, association, responsable du groupe)'
+    )
+    hotel_id = fields.Many2one(
+        'agencevoyage.hotel',
+        string='Hôtel',
+        domain="[('voyage_id', '=', voyage_id)]",
+        help='Prix par nuit et nombre de nuits des chambres (sinon la durée du voyage, sans prix)'
+    )
+    fichier = fields.Binary(
+        string='Fichier',
+        required=True,
+        help='CSV ou XLSX, une ligne par voyageur : Nom (obligatoire), Prénom, Type (adulte/enfant), '
+             'Âge, Chambre (simple/double/triple/suite), Groupe (une réservation par groupe)'
+    )
+    nom_fichier = fields.Char(
+        string='Nom du fichier'
+    )
+    confirmer = fields.Boolean(
+        string='Confirmer les réservations',
+        help='Confirme les réservations importées (places prises sur le voyage)'
+    )
+    state = fields.Selection(
+        [
+            ('brouillon', 'Brouillon'),
+            ('importe', 'Importé'),
+        ],
+        string='État',
+        default='brouillon'
+    )
+    reservation_ids = fields.Many2many(
+        'agencevoyage.reservation',
+        string='Réservations créées'
+    )
+    nombre_voyageurs = fields.Integer(
+        string='Voyageurs importés',
+        readonly=True
+    )
+
+    def action_importer(self):
+        """Lit le fichier par lots et crée les réservations du groupe avec leurs voyageurs et chambres"""
+        self.ensure_one()
+        if self.state != 'brouillon':
+            raise UserError(_('Ce fichier a déjà été importé.'))
+        lignes = self._lire_lignes(base64.b64decode(self.fichier))
+        # {groupe: réservation} : un groupe réparti dans le fichier reste une seule réservation
+        reservations = {}
+        # {groupe: {type de chambre: voyageurs}} : les chambres sont créées une fois le fichier lu
+        occupants = {}
+        nombre = 0
+        lot = {}
+        taille_lot = 0
+        for numero, ligne in lignes:
+            groupe = ligne.get('groupe') or ''
+            vals, type_chambre = self._convertir_ligne(numero, ligne)
+            lot.setdefault(groupe, []).append(vals)
+            if type_chambre:
+                chambres = occupants.setdefault(groupe, {})
+                chambres[type_chambre] = chambres.get(type_chambre, 0) + 1
+            taille_lot += 1
+            nombre += 1
+            if taille_lot >= IMPORT_LOT:
+                self._creer_lot(lot, reservations)
+                lot, taille_lot = {}, 0
+        if lot:
+            self._creer_lot(lot, reservations)
+        if not nombre:
+            raise UserError(_('Aucun voyageur n\'a été trouvé dans le fichier.'))
+        self._creer_chambres(occupants, reservations)
+
+        creees = self.env['agencevoyage.reservation'].browse(reservations.values())
+        self.write({
+            'state': 'importe',
+            'reservation_ids': [(6, 0, creees.ids)],
+            'nombre_voyageurs': nombre,
+        })
+        action = {
+            'type': 'ir.actions.act_window',
+            'name': _('Réservations importées'),
+            'res_model': 'agencevoyage.reservation',
+            'view_mode': 'tree,form',
+            'domain': [('id', 'in', creees.ids)],
+        }
+        if not self.confirmer:
+            return action
+        # Un ou plusieurs groupes : les réservations refusées restent importées,
+        # en attente, et le bilan est affiché avant les réservations
+        confirmees, refusees, echecs = creees._confirmer_en_masse()
+        notification = creees._notification_bilan(
+            _('Confirmation des réservations importées'), confirmees, _('confirmée(s)'), refusees, echecs)
+        notification['params']['next'] = action
+        return notification
+
+    def _creer_lot(self, lot, reservations):
+        """Crée les voyageurs d'un lot : une création de réservations (avec voyageurs)
+        pour les nouveaux groupes, une création de voyageurs pour les groupes déjà créés.
+
+        Les champs calculés des réservations (nombre de voyageurs, prix) ne sont
+        recalculés qu'une fois, à la fin du lot.
+        """
+        nouveaux = [groupe for groupe in lot if groupe not in reservations]
+        vals_list = [{
+            'date_reservation': fields.Date.context_today(self),
+            'voyage_id': self.voyage_id.id,
+            'client_id': self.client_id.id,
+            'voyageur_ids': [(0, 0, vals) for vals in lot[groupe]],
+        } for groupe in nouveaux]
+        for groupe, reservation in zip(nouveaux, self.env['agencevoyage.reservation'].create(vals_list)):
+            reservations[groupe] = reservation.id
+        suite = [groupe for groupe in lot if groupe not in nouveaux]
+        if suite:
+            self.env['agencevoyage.voyageur'].create([
+                dict(vals, reservation_id=reservations[groupe])
+                for groupe in suite for vals in lot[groupe]
+            ])
+        self.env.flush_all()
+
+    def _creer_chambres(self, occupants, reservations):
+        """Crée en une fois les chambres de tous les groupes, d'après les voyageurs de tout le fichier.
+
+        Un groupe réparti sur plusieurs lots a ainsi une seule ligne par type de
+        chambre : deux voyageurs en double de deux lots partagent une chambre.
+
+        :param occupants: {groupe: {type de chambre: nombre de voyageurs}}
+        """
+        if self.hotel_id:
+            nuits, prix = self.hotel_id.nombre_nuit, self.hotel_id.prix
+        else:
+            nuits, prix = (self.voyage_id.date_fin - self.voyage_id.date_debut).days, 0.0
+        self.env['agencevoyage.chambre_reservation'].create([{
+            'reservation_id': reservations[groupe],
+            'type_chambre': type_chambre,
+            'nombre_chambres': math.ceil(nombre / OCCUPATION_CHAMBRE[type_chambre]),
+            'nombre_nuits': max(nuits, 1),
+            'prix_nuit': prix,
+        } for groupe, chambres in occupants.items() for type_chambre, nombre in chambres.items()])
+        self.env.flush_all()
+
+    def _convertir_ligne(self, numero, ligne):
+        """Valeurs du voyageur d'une ligne du fichier et son type de chambre
+
+        :return: (valeurs du voyageur, type de chambre ou False)
+        """
+        if not ligne.get('nom'):
+            raise UserError(_('Ligne %d : le nom du voyageur est obligatoire.') % numero)
+        vals = {'nom': ' '.join(filter(None, [ligne.get('prenom'), ligne['nom']]))}
+        if ligne.get('type_voyageur'):
+            type_voyageur = TYPES_VOYAGEUR.get(normaliser(ligne['type_voyageur']))
+            if not type_voyageur:
+                raise UserError(_('Ligne %d : type de voyageur non reconnu : %s') % (numero, ligne['type_voyageur']))
+            vals['type_voyageur'] = type_voyageur
+        if ligne.get('age'):
+            try:
+                vals['age'] = int(float(ligne['age'].replace(',', '.')))
+            except ValueError:
+                raise UserError(_('Ligne %d : âge non reconnu : %s') % (numero, ligne['age']))
+        type_chambre = False
+        if ligne.get('chambre'):
+            type_chambre = TYPES_CHAMBRE.get(normaliser(ligne['chambre']))
+            if not type_chambre:
+                raise UserError(_('Ligne %d : type de chambre non reconnu : %s') % (numero, ligne['chambre']))
+        return vals, type_chambre
+
+    def _lire_lignes(self, contenu):
+        """Lignes du fichier, une à une : (numéro de ligne, {colonne reconnue: texte})"""
+        if contenu[:2] == b'PK':
+            rangees = self._rangees_xlsx(contenu)
+        else:
+            rangees = self._rangees_csv(contenu)
+        entetes = [normaliser(str(entete or '')) for entete in next(rangees, [])]
+        positions = {}
+        for cle, noms in COLONNES_GROUPE.items():
+            for position, entete in enumerate(entetes):
+                if entete in noms:
+                    positions.setdefault(cle, position)
+        if 'nom' not in positions:
+            raise UserError(_('Le fichier doit contenir au moins la colonne Nom.'))
+        for numero, rangee in enumerate(rangees, start=2):
+            ligne = {
+                cle: str(rangee[position]).strip()
+                for cle, position in positions.items()
+                if position < len(rangee) and rangee[position] not in (None, '')
+            }
+            if ligne:
+                yield numero, ligne
+
+    def _rangees_csv(self, contenu):
+        texte = io.TextIOWrapper(io.BytesIO(contenu), encoding='utf-8-sig', errors='replace', newline='')
+        extrait = texte.read(4096)
+        texte.seek(0)
+        try:
+            dialecte = csv.Sniffer().sniff(extrait, delimiters=';,\t')
+        except csv.Error:
+            # Aucun séparateur à détecter (fichier d'une seule colonne, Nom) : séparateur par défaut
+            return csv.reader(texte, delimiter=';')
+        return csv.reader(texte, dialecte)
+
+    def _rangees_xlsx(self, contenu):
+        if openpyxl is None:
+            raise UserError(_('La lecture des fichiers XLSX nécessite la bibliothèque openpyxl.'))
+        # Lecture seule : les lignes sont lues au fil de l'eau, sans charger la feuille
+        classeur = openpyxl.load_workbook(io.BytesIO(contenu), read_only=True, data_only=True)
+        try:
+            for rangee in classeur.active.iter_rows(values_only=True):
+                yield [
+                    int(valeur) if isinstance(valeur, float) and valeur.is_integer() else valeur
+                    for valeur in rangee
+                ]
+        finally:
+            classeur.close()
@@ -0,0 +1,128 @@
+from odoo import models, api
+from odoo.tools import split_every
+from odoo.tools.safe_eval import safe_eval, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+
+# Rapports rendus par lots et mis en cache (une pièce jointe par document et par version),
+# avec le début du nom de leurs pièces jointes (champ attachment des rapports, dossier reports/)
+RAPPORTS_PAR_LOTS = {
+    'agencevoyage.report_reservation': 'Reservation-',
+    'agencevoyage.report_paiement': 'Recu-',
+    'agencevoyage.report_caisse': 'Caisse-',
+}
+# Documents rendus par appel à wkhtmltopdf
+RAPPORT_LOT = 50
+# Lots rendus en même temps (un processus wkhtmltopdf par lot)
+RAPPORT_PROCESSUS = min(4, os.cpu_count() or 1)
+
+
+class IrActionsReport(models.Model):
+    _inherit = 'ir.actions.report'
+
+    def _render_qweb_pdf_prepare_streams(self, report_ref, data, res_ids=None):
+        """Rend les grandes sélections des rapports de l'agence par lots.
+
+        Les documents dont la pièce jointe de la version courante existe sont
+        relus sans rendu ; les autres sont répartis en lots de RAPPORT_LOT,
+        rendus en parallèle (un processus wkhtmltopdf par lot, chacun dans son
+        propre curseur) puis réassemblés dans l'ordre de la sélection. Les
+        pièces jointes des nouveaux documents sont créées ensuite par
+        _render_qweb_pdf, dans la transaction de la requête.
+        """
+        report_sudo = self._get_report(report_ref)
+        if (report_sudo.report_name not in RAPPORTS_PAR_LOTS or not res_ids
+                or len(set(res_ids)) != len(res_ids)):
+            return super(IrActionsReport, self)._render_qweb_pdf_prepare_streams(report_ref, data, res_ids=res_ids)
+
+        en_cache = self._lire_pdf_en_cache(report_sudo, res_ids)
+        a_rendre = [res_id for res_id in res_ids if res_id not in en_cache]
+        lots = list(split_every(RAPPORT_LOT, a_rendre, list))
+        if len(lots) > 1 and not self.env.registry.in_test_mode():
+            with ThreadPoolExecutor(max_workers=min(len(lots), RAPPORT_PROCESSUS)) as executor:
+                rendus = list(executor.map(lambda lot: self._rendre_lot_pdf(report_ref, data, lot), lots))
+        else:
+            # Un seul lot, ou un seul curseur partagé en test : rendu dans la requête
+            rendus = [
+                super(IrActionsReport, self)._render_qweb_pdf_prepare_streams(report_ref, data, res_ids=lot)
+                for lot in lots
+            ]
+        streams = {}
+        for rendu in rendus:
+            if False in rendu:
+                # PDF d'un lot non découpable par document : rendu de la sélection en une fois
+                return super(IrActionsReport, self)._render_qweb_pdf_prepare_streams(report_ref, data, res_ids=res_ids)
+            streams.update(rendu)
+        streams.update(en_cache)
+        return OrderedDict((res_id, streams[res_id]) for res_id in res_ids)
+
+    def _rendre_lot_pdf(self, report_ref, data, res_ids):
+        """Rend un lot de documents dans son propre curseur (appelé depuis un fil d'exécution).
+
+        Le lot ne lit que des données validées : l'impression est une requête
+        à part, qui ne modifie pas les documents avant de les rendre.
+        """
+        with self.pool.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, dict(self.env.context))
+            streams = env['ir.actions.report']._render_qweb_pdf_prepare_streams(report_ref, data, res_ids=res_ids)
+            # Les flux sont en mémoire ; aucun enregistrement ne sort du curseur du lot
+            return {res_id: {'stream': stream['stream'], 'attachment': None} for res_id, stream in streams.items()}
+
+    @api.model
+    def _lire_pdf_en_cache(self, report_sudo, res_ids):
+        """PDF déjà rendus pour la version courante des documents, en une recherche.
+
+        :return: {res_id: {'stream': flux du PDF, 'attachment': pièce jointe}}
+        """
+        if not report_sudo.attachment or not report_sudo.attachment_use \
+                or self.env.context.get('report_pdf_no_attachment'):
+            return {}
+        noms = {
+            record.id: safe_eval(report_sudo.attachment, {'object': record, 'time': time})
+            for record in self.env[report_sudo.model].browse(res_ids)
+        }
+        attachments = self.env['ir.attachment'].search([
+            ('res_model', '=', report_sudo.model),
+            ('res_id', 'in', list(noms)),
+            ('name', 'in', [nom for nom in noms.values() if nom]),
+        ])
+        en_cache = {}
+        for attachment in attachments:
+            if attachment.name == noms[attachment.res_id] and attachment.res_id not in en_cache:
+                en_cache[attachment.res_id] = {'stream': io.BytesIO(attachment.raw), 'attachment': attachment}
+        return en_cache
+
+    def _render_qweb_pdf(self, report_ref, res_ids=None, data=None):
+        """Supprime les PDF des versions précédentes une fois ceux de la version courante enregistrés"""
+        result = super(IrActionsReport, self)._render_qweb_pdf(report_ref, res_ids=res_ids, data=data)
+        if isinstance(res_ids, int):
+            res_ids = [res_ids]
+        report_sudo = self._get_report(report_ref)
+        prefixe = RAPPORTS_PAR_LOTS.get(report_sudo.report_name)
+        if prefixe and res_ids and result[1] == 'pdf' and report_sudo.attachment:
+            self._supprimer_versions_precedentes(report_sudo, prefixe, res_ids)
+        return result
+
+    @api.model
+    def _supprimer_versions_precedentes(self, report_sudo, prefixe, res_ids):
+        """Supprime, en une recherche, les PDF en cache des versions précédentes des documents.
+
+        Seuls les documents dont la pièce jointe de la version courante existe
+        sont concernés : un PDF qui n'a pas pu être enregistré ne fait pas
+        disparaître le précédent.
+        """
+        noms = {
+            record.id: safe_eval(report_sudo.attachment, {'object': record, 'time': time})
+            for record in self.env[report_sudo.model].browse(res_ids).exists()
+        }
+        attachments = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', report_sudo.model),
+            ('res_id', 'in', list(noms)),
+            ('name', '=like', prefixe + '%'),
+        ])
+        a_jour = {attachment.res_id for attachment in attachments if attachment.name == noms[attachment.res_id]}
+        attachments.filtered(
+            lambda attachment: attachment.res_id in a_jour and attachment.name != noms[attachment.res_id]
+        ).unlink()
@@ -0,0 +1,110 @@
+import threading
+
+from odoo import models, fields, api
+
+# Numéros pré-alloués par ce processus :
+# {(base, id séquence): (date de modification de la séquence au tirage du bloc, [numéros restants])}
+BLOCS_NUMEROS = {}
+BLOCS_VERROU = threading.Lock()
+
+
+class IrSequence(models.Model):
+    _inherit = 'ir.sequence'
+
+    taille_bloc = fields.Integer(
+        string='Taille des blocs par processus',
+        default=0,
+        help='Nombre de numéros réservés en une fois par chaque processus serveur '
+             '(séquences standard sans plage de dates). Accélère les imports en parallèle '
+             'au prix de numéros non strictement croissants et de trous au redémarrage. '
+             'Une modification de la séquence abandonne les blocs de tous les processus '
+             'à leur prochain tirage. 0 désactive la pré-allocation.'
+    )
+
+    @api.model
+    def _next_by_code_lot(self, sequence_code, nombre):
+        """Retourne `nombre` numéros de la séquence `sequence_code`.
+
+        Équivalent de `nombre` appels à next_by_code, mais en une seule requête
+        pour les séquences standard (et une seule mise à jour pour les séquences
+        sans trou) : utilisé par les créations en lot. Si la séquence a une
+        taille de bloc, les numéros sont servis par le bloc du processus.
+
+        :return: liste de `nombre` numéros (False si la séquence n'existe pas)
+        """
+        if nombre <= 0:
+            return []
+        self.check_access_rights('read')
+        company_id = self.env.company.id
+        sequence = self.sudo().search(
+            [('code', '=', sequence_code), ('company_id', 'in', [company_id, False])],
+            order='company_id', limit=1)
+        if not sequence:
+            return [False] * nombre
+        return sequence._next_lot(nombre)
+
+    def _next_lot(self, nombre):
+        self.ensure_one()
+        if self.use_date_range:
+            # Les plages de dates ont leur propre compteur : pas d'allocation groupée
+            return [self._next() for i in range(nombre)]
+        if self.implementation == 'standard':
+            if self.taille_bloc > 0:
+                numeros = self._prendre_dans_bloc(nombre)
+            else:
+                numeros = self._nextval_lot(nombre)
+        else:
+            self.flush_recordset(['number_next'])
+            self.env.cr.execute("SELECT number_next FROM ir_sequence WHERE id = %s FOR UPDATE NOWAIT", (self.id,))
+            self.env.cr.execute("""
+                UPDATE ir_sequence
+                   SET number_next = number_next + %(nombre)s * number_increment
+                 WHERE id = %(id)s
+             RETURNING number_next - %(nombre)s * number_increment, number_increment
+            """, {'id': self.id, 'nombre': nombre})
+            premier, increment = self.env.cr.fetchone()
+            numeros = [premier + i * increment for i in range(nombre)]
+            self.invalidate_recordset(['number_next'])
+        return [self.get_next_char(numero) for numero in numeros]
+
+    def _nextval_lot(self, nombre):
+        """Tire `nombre` valeurs de la séquence PostgreSQL en une requête (sans verrou de ligne)"""
+        self.env.cr.execute(
+            "SELECT nextval(%s) FROM generate_series(1, %s)", ('ir_sequence_%03d' % self.id, nombre))
+        return [numero for numero, in self.env.cr.fetchall()]
+
+    def _prendre_dans_bloc(self, nombre):
+        """Sert `nombre` numéros depuis le bloc pré-alloué de ce processus.
+
+        Les valeurs de nextval ne sont jamais rendues à PostgreSQL : un bloc
+        entamé reste valable quelle que soit l'issue de la transaction, comme
+        un nextval classique. Le bloc est complété par multiples de
+        `taille_bloc` quand il ne suffit plus.
+
+        Le bloc porte la date de modification de la séquence lors de son
+        tirage : si la séquence a été modifiée depuis, par ce processus ou par
+        un autre (remise à un numéro inférieur, autre incrément), le bloc est
+        abandonné et ses numéros ne sont jamais servis.
+        """
+        cle = (self.env.cr.dbname, self.id)
+        version = self.write_date
+        with BLOCS_VERROU:
+            version_bloc, bloc = BLOCS_NUMEROS.get(cle, (None, []))
+            if version_bloc != version:
+                bloc = []
+                BLOCS_NUMEROS[cle] = (version, bloc)
+            if len(bloc) < nombre:
+                manquants = nombre - len(bloc)
+                taille = -(-manquants // self.taille_bloc) * self.taille_bloc
+                bloc.extend(self._nextval_lot(taille))
+            numeros, bloc[:] = bloc[:nombre], bloc[nombre:]
+        return numeros
+
+    def write(self, values):
+        if {'number_next', 'number_increment', 'implementation', 'use_date_range', 'taille_bloc'} & set(values):
+            # Les numéros déjà réservés par ce processus ne correspondent plus à la séquence
+            # (les autres processus abandonnent les leurs à la nouvelle date de modification)
+            with BLOCS_VERROU:
+                for sequence in self:
+                    BLOCS_NUMEROS.pop((self.env.cr.dbname, sequence.id), None)
+        return super(IrSequence, self).write(values)
@@ -0,0 +1,70 @@
+from odoo import models, fields, api
+from datetime import timedelta
+
+# Nombre maximum d'envois d'un email de l'agence avant abandon
+EMAIL_TENTATIVES_MAX = 5
+# Emails en échec remis en file par passage de la tâche planifiée
+EMAIL_RELANCE_LOT = 500
+
+
+class MailMail(models.Model):
+    _inherit = 'mail.mail'
+
+    type_email_agence = fields.Selection(
+        [
+            ('confirmation', 'Confirmation de réservation'),
+            ('statut', 'Changement de statut'),
+            ('rappel', 'Rappel de paiement'),
+        ],
+        string='Email de l\'agence',
+        index='btree_not_null',
+        help='Emails des réservations mis en file d\'attente par l\'agence'
+    )
+    nombre_tentatives = fields.Integer(
+        string='Tentatives d\'envoi',
+        default=0
+    )
+
+    def _postprocess_sent_message(self, success_pids, failure_reason=False, failure_type=None):
+        """Marque la confirmation comme envoyée une fois l'email réellement remis"""
+        confirmations = self.filtered(
+            lambda m: m.type_email_agence == 'confirmation' and m.state == 'sent'
+            and m.model == 'agencevoyage.reservation' and m.res_id)
+        if confirmations:
+            self.env['agencevoyage.reservation'].browse(confirmations.mapped('res_id')).exists().write({
+                'email_confirme': True,
+            })
+        return super(MailMail, self)._postprocess_sent_message(
+            success_pids, failure_reason=failure_reason, failure_type=failure_type)
+
+    @api.model
+    def _cron_relancer_emails_agence(self):
+        """Remet en file les emails de l'agence en échec d'envoi (serveur SMTP, erreur inconnue).
+
+        Chaque nouvelle tentative est repoussée de 2, 4, 8... minutes ; après
+        EMAIL_TENTATIVES_MAX tentatives l'email reste en échec.
+        """
+        echecs = self.sudo().search([
+            ('type_email_agence', '!=', False),
+            ('state', '=', 'exception'),
+            ('failure_type', 'in', ('mail_smtp', 'unknown')),
+            ('nombre_tentatives', '<', EMAIL_TENTATIVES_MAX - 1),
+        ], limit=EMAIL_RELANCE_LOT, order='id')
+        par_tentatives = {}
+        for email in echecs:
+            par_tentatives.setdefault(email.nombre_tentatives, []).append(email.id)
+        maintenant = fields.Datetime.now()
+        dates = []
+        for tentatives, email_ids in par_tentatives.items():
+            date_envoi = maintenant + timedelta(minutes=2 ** (tentatives + 1))
+            self.sudo().browse(email_ids).write({
+                'state': 'outgoing',
+                'failure_reason': False,
+                'failure_type': False,
+                'nombre_tentatives': tentatives + 1,
+                'scheduled_date': date_envoi,
+            })
+            dates.append(date_envoi)
+        if dates:
+            self.env.ref('mail.ir_cron_mail_scheduler_action')._trigger(dates)
+        return len(echecs)
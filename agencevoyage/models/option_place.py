@@ -0,0 +1,169 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+from datetime import timedelta
+
+# Durée par défaut d'une option, en minutes (paramètre agencevoyage.duree_option_minutes)
+DUREE_OPTION_MINUTES = 15
+
+
+class OptionPlace(models.Model):
+    _name = 'agencevoyage.option.place'
+    _description = 'Option de places'
+    _order = 'date_expiration, id'
+
+    name = fields.Char(
+        string='Option',
+        compute='_compute_name'
+    )
+    voyage_id = fields.Many2one(
+        'agencevoyage.voyage',
+        string='Voyage',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    reservation_id = fields.Many2one(
+        'agencevoyage.reservation',
+        string='Réservation',
+        index='btree_not_null',
+        ondelete='set null',
+        help='Réservation à confirmer sur ces places (l\'option est convertie à la confirmation)'
+    )
+    client_id = fields.Many2one(
+        'agencevoyage.client',
+        string='Client',
+        ondelete='set null'
+    )
+    nombre_places = fields.Integer(
+        string='Places',
+        required=True,
+        default=1
+    )
+    date_expiration = fields.Datetime(
+        string='Expire le',
+        required=True,
+        default=lambda self: self._default_date_expiration()
+    )
+    statut = fields.Selection(
+        [
+            ('active', 'En cours'),
+            ('convertie', 'Convertie en réservation'),
+            ('liberee', 'Libérée'),
+            ('expiree', 'Expirée'),
+        ],
+        string='Statut',
+        required=True,
+        default='active',
+        readonly=True
+    )
+
+    _sql_constraints = [
+        ('nombre_places_positif', 'CHECK(nombre_places > 0)',
+         'Une option doit retenir au moins une place.'),
+    ]
+
+    @api.model
+    def _default_date_expiration(self):
+        duree = int(self.env['ir.config_parameter'].sudo().get_param(
+            'agencevoyage.duree_option_minutes', DUREE_OPTION_MINUTES)) or DUREE_OPTION_MINUTES
+        return fields.Datetime.now() + timedelta(minutes=duree)
+
+    @api.depends('voyage_id', 'nombre_places')
+    def _compute_name(self):
+        for record in self:
+            record.name = _('%s - %d place(s)') % (record.voyage_id.titre_voyage or '', record.nombre_places)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Retient les places sur les voyages, en une mise à jour par voyage (refus s'il n'en reste pas assez)"""
+        for vals in vals_list:
+            if vals.get('reservation_id') and not vals.get('client_id'):
+                vals['client_id'] = self.env['agencevoyage.reservation'].browse(vals['reservation_id']).client_id.id
+        options = super(OptionPlace, self).create(vals_list)
+        par_voyage = {}
+        for option in options.filtered(lambda o: o.statut == 'active'):
+            par_voyage[option.voyage_id] = par_voyage.get(option.voyage_id, 0) + option.nombre_places
+        for voyage, places in par_voyage.items():
+            voyage._ajuster_places(optionnees=places)
+        return options
+
+    def write(self, vals):
+        if {'voyage_id', 'nombre_places', 'statut'} & set(vals):
+            raise UserError(_('Une option ne peut pas être modifiée : libérez-la et posez-en une nouvelle.'))
+        return super(OptionPlace, self).write(vals)
+
+    def unlink(self):
+        self._liberer('liberee')
+        return super(OptionPlace, self).unlink()
+
+    def _liberer(self, statut):
+        """Rend au voyage les places des options en cours et les passe au statut `statut`"""
+        actives = self.filtered(lambda o: o.statut == 'active')
+        par_voyage = {}
+        for option in actives:
+            par_voyage[option.voyage_id] = par_voyage.get(option.voyage_id, 0) + option.nombre_places
+        for voyage, places in par_voyage.items():
+            voyage._ajuster_places(optionnees=-places)
+        if actives:
+            super(OptionPlace, actives).write({'statut': statut})
+        return actives
+
+    def action_liberer(self):
+        """Libère les places avant l'échéance (client qui renonce)"""
+        if self.filtered(lambda o: o.statut != 'active'):
+            raise UserError(_('Seules les options en cours peuvent être libérées.'))
+        self._liberer('liberee')
+
+    @api.model
+    def _expirer_options(self, voyage_ids=None):
+        """Libère en une requête toutes les options échues (de tous les voyages ou des voyages `voyage_ids`).
+
+        Les options et les compteurs des voyages sont mis à jour ensemble par
+        une seule instruction SQL, quel que soit le nombre d'options échues.
+
+        :return: nombre d'options expirées
+        """
+        self.env.flush_all()
+        self.env.cr.execute("""
+            WITH expirees AS (
+                UPDATE agencevoyage_option_place
+                   SET statut = 'expiree',
+                       write_uid = %(uid)s,
+                       write_date = %(maintenant)s
+                 WHERE statut = 'active'
+                   AND date_expiration <= %(maintenant)s
+                   AND (%(tous)s OR voyage_id = ANY(%(voyage_ids)s))
+             RETURNING voyage_id, nombre_places
+            ), par_voyage AS (
+                SELECT voyage_id, SUM(nombre_places) AS places, COUNT(*) AS nombre
+                  FROM expirees
+              GROUP BY voyage_id
+            ), voyages AS (
+                UPDATE agencevoyage_voyage v
+                   SET place_optionnee = v.place_optionnee - p.places,
+                       place_disponible = v.place_disponible + p.places
+                  FROM par_voyage p
+                 WHERE v.id = p.voyage_id
+            )
+            SELECT COALESCE(SUM(nombre), 0) FROM par_voyage
+        """, {
+            'uid': self.env.uid,
+            'maintenant': fields.Datetime.now(),
+            'tous': voyage_ids is None,
+            'voyage_ids': list(voyage_ids or []),
+        })
+        nombre = self.env.cr.fetchone()[0]
+        if nombre:
+            self.env['agencevoyage.voyage'].invalidate_model(['place_optionnee', 'place_disponible'])
+            self.invalidate_model(['statut', 'write_uid', 'write_date'])
+        return nombre
+
+    @api.model
+    def _cron_expirer_options(self):
+        return self._expirer_options()
+
+    def init(self):
+        """Index des options en cours par échéance, seul parcouru par l'expiration"""
+        create_index(self.env.cr, 'agencevoyage_option_place_active_expiration_index',
+                     self._table, ['date_expiration'], where="statut = 'active'")
@@ -1,18 +1,30 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from psycopg2 import errors
+
+# Nombre maximum de paiements par lot reçu des terminaux / passerelles
+INGESTION_LOT_MAX = 1000
+
+# Champs acceptés pour un paiement externe
+CHAMPS_INGESTION = (
+    'montant', 'date_paiement', 'type_paiement', 'mode_paiement', 'statut', 'reference_bancaire',
+    'reservation_id', 'client_id', 'type_paiement_client', 'fournisseur_id', 'achat_id',
+)
 
 
 class Paiement(models.Model):
     _name = 'agencevoyage.paiement'
     _description = 'Paiement'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'agencevoyage.export.mixin']
     _rec_name = 'name'
+    _export_nom_fichier = 'paiements'
     _order = 'date_paiement desc'
 
     name = fields.Char(
         string='Numéro de paiement',
         required=True,
-        default=lambda self: self.env['ir.sequence'].next_by_code('agencevoyage.paiement') or 'Nouveau',
+        default='Nouveau',
+        copy=False,
         tracking=True,
         readonly=True
     )
@@ -88,6 +100,22 @@ class Paiement(models.Model):
         string='Référence bancaire',
         tracking=True
     )
+    source_externe = fields.Selection(
+        [
+            ('terminal', 'Terminal de paiement'),
+            ('en_ligne', 'Paiement en ligne'),
+        ],
+        string='Source',
+        readonly=True,
+        copy=False,
+        help='Renseignée pour les paiements reçus par l\'API des terminaux et passerelles de paiement'
+    )
+    cle_idempotence = fields.Char(
+        string='Clé d\'idempotence',
+        readonly=True,
+        copy=False,
+        help='Identifiant unique du paiement chez l\'émetteur : un lot rejoué ne crée pas de doublon'
+    )
     statut = fields.Selection(
         [
             ('en_attente', 'En attente'),
@@ -120,20 +148,37 @@ class Paiement(models.Model):
         digits=(16, 2)
     )
     
-    @api.depends('reservation_id', 'reservation_id.montant_total', 'reservation_id.paiement_ids.montant')
+    _sql_constraints = [
+        ('cle_idempotence_unique', 'UNIQUE(cle_idempotence)',
+         'Un paiement avec cette clé d\'idempotence existe déjà!'),
+    ]
+    
+    @api.depends('type_paiement', 'montant', 'statut', 'reservation_id', 'reservation_id.montant_total',
+                 'reservation_id.paiement_ids.montant', 'reservation_id.paiement_ids.statut')
     def _compute_montants_client(self):
+        """Calcule les montants de tout le lot avec un seul regroupement par réservation.
+        
+        Le déjà payé est la somme des paiements payés de la réservation, dont on
+        retire en mémoire le paiement lui-même tel qu'il est enregistré en base.
+        """
+        paiements_client = self.filtered(lambda r: r.type_paiement == 'encaissement' and r.reservation_id)
+        totaux_payes = {}
+        if paiements_client:
+            totaux_payes = {
+                reservation.id: montant
+                for reservation, montant in self.env['agencevoyage.paiement']._read_group(
+                    [('reservation_id', 'in', paiements_client.reservation_id.ids), ('statut', '=', 'paye')],
+                    ['reservation_id'], ['montant:sum'])
+            }
         for record in self:
             if record.type_paiement == 'encaissement' and record.reservation_id:
                 record.total_a_payer = record.reservation_id.montant_total or 0.0
                 # Calculer le total déjà payé (tous les paiements de cette réservation sauf celui en cours)
-                domain = [
-                    ('reservation_id', '=', record.reservation_id.id),
-                    ('statut', '=', 'paye')
-                ]
-                if isinstance(record.id, int):
-                    domain.append(('id', '!=', record.id))
-                paiements_existants = self.search(domain)
-                record.deja_paye = sum(paiements_existants.mapped('montant'))
+                deja_paye = totaux_payes.get(record.reservation_id.id, 0.0)
+                origine = record._origin
+                if origine and origine.statut == 'paye' and origine.reservation_id == record.reservation_id:
+                    deja_paye -= origine.montant
+                record.deja_paye = deja_paye
                 record.reste_a_payer = record.total_a_payer - record.deja_paye - (record.montant if record.statut == 'paye' else 0)
             else:
                 record.total_a_payer = 0.0
@@ -170,69 +215,80 @@ class Paiement(models.Model):
                 raise ValidationError(_('Le montant doit être strictement positif.'))
     
     def action_imprimer_recu(self):
-        """Action pour imprimer le reçu"""
-        for record in self:
-            if record.statut != 'paye':
-                raise UserError(_('Seuls les paiements payés peuvent être imprimés.'))
-            return {
-                'type': 'ir.actions.report',
-                'report_name': 'agencevoyage.report_paiement',
-                'report_type': 'qweb-pdf',
-                'res_model': 'agencevoyage.paiement',
-                'context': {'active_ids': [record.id]},
-            }
+        """Action pour imprimer les reçus des paiements sélectionnés (un seul PDF)"""
+        if self.filtered(lambda r: r.statut != 'paye'):
+            raise UserError(_('Seuls les paiements payés peuvent être imprimés.'))
+        return self.env.ref('agencevoyage.action_report_paiement').report_action(self)
     
     @api.model
-    def create(self, vals):
-        """Génère automatiquement le numéro de paiement et crée l'opération de caisse"""
-        if vals.get('name', 'Nouveau') == 'Nouveau':
-            if vals.get('type_paiement') == 'encaissement':
-                vals['name'] = self.env['ir.sequence'].next_by_code('agencevoyage.paiement.client') or 'Nouveau'
-            else:
-                vals['name'] = self.env['ir.sequence'].next_by_code('agencevoyage.paiement.fournisseur') or 'Nouveau'
+    def _get_colonnes_export(self):
+        """Colonnes de l'export Excel / CSV des paiements"""
+        return [
+            (_('Numéro'), 'name'),
+            (_('Date'), 'date_paiement'),
+            (_('Type'), 'type_paiement'),
+            (_('Client'), 'client_id.display_name'),
+            (_('Réservation'), 'reservation_id.name'),
+            (_('Fournisseur'), 'fournisseur_id.display_name'),
+            (_('Achat'), 'achat_id.name'),
+            (_('Montant'), 'montant'),
+            (_('Mode Paiement'), 'mode_paiement'),
+            (_('Référence Bancaire'), 'reference_bancaire'),
+            (_('Statut'), 'statut'),
+        ]
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Génère automatiquement les numéros de paiement et crée les opérations de caisse du lot"""
+        sans_numero = [vals for vals in vals_list if vals.get('name', 'Nouveau') == 'Nouveau']
+        for code, type_paiement in (('agencevoyage.paiement.client', 'encaissement'),
+                                    ('agencevoyage.paiement.fournisseur', 'decaissement')):
+            a_numeroter = [
+                vals for vals in sans_numero if (vals.get('type_paiement') or 'encaissement') == type_paiement
+            ]
+            numeros = self.env['ir.sequence']._next_by_code_lot(code, len(a_numeroter))
+            for vals, numero in zip(a_numeroter, numeros):
+                vals['name'] = numero or 'Nouveau'
         
-        paiement = super(Paiement, self).create(vals)
+        paiements = super(Paiement, self).create(vals_list)
         
-        # Créer automatiquement une opération de caisse si le paiement est payé
-        if paiement.statut == 'paye':
-            paiement._create_operation_caisse()
+        # Créer automatiquement les opérations de caisse des paiements payés
+        paiements.filtered(lambda p: p.statut == 'paye')._create_operation_caisse()
         
-        return paiement
+        return paiements
     
     def write(self, vals):
         """Crée ou met à jour l'opération de caisse si le statut change"""
         result = super(Paiement, self).write(vals)
         
-        # Si le statut change vers 'paye', créer l'opération de caisse
+        # Si le statut change vers 'paye', créer les opérations de caisse manquantes
+        # (une recherche et une création pour tout le lot)
         if 'statut' in vals and vals['statut'] == 'paye':
-            for record in self:
-                # Vérifier si une opération de caisse existe déjà
-                existing_caisse = self.env['agencevoyage.caisse'].search([
-                    ('paiement_client_id', '=', record.id) if record.type_paiement == 'encaissement' else ('paiement_fournisseur_id', '=', record.id)
-                ])
-                if not existing_caisse:
-                    record._create_operation_caisse()
+            self._create_operation_caisse()
         
         return result
     
     def _create_operation_caisse(self):
-        """Crée automatiquement une opération de caisse pour ce paiement"""
-        for record in self:
-            if record.statut != 'paye':
-                continue
-            
-            # Vérifier si une opération de caisse existe déjà
-            domain = []
-            if record.type_paiement == 'encaissement':
-                domain = [('paiement_client_id', '=', record.id)]
-            else:
-                domain = [('paiement_fournisseur_id', '=', record.id)]
-            
-            existing = self.env['agencevoyage.caisse'].search(domain)
-            if existing:
-                continue  # L'opération existe déjà
-            
-            # Créer l'opération de caisse
+        """Crée les opérations de caisse des paiements payés qui n'en ont pas encore.
+        
+        Les opérations existantes sont recherchées en une requête pour tout le
+        lot et les opérations manquantes sont créées en une seule création.
+        """
+        paiements = self.filtered(lambda r: r.statut == 'paye')
+        if not paiements:
+            return self.env['agencevoyage.caisse']
+        
+        # Vérifier si une opération de caisse existe déjà
+        Caisse = self.env['agencevoyage.caisse']
+        existants = Caisse.search([
+            '|',
+            ('paiement_client_id', 'in', paiements.ids),
+            ('paiement_fournisseur_id', 'in', paiements.ids),
+        ])
+        deja_lies = existants.paiement_client_id | existants.paiement_fournisseur_id
+        
+        caisse_vals_list = []
+        for record in paiements - deja_lies:
             caisse_vals = {
                 'date_operation': record.date_paiement,
                 'type_operation': 'encaissement' if record.type_paiement == 'encaissement' else 'decaissement',
@@ -246,6 +302,171 @@ class Paiement(models.Model):
                 caisse_vals['paiement_client_id'] = record.id
             else:
                 caisse_vals['paiement_fournisseur_id'] = record.id
-            
-            self.env['agencevoyage.caisse'].create(caisse_vals)
-
+            caisse_vals_list.append(caisse_vals)
+        
+        return Caisse.create(caisse_vals_list)
+    
+    @api.model
+    def ingerer_paiements(self, paiements, source_externe):
+        """Enregistre un lot de paiements reçus d'un terminal ou d'une passerelle de paiement.
+        
+        Chaque paiement porte une clé d'idempotence unique : un lot rejoué
+        n'enregistre rien de plus et renvoie les paiements existants. Les clés
+        déjà connues sont lues en une requête pour tout le lot, les paiements
+        sont validés puis créés en une seule création, avec les contraintes
+        habituelles du modèle.
+        
+        :param paiements: liste de dicts (`cle_idempotence` et valeurs du paiement)
+        :param source_externe: 'terminal' ou 'en_ligne'
+        :return: un résultat par paiement, dans l'ordre du lot :
+                 {'cle_idempotence', 'resultat' ('cree', 'existant' ou 'erreur'), 'id', 'name', 'erreur'}
+        """
+        if source_externe not in dict(self._fields['source_externe'].selection):
+            raise UserError(_('Source de paiement inconnue : %s') % source_externe)
+        if not isinstance(paiements, list):
+            raise UserError(_('Les paiements doivent être envoyés sous forme de liste.'))
+        if len(paiements) > INGESTION_LOT_MAX:
+            raise UserError(_('Un lot ne peut pas dépasser %s paiements.') % INGESTION_LOT_MAX)
+        
+        resultats = []
+        a_valider = {}
+        doublons = []
+        for item in paiements:
+            cle = item.get('cle_idempotence') if isinstance(item, dict) else None
+            resultat = {'cle_idempotence': cle, 'resultat': 'erreur', 'id': False, 'name': False, 'erreur': False}
+            resultats.append(resultat)
+            if not cle or not isinstance(cle, str):
+                resultat['erreur'] = _('Clé d\'idempotence manquante.')
+            elif cle in a_valider:
+                # Même paiement envoyé deux fois dans le lot : même résultat que le premier
+                doublons.append((resultat, a_valider[cle][0]))
+            else:
+                a_valider[cle] = (resultat, item)
+        
+        # Paiements déjà enregistrés : une seule requête pour tout le lot
+        for paiement in self._lire_cles_idempotence(list(a_valider)):
+            resultat = a_valider.pop(paiement.cle_idempotence)[0]
+            resultat.update(resultat='existant', id=paiement.id, name=paiement.name)
+        
+        a_creer = self._valider_paiements_externes(a_valider, source_externe)
+        self._creer_paiements_externes(a_creer)
+        
+        for resultat, premier in doublons:
+            resultat.update({k: v for k, v in premier.items() if k != 'resultat'})
+            resultat['resultat'] = 'existant' if premier['resultat'] != 'erreur' else 'erreur'
+        return resultats
+    
+    @api.model
+    def _lire_cles_idempotence(self, cles):
+        return self.search_fetch([('cle_idempotence', 'in', cles)], ['cle_idempotence', 'name']) if cles else self
+    
+    @api.model
+    def _valider_paiements_externes(self, a_valider, source_externe):
+        """Valide le lot et renvoie {clé: (résultat, valeurs de création)} des paiements valides.
+        
+        Les enregistrements liés (clients, réservations, ...) sont vérifiés par
+        une requête par champ pour tout le lot ; les erreurs sont reportées dans
+        le résultat de chaque paiement.
+        """
+        valeurs = {}
+        references = {}
+        for cle, (resultat, item) in a_valider.items():
+            try:
+                vals = self._convertir_paiement_externe(item)
+            except UserError as e:
+                resultat['erreur'] = str(e)
+                continue
+            vals.update(cle_idempotence=cle, source_externe=source_externe)
+            valeurs[cle] = vals
+            for champ in ('reservation_id', 'client_id', 'fournisseur_id', 'achat_id'):
+                if champ in vals:
+                    references.setdefault(champ, set()).add(vals[champ])
+        
+        existants = {
+            champ: self.env[self._fields[champ].comodel_name].browse(ids).exists()
+            for champ, ids in references.items()
+        }
+        a_creer = {}
+        for cle, vals in valeurs.items():
+            resultat = a_valider[cle][0]
+            manquants = [
+                champ for champ in existants if champ in vals and vals[champ] not in existants[champ].ids
+            ]
+            if manquants:
+                resultat['erreur'] = _('Enregistrement introuvable : %s') % ', '.join(
+                    '%s=%s' % (champ, vals[champ]) for champ in manquants)
+                continue
+            if vals.get('reservation_id') and not vals.get('client_id'):
+                vals['client_id'] = existants['reservation_id'].browse(vals['reservation_id']).client_id.id
+            a_creer[cle] = (resultat, vals)
+        return a_creer
+    
+    @api.model
+    def _convertir_paiement_externe(self, item):
+        """Contrôle et convertit les valeurs d'un paiement externe (sans requête)"""
+        inconnus = set(item) - set(CHAMPS_INGESTION) - {'cle_idempotence'}
+        if inconnus:
+            raise UserError(_('Champs inconnus : %s') % ', '.join(sorted(inconnus)))
+        # 0 et 0.0 sont des valeurs (égales à False mais pas identiques) : seuls les champs vides sont ignorés
+        vals = {
+            champ: item[champ] for champ in CHAMPS_INGESTION
+            if champ in item and item[champ] is not None and item[champ] is not False and item[champ] != ''
+        }
+        for champ in ('montant', 'mode_paiement'):
+            if champ not in vals:
+                raise UserError(_('Champ obligatoire manquant : %s') % champ)
+        if isinstance(vals['montant'], bool) or not isinstance(vals['montant'], (int, float)):
+            raise UserError(_('Montant invalide : %s') % vals['montant'])
+        for champ in ('type_paiement', 'mode_paiement', 'statut', 'type_paiement_client'):
+            if champ in vals and vals[champ] not in dict(self._fields[champ].selection):
+                raise UserError(_('Valeur invalide pour %s : %s') % (champ, vals[champ]))
+        if 'date_paiement' in vals:
+            try:
+                vals['date_paiement'] = fields.Date.to_date(vals['date_paiement'])
+            except (TypeError, ValueError):
+                raise UserError(_('Date invalide : %s') % vals['date_paiement'])
+        for champ in ('reservation_id', 'client_id', 'fournisseur_id', 'achat_id'):
+            if champ in vals and (isinstance(vals[champ], bool) or not isinstance(vals[champ], int)):
+                raise UserError(_('Identifiant invalide pour %s : %s') % (champ, vals[champ]))
+        return vals
+    
+    @api.model
+    def _creer_paiements_externes(self, a_creer):
+        """Crée les paiements validés en une seule création.
+        
+        Si un lot concurrent a enregistré entre-temps certaines clés, elles sont
+        relues et la création est relancée sans elles. Si une contrainte du
+        modèle refuse un paiement, chaque paiement est recréé séparément pour
+        n'écarter que les paiements refusés.
+        """
+        while a_creer:
+            try:
+                with self.env.cr.savepoint():
+                    paiements = self.create([vals for resultat, vals in a_creer.values()])
+            except errors.UniqueViolation:
+                existants = self._lire_cles_idempotence(list(a_creer))
+                if not existants:
+                    raise
+                for paiement in existants:
+                    resultat = a_creer.pop(paiement.cle_idempotence)[0]
+                    resultat.update(resultat='existant', id=paiement.id, name=paiement.name)
+                continue
+            except (ValidationError, UserError):
+                break
+            for (resultat, vals), paiement in zip(a_creer.values(), paiements):
+                resultat.update(resultat='cree', id=paiement.id, name=paiement.name)
+            return
+        
+        for cle, (resultat, vals) in a_creer.items():
+            try:
+                with self.env.cr.savepoint():
+                    paiement = self.create(vals)
+            except errors.UniqueViolation:
+                paiement = self._lire_cles_idempotence([cle])
+                if not paiement:
+                    raise
+                resultat.update(resultat='existant', id=paiement.id, name=paiement.name)
+            except (ValidationError, UserError) as e:
+                resultat['erreur'] = str(e)
+            else:
+                resultat.update(resultat='cree', id=paiement.id, name=paiement.name)
@@ -0,0 +1,162 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import float_compare, split_every
+
+# Réservations recalculées par lot lors de l'application
+RECALCUL_LOT = 500
+
+# Champs calculés par Reservation._compute_prix_total
+CHAMPS_PRIX = ('prix_transport', 'prix_hotel', 'prix_restauration', 'prix_guide', 'prix_equipement', 'montant_total')
+
+
+class RecalculPrix(models.TransientModel):
+    _name = 'agencevoyage.recalcul.prix'
+    _description = 'Recalcul des prix des réservations d\'un voyage'
+
+    voyage_id = fields.Many2one(
+        'agencevoyage.voyage',
+        string='Voyage',
+        required=True,
+        ondelete='cascade'
+    )
+    inclure_confirmees = fields.Boolean(
+        string='Inclure les réservations confirmées',
+        default=True,
+        help='Les réservations en attente sont toujours recalculées ; '
+             'les réservations annulées ou terminées ne le sont jamais'
+    )
+    state = fields.Selection(
+        [
+            ('brouillon', 'Brouillon'),
+            ('simule', 'Simulé'),
+            ('applique', 'Appliqué'),
+        ],
+        string='État',
+        default='brouillon'
+    )
+    ligne_ids = fields.One2many(
+        'agencevoyage.recalcul.prix.ligne',
+        'recalcul_id',
+        string='Réservations modifiées'
+    )
+    nombre_reservations = fields.Integer(
+        string='Réservations modifiées',
+        compute='_compute_totaux'
+    )
+    ecart_total = fields.Float(
+        string='Écart total',
+        compute='_compute_totaux',
+        digits=(16, 2)
+    )
+
+    @api.depends('ligne_ids.ecart')
+    def _compute_totaux(self):
+        for record in self:
+            record.nombre_reservations = len(record.ligne_ids)
+            record.ecart_total = sum(record.ligne_ids.mapped('ecart'))
+
+    def _get_domaine_reservations(self):
+        self.ensure_one()
+        statuts = ['en_attente', 'confirmee'] if self.inclure_confirmees else ['en_attente']
+        return [('voyage_id', '=', self.voyage_id.id), ('statut', 'in', statuts)]
+
+    def action_simuler(self):
+        """Calcule les nouveaux prix sans rien modifier et affiche l'écart par réservation.
+
+        Les réservations sont lues en une requête ; les nouveaux prix sont
+        obtenus par la même arithmétique que Reservation._compute_prix_total,
+        à partir des coûts agrégés du voyage.
+        """
+        self.ensure_one()
+        self.ligne_ids.unlink()
+        self.write({
+            'state': 'simule',
+            'ligne_ids': [(0, 0, vals) for vals in self._calculer_ecarts()],
+        })
+        return self._action_rouvrir()
+
+    def _calculer_ecarts(self):
+        """Valeurs des lignes d'écart : réservations dont le total change avec les prix actuels du voyage"""
+        self.ensure_one()
+        Reservation = self.env['agencevoyage.reservation']
+        voyage = self.voyage_id
+        reservations = Reservation.search_fetch(self._get_domaine_reservations(), [
+            'nombre_adultes', 'nombre_enfants', 'total_personnes', 'prix_hotel', 'supplement_chambre',
+            'montant_total', 'deja_paye',
+        ])
+        lignes = []
+        for reservation in reservations:
+            if not reservation.total_personnes:
+                continue
+            prix = Reservation._calculer_prix_voyage(voyage, reservation.nombre_adultes, reservation.nombre_enfants)
+            nouveau_total = sum(prix.values()) + reservation.prix_hotel + reservation.supplement_chambre
+            if float_compare(nouveau_total, reservation.montant_total, precision_digits=2):
+                lignes.append({
+                    'reservation_id': reservation.id,
+                    'ancien_total': reservation.montant_total,
+                    'nouveau_total': nouveau_total,
+                    'deja_paye': reservation.deja_paye,
+                })
+        return lignes
+
+    def _simulation_a_jour(self):
+        """Vrai si les prix et les réservations du voyage donnent encore les écarts simulés"""
+        self.ensure_one()
+        simules = {
+            ligne.reservation_id.id: (ligne.ancien_total, ligne.nouveau_total)
+            for ligne in self.ligne_ids
+        }
+        actuels = {
+            vals['reservation_id']: (vals['ancien_total'], vals['nouveau_total'])
+            for vals in self._calculer_ecarts()
+        }
+        return simules.keys() == actuels.keys() and all(
+            not float_compare(simule, actuel, precision_digits=2)
+            for reservation_id, totaux in simules.items()
+            for simule, actuel in zip(totaux, actuels[reservation_id])
+        )
+
+    def action_appliquer(self):
+        """Recalcule les prix des réservations simulées, par lots de RECALCUL_LOT.
+
+        Les totaux écrits sont ceux de la simulation : si les prix du voyage ou
+        les réservations ont changé depuis, l'application est refusée.
+        """
+        self.ensure_one()
+        if self.state != 'simule':
+            raise UserError(_('Lancez d\'abord la simulation pour vérifier les nouveaux prix.'))
+        if not self._simulation_a_jour():
+            raise UserError(_('Les prix du voyage ou ses réservations ont changé depuis la simulation. '
+                              'Relancez la simulation pour vérifier les nouveaux prix.'))
+        Reservation = self.env['agencevoyage.reservation']
+        champs = [Reservation._fields[nom] for nom in CHAMPS_PRIX]
+        reservation_ids = self.ligne_ids.reservation_id.ids
+        for lot in split_every(RECALCUL_LOT, reservation_ids, Reservation.browse):
+            for champ in champs:
+                self.env.add_to_compute(champ, lot)
+            # Les restes à payer (réservations et paiements) suivent dans le même lot
+            self.env.flush_all()
+            self.env.invalidate_all()
+        self.state = 'applique'
+        self.voyage_id.message_post(body=_('Prix de %s réservation(s) recalculés par %s (écart total : %.2f)') % (
+            len(reservation_ids), self.env.user.name, self.ecart_total))
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Prix recalculés'),
+                'message': _('Les prix de %s réservation(s) ont été recalculés.') % len(reservation_ids),
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
+            }
+        }
+
+    def _action_rouvrir(self):
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
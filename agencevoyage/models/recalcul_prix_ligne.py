@@ -0,0 +1,56 @@
+from odoo import models, fields, api
+
+
+class RecalculPrixLigne(models.TransientModel):
+    _name = 'agencevoyage.recalcul.prix.ligne'
+    _description = 'Écart de prix d\'une réservation'
+    _order = 'id'
+
+    recalcul_id = fields.Many2one(
+        'agencevoyage.recalcul.prix',
+        string='Recalcul',
+        required=True,
+        ondelete='cascade'
+    )
+    reservation_id = fields.Many2one(
+        'agencevoyage.reservation',
+        string='Réservation',
+        required=True,
+        ondelete='cascade'
+    )
+    client_id = fields.Many2one(
+        related='reservation_id.client_id',
+        string='Client'
+    )
+    statut = fields.Selection(
+        related='reservation_id.statut',
+        string='Statut'
+    )
+    ancien_total = fields.Float(
+        string='Total actuel',
+        digits=(16, 2)
+    )
+    nouveau_total = fields.Float(
+        string='Nouveau total',
+        digits=(16, 2)
+    )
+    deja_paye = fields.Float(
+        string='Déjà payé',
+        digits=(16, 2)
+    )
+    ecart = fields.Float(
+        string='Écart',
+        compute='_compute_ecart',
+        digits=(16, 2)
+    )
+    nouveau_reste = fields.Float(
+        string='Nouveau reste à payer',
+        compute='_compute_ecart',
+        digits=(16, 2)
+    )
+
+    @api.depends('ancien_total', 'nouveau_total', 'deja_paye')
+    def _compute_ecart(self):
+        for record in self:
+            record.ecart = record.nouveau_total - record.ancien_total
+            record.nouveau_reste = record.nouveau_total - record.deja_paye
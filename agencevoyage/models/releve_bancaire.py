@@ -0,0 +1,304 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from lxml import etree
+from .tools import normaliser
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+import base64
+import csv
+import io
+import re
+
+# Écart maximal (en jours) entre la date d'une ligne de relevé et la date du paiement
+FENETRE_JOURS = 3
+
+# Noms de colonnes reconnus dans les relevés CSV
+COLONNES_CSV = {
+    'date': {'date', 'date operation', 'date valeur', 'booking date', 'value date'},
+    'montant': {'montant', 'amount', 'somme'},
+    'credit': {'credit'},
+    'debit': {'debit'},
+    'reference': {'reference', 'ref', 'reference bancaire', 'reference operation'},
+    'libelle': {'libelle', 'description', 'label', 'motif'},
+    'nom_contrepartie': {'nom', 'contrepartie', 'tiers', 'client', 'name', 'counterparty'},
+}
+
+
+def _normaliser_reference(reference):
+    """Référence bancaire sans espaces ni séparateurs, en majuscules"""
+    return re.sub(r'[^A-Z0-9]', '', (reference or '').upper())
+
+
+def _en_centimes(montant):
+    return int(round(abs(montant) * 100))
+
+
+class ReleveBancaire(models.Model):
+    """Relevé bancaire importé et rapproché des paiements"""
+    _name = 'agencevoyage.releve.bancaire'
+    _description = 'Relevé bancaire'
+    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _rec_name = 'name'
+    _order = 'date_import desc, id desc'
+
+    name = fields.Char(
+        string='Relevé',
+        required=True,
+        tracking=True
+    )
+    date_import = fields.Datetime(
+        string='Date d\'import',
+        default=fields.Datetime.now,
+        readonly=True
+    )
+    fichier = fields.Binary(
+        string='Fichier',
+        attachment=True,
+        help='Relevé au format CSV ou XML (CAMT.053 / CAMT.054)'
+    )
+    nom_fichier = fields.Char(
+        string='Nom du fichier'
+    )
+    state = fields.Selection(
+        [
+            ('brouillon', 'Brouillon'),
+            ('importe', 'Importé'),
+            ('rapproche', 'Rapproché'),
+        ],
+        string='État',
+        required=True,
+        default='brouillon',
+        tracking=True
+    )
+    ligne_ids = fields.One2many(
+        'agencevoyage.releve.bancaire.ligne',
+        'releve_id',
+        string='Lignes'
+    )
+    nombre_lignes = fields.Integer(
+        string='Lignes',
+        compute='_compute_nombres'
+    )
+    nombre_rapprochees = fields.Integer(
+        string='Rapprochées',
+        compute='_compute_nombres'
+    )
+    nombre_a_verifier = fields.Integer(
+        string='À vérifier',
+        compute='_compute_nombres'
+    )
+
+    @api.depends('ligne_ids.state')
+    def _compute_nombres(self):
+        comptes = {
+            (releve.id, state): count
+            for releve, state, count in self.env['agencevoyage.releve.bancaire.ligne']._read_group(
+                [('releve_id', 'in', self.ids)], ['releve_id', 'state'], ['__count'])
+        }
+        for record in self:
+            record.nombre_rapprochees = comptes.get((record.id, 'rapproche'), 0)
+            record.nombre_a_verifier = comptes.get((record.id, 'a_verifier'), 0)
+            record.nombre_lignes = record.nombre_rapprochees + record.nombre_a_verifier \
+                + comptes.get((record.id, 'a_rapprocher'), 0)
+
+    def action_importer(self):
+        """Lit le fichier du relevé et crée ses lignes"""
+        for record in self:
+            if not record.fichier:
+                raise UserError(_('Veuillez joindre le fichier du relevé.'))
+            if record.ligne_ids:
+                raise UserError(_('Le relevé %s est déjà importé.') % record.name)
+            contenu = base64.b64decode(record.fichier)
+            if contenu.lstrip().startswith(b'<'):
+                lignes = record._lire_xml(contenu)
+            else:
+                lignes = record._lire_csv(contenu)
+            if not lignes:
+                raise UserError(_('Aucune opération n\'a été trouvée dans le fichier.'))
+            for vals in lignes:
+                vals['releve_id'] = record.id
+            self.env['agencevoyage.releve.bancaire.ligne'].create(lignes)
+            record.state = 'importe'
+        return True
+
+    @api.model
+    def _lire_date(self, valeur):
+        valeur = (valeur or '').strip()[:10]
+        for format_date in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y'):
+            try:
+                return datetime.strptime(valeur, format_date).date()
+            except ValueError:
+                continue
+        raise UserError(_('Date non reconnue dans le relevé : %s') % valeur)
+
+    @api.model
+    def _lire_montant(self, valeur):
+        valeur = re.sub(r'[\s ]', '', valeur or '')
+        if not valeur:
+            return 0.0
+        if ',' in valeur and '.' in valeur:
+            # 1.234,56 ou 1,234.56 : le dernier séparateur est le séparateur décimal
+            millier = '.' if valeur.rfind(',') > valeur.rfind('.') else ','
+            valeur = valeur.replace(millier, '')
+        try:
+            return float(valeur.replace(',', '.'))
+        except ValueError:
+            raise UserError(_('Montant non reconnu dans le relevé : %s') % valeur)
+
+    def _lire_csv(self, contenu):
+        """Lignes d'un relevé CSV (séparateur ; ou ,)"""
+        texte = contenu.decode('utf-8-sig', errors='replace')
+        dialecte = csv.Sniffer().sniff(texte[:4096], delimiters=';,\t')
+        lecteur = csv.reader(io.StringIO(texte), dialecte)
+        entetes = [normaliser(entete) for entete in next(lecteur, [])]
+        positions = {}
+        for cle, noms in COLONNES_CSV.items():
+            for position, entete in enumerate(entetes):
+                if entete in noms:
+                    positions.setdefault(cle, position)
+        if 'date' not in positions or not ({'montant', 'credit', 'debit'} & set(positions)):
+            raise UserError(_('Le relevé CSV doit contenir au moins les colonnes Date et Montant.'))
+
+        def valeur(ligne, cle):
+            position = positions.get(cle)
+            return ligne[position].strip() if position is not None and position < len(ligne) else ''
+
+        lignes = []
+        for ligne in lecteur:
+            if not any(ligne):
+                continue
+            if 'montant' in positions:
+                montant = self._lire_montant(valeur(ligne, 'montant'))
+            else:
+                montant = self._lire_montant(valeur(ligne, 'credit')) - abs(self._lire_montant(valeur(ligne, 'debit')))
+            lignes.append({
+                'date': self._lire_date(valeur(ligne, 'date')),
+                'montant': montant,
+                'reference': valeur(ligne, 'reference'),
+                'libelle': valeur(ligne, 'libelle'),
+                'nom_contrepartie': valeur(ligne, 'nom_contrepartie'),
+            })
+        return lignes
+
+    def _lire_xml(self, contenu):
+        """Lignes d'un relevé ISO 20022 (entrées Ntry d'un CAMT.053 / CAMT.054)"""
+        parser = etree.XMLParser(resolve_entities=False, no_network=True)
+        try:
+            racine = etree.fromstring(contenu, parser)
+        except etree.XMLSyntaxError as e:
+            raise UserError(_('Le fichier XML du relevé est invalide : %s') % e)
+
+        def texte(noeud, chemin):
+            resultat = noeud.xpath('string(%s)' % chemin)
+            return resultat.strip() if resultat else ''
+
+        lignes = []
+        for entree in racine.xpath('//*[local-name()="Ntry"]'):
+            montant = self._lire_montant(texte(entree, './*[local-name()="Amt"]'))
+            if texte(entree, './*[local-name()="CdtDbtInd"]') == 'DBIT':
+                montant = -montant
+            date = texte(entree, './*[local-name()="BookgDt"]/*') or texte(entree, './*[local-name()="ValDt"]/*')
+            details = './/*[local-name()="TxDtls"]'
+            reference = (
+                texte(entree, details + '//*[local-name()="EndToEndId"]')
+                or texte(entree, './*[local-name()="AcctSvcrRef"]')
+                or texte(entree, './*[local-name()="NtryRef"]')
+            )
+            if reference == 'NOTPROVIDED':
+                reference = texte(entree, './*[local-name()="AcctSvcrRef"]')
+            partie = 'Dbtr' if montant > 0 else 'Cdtr'
+            lignes.append({
+                'date': self._lire_date(date),
+                'montant': montant,
+                'reference': reference,
+                'libelle': texte(entree, details + '//*[local-name()="Ustrd"]')
+                           or texte(entree, './*[local-name()="AddtlNtryInf"]'),
+                'nom_contrepartie': texte(entree, details + '//*[local-name()="%s"]/*[local-name()="Nm"]' % partie)
+                                    or texte(entree, details + '//*[local-name()="%s"]//*[local-name()="Nm"]' % partie),
+            })
+        return lignes
+
+    def action_rapprocher(self):
+        """Rapproche les lignes non rapprochées des relevés avec les paiements en attente"""
+        lignes = self.ligne_ids.filtered(lambda l: l.state != 'rapproche')
+        if lignes:
+            self.env['agencevoyage.releve.bancaire.ligne']._rapprocher(lignes)
+        self.filtered(lambda r: r.state == 'importe').state = 'rapproche'
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Rapprochement terminé'),
+                'message': _('%s lignes rapprochées, %s lignes à vérifier.') % (
+                    sum(self.mapped('nombre_rapprochees')), sum(self.mapped('nombre_a_verifier'))),
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
+
+class IndexPaiements:
+    """Index en mémoire des paiements candidats d'un rapprochement.
+
+    Construit une fois par rapprochement à partir d'une seule recherche ;
+    chaque ligne de relevé est ensuite rapprochée par des accès au dictionnaire
+    (référence) ou par dichotomie sur les dates (montant), sans requête.
+    """
+
+    def __init__(self, paiements):
+        self.par_reference = {}
+        self.par_montant = {}
+        self.noms = {}
+        self.utilises = set()
+        for paiement in paiements:
+            reference = _normaliser_reference(paiement.reference_bancaire)
+            if reference:
+                self.par_reference.setdefault(reference, []).append(paiement)
+            cle = (paiement.type_paiement, _en_centimes(paiement.montant))
+            self.par_montant.setdefault(cle, []).append(paiement)
+            tiers = paiement.client_id.nom_complet if paiement.type_paiement == 'encaissement' else paiement.fournisseur_id.nom
+            self.noms[paiement.id] = set(normaliser(tiers).split())
+        for candidats in self.par_montant.values():
+            candidats.sort(key=lambda p: (p.date_paiement, p.id))
+        self.dates = {cle: [p.date_paiement for p in candidats] for cle, candidats in self.par_montant.items()}
+
+    def _disponibles(self, candidats):
+        return [p for p in candidats if p.id not in self.utilises]
+
+    def _nom_correspond(self, paiement, mots_ligne):
+        mots = self.noms.get(paiement.id)
+        return bool(mots) and mots <= mots_ligne
+
+    def rapprocher(self, ligne):
+        """Retourne (paiement, méthode, motif) pour une ligne de relevé"""
+        type_paiement = 'encaissement' if ligne.montant > 0 else 'decaissement'
+        centimes = _en_centimes(ligne.montant)
+        mots_ligne = set(normaliser('%s %s' % (ligne.nom_contrepartie or '', ligne.libelle or '')).split())
+
+        # 1. Référence bancaire (dans la référence ou le libellé de la ligne), même montant
+        references = {_normaliser_reference(ligne.reference)}
+        references.update(_normaliser_reference(mot) for mot in (ligne.libelle or '').split())
+        candidats = [
+            p for reference in references if reference
+            for p in self.par_reference.get(reference, [])
+            if p.type_paiement == type_paiement and _en_centimes(p.montant) == centimes
+        ]
+        candidats = self._disponibles(list(dict.fromkeys(candidats)))
+        if len(candidats) == 1:
+            return candidats[0], 'reference', False
+
+        # 2. Même montant dans la fenêtre de dates
+        cle = (type_paiement, centimes)
+        dates = self.dates.get(cle, [])
+        debut = bisect_left(dates, ligne.date - timedelta(days=FENETRE_JOURS))
+        fin = bisect_right(dates, ligne.date + timedelta(days=FENETRE_JOURS))
+        candidats = self._disponibles(self.par_montant.get(cle, [])[debut:fin])
+        if not candidats:
+            return False, False, _('Aucun paiement en attente de ce montant à ±%s jours.') % FENETRE_JOURS
+        # 3. Nom du client / fournisseur pour départager
+        par_nom = [p for p in candidats if self._nom_correspond(p, mots_ligne)]
+        if len(par_nom) == 1:
+            return par_nom[0], 'montant_nom', False
+        if len(candidats) == 1:
+            return candidats[0], 'montant_date', False
+        return False, False, _('%s paiements en attente possibles.') % len(par_nom or candidats)
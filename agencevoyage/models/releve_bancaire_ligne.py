@@ -0,0 +1,134 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from datetime import timedelta
+from .releve_bancaire import IndexPaiements, FENETRE_JOURS
+
+
+class ReleveBancaireLigne(models.Model):
+    _name = 'agencevoyage.releve.bancaire.ligne'
+    _description = 'Ligne de relevé bancaire'
+    _order = 'releve_id, date, id'
+
+    releve_id = fields.Many2one(
+        'agencevoyage.releve.bancaire',
+        string='Relevé',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    date = fields.Date(
+        string='Date',
+        required=True
+    )
+    montant = fields.Float(
+        string='Montant',
+        required=True,
+        digits=(16, 2),
+        help='Positif pour un crédit (encaissement), négatif pour un débit (décaissement)'
+    )
+    reference = fields.Char(
+        string='Référence'
+    )
+    libelle = fields.Char(
+        string='Libellé'
+    )
+    nom_contrepartie = fields.Char(
+        string='Contrepartie',
+        help='Nom du payeur (crédit) ou du bénéficiaire (débit)'
+    )
+    paiement_id = fields.Many2one(
+        'agencevoyage.paiement',
+        string='Paiement',
+        index=True,
+        ondelete='set null'
+    )
+    state = fields.Selection(
+        [
+            ('a_rapprocher', 'À rapprocher'),
+            ('rapproche', 'Rapprochée'),
+            ('a_verifier', 'À vérifier'),
+        ],
+        string='État',
+        required=True,
+        default='a_rapprocher',
+        index=True
+    )
+    methode = fields.Selection(
+        [
+            ('reference', 'Référence bancaire'),
+            ('montant_nom', 'Montant, date et nom'),
+            ('montant_date', 'Montant et date'),
+            ('manuel', 'Manuel'),
+        ],
+        string='Rapprochée par',
+        readonly=True
+    )
+    motif = fields.Char(
+        string='Motif',
+        readonly=True,
+        help='Raison pour laquelle la ligne n\'a pas pu être rapprochée automatiquement'
+    )
+
+    @api.model
+    def _rapprocher(self, lignes):
+        """Rapproche les lignes données avec les paiements en attente.
+
+        Les paiements candidats sont lus en une seule recherche couvrant la
+        période des lignes, puis indexés en mémoire. Les paiements rapprochés
+        passent à « Payé » en une seule écriture (ce qui crée leurs opérations
+        de caisse) ; les autres lignes sont mises à vérifier.
+        """
+        if not lignes:
+            return
+        dates = lignes.mapped('date')
+        paiements = self.env['agencevoyage.paiement'].search_fetch([
+            ('statut', '=', 'en_attente'),
+            ('date_paiement', '>=', min(dates) - timedelta(days=FENETRE_JOURS)),
+            ('date_paiement', '<=', max(dates) + timedelta(days=FENETRE_JOURS)),
+        ], ['reference_bancaire', 'montant', 'date_paiement', 'type_paiement', 'client_id', 'fournisseur_id'])
+        index = IndexPaiements(paiements)
+
+        rapprochees = {}
+        a_verifier = {}
+        for ligne in lignes:
+            paiement, methode, motif = index.rapprocher(ligne)
+            if paiement:
+                index.utilises.add(paiement.id)
+                rapprochees.setdefault(methode, []).append((ligne, paiement))
+            else:
+                a_verifier.setdefault(motif, []).append(ligne.id)
+
+        for motif, ligne_ids in a_verifier.items():
+            self.browse(ligne_ids).write({'state': 'a_verifier', 'motif': motif, 'paiement_id': False})
+        for methode, couples in rapprochees.items():
+            self.browse([ligne.id for ligne, paiement in couples]).write({
+                'state': 'rapproche',
+                'methode': methode,
+                'motif': False,
+            })
+        liens = [(ligne.id, paiement.id) for couples in rapprochees.values() for ligne, paiement in couples]
+        if liens:
+            # Chaque ligne reçoit son propre paiement : une seule requête pour toutes les lignes
+            self.flush_model(['paiement_id'])
+            self.env.cr.execute("""
+                UPDATE agencevoyage_releve_bancaire_ligne l
+                   SET paiement_id = v.paiement_id
+                  FROM (VALUES %s) AS v(id, paiement_id)
+                 WHERE l.id = v.id
+            """ % ', '.join(['(%s::integer, %s::integer)'] * len(liens)),
+                [param for lien in liens for param in lien])
+            self.browse([ligne_id for ligne_id, paiement_id in liens]).invalidate_recordset(['paiement_id'])
+        paiements_payes = self.env['agencevoyage.paiement'].browse(
+            [paiement.id for couples in rapprochees.values() for ligne, paiement in couples])
+        if paiements_payes:
+            paiements_payes.write({'statut': 'paye'})
+
+    def action_valider_rapprochement(self):
+        """Valide le paiement choisi manuellement pour les lignes à vérifier"""
+        if self.filtered(lambda l: not l.paiement_id):
+            raise UserError(_('Choisissez le paiement correspondant à chaque ligne.'))
+        if len(self.paiement_id) != len(self):
+            raise UserError(_('Un même paiement ne peut pas être rapproché de plusieurs lignes.'))
+        self.write({'state': 'rapproche', 'methode': 'manuel', 'motif': False})
+        self.paiement_id.filtered(lambda p: p.statut == 'en_attente').write({'statut': 'paye'})
+        return True
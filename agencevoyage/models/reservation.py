@@ -1,21 +1,30 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
-import io
-import base64
-from datetime import datetime
+from odoo.tools import split_every
+from odoo.tools.sql import column_exists
+from psycopg2 import DatabaseError, OperationalError
+import logging
+from datetime import timedelta
+
+_logger = logging.getLogger(__name__)
+
+# Débit par défaut de la file d'attente des emails de l'agence (paramètre agencevoyage.emails_par_minute)
+EMAILS_PAR_MINUTE = 200
 
 
 class Reservation(models.Model):
     _name = 'agencevoyage.reservation'
     _description = 'Réservation'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'agencevoyage.export.mixin']
     _rec_name = 'name'
+    _export_nom_fichier = 'reservations'
     _order = 'date_reservation desc'
 
     name = fields.Char(
         string='Réservation',
         required=True,
-        default=lambda self: self.env['ir.sequence'].next_by_code('agencevoyage.reservation') or 'Nouveau',
+        default='Nouveau',
+        copy=False,
         tracking=True,
         readonly=True
     )
@@ -71,6 +80,13 @@ class Reservation(models.Model):
         compute='_compute_nombre_voyageurs',
         store=True
     )
+    places_bloquees = fields.Integer(
+        string='Places tenues',
+        readonly=True,
+        default=0,
+        copy=False,
+        help='Places comptées dans les places réservées du voyage (voyageurs d\'une réservation confirmée)'
+    )
     
     # Chambres
     chambre_ids = fields.One2many(
@@ -127,7 +143,15 @@ class Reservation(models.Model):
     email_confirme = fields.Boolean(
         string='Confirmation envoyée',
         default=False,
-        tracking=True
+        tracking=True,
+        help='Cochée quand l\'email de confirmation a été remis au serveur de messagerie'
+    )
+    
+    # Options de places
+    option_ids = fields.One2many(
+        'agencevoyage.option.place',
+        'reservation_id',
+        string='Options de places'
     )
     
     # Paiements
@@ -159,10 +183,17 @@ class Reservation(models.Model):
             record.nombre_enfants = len(record.voyageur_ids.filtered(lambda v: v.type_voyageur == 'enfant'))
             record.total_personnes = len(record.voyageur_ids)
     
-    @api.depends('voyage_id', 'voyageur_ids', 'chambre_ids', 'supplement_chambre')
+    @api.depends('voyage_id', 'voyageur_ids.type_voyageur', 'chambre_ids.total_chambre', 'supplement_chambre')
     def _compute_prix_total(self):
+        """Calcule le prix à partir des coûts agrégés du voyage, sans parcourir ses composants.
+        
+        Les prix du voyage ne sont volontairement pas dans les dépendances : une
+        modification de tarif ne se répercute sur les réservations existantes
+        que par le recalcul des prix (agencevoyage.recalcul.prix).
+        """
         for record in self:
-            if not record.voyage_id or not record.total_personnes:
+            voyage = record.voyage_id
+            if not voyage or not record.total_personnes:
                 record.prix_transport = 0.0
                 record.prix_hotel = 0.0
                 record.prix_restauration = 0.0
@@ -171,35 +202,11 @@ class Reservation(models.Model):
                 record.montant_total = 0.0
                 continue
             
-            # Prix transport (basé sur les prix du voyage)
-            prix_adulte = record.voyage_id.prix_adulte or 0.0
-            prix_enfant = record.voyage_id.prix_enfant or 0.0
-            record.prix_transport = (prix_adulte * record.nombre_adultes) + (prix_enfant * record.nombre_enfants)
+            record.update(self._calculer_prix_voyage(voyage, record.nombre_adultes, record.nombre_enfants))
             
             # Prix hôtel (basé sur les chambres)
             record.prix_hotel = sum(record.chambre_ids.mapped('total_chambre'))
             
-            # Prix restauration (basé sur les lignes de restauration du voyage)
-            prix_restauration_total = 0.0
-            for restauration in record.voyage_id.restauration_ids:
-                if restauration.type_repas in ['petit_dejeuner', 'dejeuner']:
-                    prix_restauration_total += restauration.prix * record.total_personnes
-                elif restauration.type_repas == 'diner':
-                    prix_restauration_total += restauration.prix * record.total_personnes
-            record.prix_restauration = prix_restauration_total
-            
-            # Prix guide (basé sur les guides du voyage)
-            prix_guide_total = 0.0
-            for guide in record.voyage_id.guide_ids:
-                prix_guide_total += guide.prix / record.total_personnes if record.total_personnes > 0 else 0
-            record.prix_guide = prix_guide_total * record.total_personnes
-            
-            # Prix équipement (basé sur les équipements du voyage)
-            prix_equipement_total = 0.0
-            for equipement in record.voyage_id.equipement_ids:
-                prix_equipement_total += equipement.prix * record.total_personnes
-            record.prix_equipement = prix_equipement_total
-            
             # Total
             record.montant_total = (
                 record.prix_transport +
@@ -210,6 +217,18 @@ class Reservation(models.Model):
                 record.supplement_chambre
             )
     
+    @api.model
+    def _calculer_prix_voyage(self, voyage, nombre_adultes, nombre_enfants):
+        """Prix de la réservation qui dépendent du voyage : transport selon les voyageurs,
+        restauration et équipement par personne, guides au forfait"""
+        personnes = nombre_adultes + nombre_enfants
+        return {
+            'prix_transport': (voyage.prix_adulte * nombre_adultes) + (voyage.prix_enfant * nombre_enfants),
+            'prix_restauration': voyage.cout_restauration_personne * personnes,
+            'prix_guide': voyage.cout_guide_forfait,
+            'prix_equipement': voyage.cout_equipement_personne * personnes,
+        }
+    
     @api.depends('paiement_ids.montant', 'paiement_ids.statut', 'montant_total')
     def _compute_reste_a_payer(self):
         """Calcule le reste à payer pour chaque réservation"""
@@ -221,32 +240,40 @@ class Reservation(models.Model):
             record.deja_paye = sum(paiements_payes.mapped('montant'))
             record.reste_a_payer = record.montant_total - record.deja_paye
     
-    @api.constrains('voyageur_ids', 'voyage_id', 'statut')
+    @api.constrains('voyageur_ids', 'statut')
     def _check_places_disponibles(self):
-        """Vérifie que les places sont disponibles avant confirmation"""
+        """Vérifie qu'une réservation confirmée a des voyageurs (les places sont tenues par _synchroniser_places)"""
         for record in self:
-            if record.statut == 'confirmee' and record.voyage_id:
-                places_necessaires = record.total_personnes
-                if places_necessaires <= 0:
-                    raise ValidationError(_('Veuillez ajouter au moins un voyageur.'))
-                
-                # Compter les places déjà réservées par d'autres réservations confirmées
-                domain = [
-                    ('voyage_id', '=', record.voyage_id.id),
-                    ('statut', '=', 'confirmee')
-                ]
-                if isinstance(record.id, int):
-                    domain.append(('id', '!=', record.id))
-                
-                autres_reservations = self.search(domain)
-                places_deja_reservees = sum(autres_reservations.mapped('total_personnes'))
-                places_disponibles = record.voyage_id.place_total - places_deja_reservees
-                
-                if places_necessaires > places_disponibles:
-                    raise ValidationError(_(
-                        'Pas assez de places disponibles. '
-                        'Places nécessaires: %d, Places disponibles: %d'
-                    ) % (places_necessaires, places_disponibles))
+            if record.statut == 'confirmee' and record.voyage_id and record.total_personnes <= 0:
+                raise ValidationError(_('Veuillez ajouter au moins un voyageur.'))
+    
+    def _synchroniser_places(self):
+        """Reporte sur les voyages les places tenues par les réservations.
+
+        Une réservation confirmée tient une place par voyageur, les autres n'en
+        tiennent aucune. Seul l'écart avec les places déjà tenues est appliqué,
+        en une mise à jour atomique par voyage (voir Voyage._ajuster_places) :
+        le coût ne dépend pas du nombre de réservations du voyage.
+        """
+        ecarts = {}
+        for record in self.exists():
+            places = record.total_personnes if record.statut == 'confirmee' and record.voyage_id else 0
+            if places != record.places_bloquees:
+                ecarts.setdefault(record.voyage_id, []).append((record, places))
+        for voyage, reservations in ecarts.items():
+            voyage._ajuster_places(reservees=sum(
+                places - record.places_bloquees for record, places in reservations))
+            for record, places in reservations:
+                record.places_bloquees = places
+    
+    def _liberer_places(self):
+        """Rend au voyage actuel les places tenues par les réservations"""
+        par_voyage = {}
+        for record in self.filtered(lambda r: r.places_bloquees and r.voyage_id):
+            par_voyage[record.voyage_id] = par_voyage.get(record.voyage_id, self.browse()) | record
+        for voyage, reservations in par_voyage.items():
+            voyage._ajuster_places(reservees=-sum(reservations.mapped('places_bloquees')))
+            reservations.places_bloquees = 0
     
     @api.constrains('date_reservation', 'voyage_id')
     def _check_date_reservation(self):
@@ -258,83 +285,198 @@ class Reservation(models.Model):
                         'La date de réservation doit être antérieure à la date de début du voyage (%s).'
                     ) % record.voyage_id.date_debut)
     
-    def action_confirmer(self):
-        """Confirme la réservation et met à jour les places du voyage"""
+    def _motif_refus_confirmation(self):
+        """Motif pour lequel la réservation ne peut pas être confirmée (False si elle peut l'être)"""
+        self.ensure_one()
+        if self.statut == 'confirmee':
+            return _('Cette réservation est déjà confirmée.')
+        if self.statut == 'annulee':
+            return _('Une réservation annulée ne peut pas être confirmée.')
+        if not self.voyageur_ids:
+            return _('Veuillez ajouter au moins un voyageur avant de confirmer.')
+        return False
+    
+    def _motif_refus_annulation(self):
+        """Motif pour lequel la réservation ne peut pas être annulée (False si elle peut l'être)"""
+        self.ensure_one()
+        if self.statut == 'annulee':
+            return _('Cette réservation est déjà annulée.')
+        if self.statut == 'terminee':
+            return _('Une réservation terminée ne peut pas être annulée.')
+        return False
+    
+    def _confirmer_par_voyage(self):
+        """Confirme les réservations, groupées par voyage.
+        
+        Les réservations d'un même voyage sont confirmées par une seule écriture :
+        la demande cumulée est prise sur le compteur du voyage en une fois. S'il
+        ne reste pas assez de places pour tout le groupe, les réservations sont
+        confirmées une à une dans l'ordre d'arrivée, tant qu'il reste des places.
+        
+        :return: (réservations confirmées, {réservation: motif de refus}, {réservation: erreur})
+        """
+        confirmees = self.browse()
+        refusees = {}
+        echecs = {}
+        par_voyage = {}
         for record in self:
-            if record.statut == 'confirmee':
-                raise UserError(_('Cette réservation est déjà confirmée.'))
-            if record.statut == 'annulee':
-                raise UserError(_('Une réservation annulée ne peut pas être confirmée.'))
-            if not record.voyageur_ids:
-                raise UserError(_('Veuillez ajouter au moins un voyageur avant de confirmer.'))
-            
-            # Vérifier les places disponibles
-            places_necessaires = record.total_personnes
-            domain = [
-                ('voyage_id', '=', record.voyage_id.id),
-                ('statut', '=', 'confirmee')
-            ]
-            if isinstance(record.id, int):
-                domain.append(('id', '!=', record.id))
-            
-            autres_reservations = self.search(domain)
-            places_deja_reservees = sum(autres_reservations.mapped('total_personnes'))
-            places_disponibles = record.voyage_id.place_total - places_deja_reservees
-            
-            if places_necessaires > places_disponibles:
-                raise UserError(_(
-                    'Pas assez de places disponibles. '
-                    'Places nécessaires: %d, Places disponibles: %d'
-                ) % (places_necessaires, places_disponibles))
-            
-            record.statut = 'confirmee'
-            record.message_post(body=_('Réservation confirmée par %s') % self.env.user.name)
-            
-            # Envoyer email de confirmation
-            if record.client_id.email:
-                template = self.env.ref('agencevoyage.email_template_reservation_confirmation', False)
-                if template:
-                    template.send_mail(record.id, force_send=True)
-                    record.email_confirme = True
-            
+            par_voyage[record.voyage_id] = par_voyage.get(record.voyage_id, self.browse()) | record
+        for voyage, reservations in par_voyage.items():
+            try:
+                with self.env.cr.savepoint():
+                    reservations.write({'statut': 'confirmee'})
+                confirmees |= reservations
+                continue
+            except OperationalError:
+                raise
+            except (UserError, ValidationError, DatabaseError) as e:
+                # Le groupe ne passe pas en entier : on confirme ce qui peut l'être, une à une
+                _logger.info("Confirmation groupée refusée pour le voyage %s (%d réservations) : %s",
+                             voyage.id, len(reservations), e)
+            for record in reservations.sorted('id'):
+                try:
+                    with self.env.cr.savepoint():
+                        record.write({'statut': 'confirmee'})
+                    confirmees |= record
+                except UserError as e:
+                    refusees[record] = e.args[0]
+                except OperationalError:
+                    raise
+                except Exception as e:
+                    _logger.exception("Échec de la confirmation de la réservation %s", record.id)
+                    echecs[record] = str(e)
+        return confirmees, refusees, echecs
+    
+    def _notification_bilan(self, titre, traitees, libelle, refusees, echecs=None):
+        """Notification résumant une action de masse : réservations traitées, refusées et en échec"""
+        echecs = echecs or {}
+        message = _('%(traitees)d %(libelle)s, %(refusees)d refusée(s), %(echecs)d en échec.') % {
+            'traitees': len(traitees),
+            'libelle': libelle,
+            'refusees': len(refusees),
+            'echecs': len(echecs),
+        }
+        details = list(refusees.items()) + list(echecs.items())
+        if details:
+            message += '\n' + '\n'.join('%s : %s' % (record.name, motif) for record, motif in details[:10])
+            if len(details) > 10:
+                message += '\n' + _('... et %d autre(s)') % (len(details) - 10)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': titre,
+                'message': message,
+                'type': 'warning' if details else 'success',
+                'sticky': bool(details),
+            }
+        }
+    
+    def action_confirmer(self):
+        """Confirme les réservations sélectionnées et met à jour les places des voyages
+        
+        Une seule réservation : toute erreur est signalée. Une sélection : les
+        réservations sont confirmées par voyage et la notification donne le bilan.
+        """
+        if len(self) == 1:
+            motif = self._motif_refus_confirmation()
+            if motif:
+                raise UserError(motif)
+            # Les places sont prises sur le compteur du voyage (refus s'il n'en reste pas assez)
+            self.statut = 'confirmee'
+            self._notifier_confirmation()
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
                     'title': _('Réservation confirmée'),
-                    'message': _('La réservation %s a été confirmée avec succès.') % record.name,
+                    'message': _('La réservation %s a été confirmée avec succès.') % self.name,
                     'type': 'success',
                     'sticky': False,
                 }
             }
+        confirmees, refusees, echecs = self._confirmer_en_masse()
+        return self._notification_bilan(_('Confirmation des réservations'), confirmees, _('confirmée(s)'), refusees, echecs)
+    
+    def _confirmer_en_masse(self):
+        """Confirme ce qui peut l'être sans interrompre la sélection
+        
+        :return: (réservations confirmées, {réservation: motif de refus}, {réservation: erreur})
+        """
+        refusees = {}
+        for record in self:
+            motif = record._motif_refus_confirmation()
+            if motif:
+                refusees[record] = motif
+        confirmees, refus_places, echecs = (self - self.browse([r.id for r in refusees]))._confirmer_par_voyage()
+        refusees.update(refus_places)
+        confirmees._notifier_confirmation()
+        return confirmees, refusees, echecs
+    
+    def _notifier_confirmation(self):
+        """Message de confirmation dans le suivi et email de confirmation en file d'attente"""
+        if self:
+            body = _('Réservation confirmée par %s') % self.env.user.name
+            self._message_log_batch(bodies={record.id: body for record in self})
+            # Email de confirmation mis en file d'attente (email_confirme est coché à la remise)
+            self._mettre_emails_en_file('agencevoyage.email_template_reservation_confirmation', 'confirmation')
     
     def action_annuler(self):
-        """Annule la réservation"""
+        """Annule les réservations sélectionnées en une écriture (les places sont rendues aux voyages)"""
+        refusees = {}
         for record in self:
-            if record.statut == 'annulee':
-                raise UserError(_('Cette réservation est déjà annulée.'))
-            if record.statut == 'terminee':
-                raise UserError(_('Une réservation terminée ne peut pas être annulée.'))
-            
-            record.statut = 'annulee'
-            record.message_post(body=_('Réservation annulée par %s') % self.env.user.name)
-            
-            # Envoyer email de notification
-            if record.client_id.email:
-                template = self.env.ref('agencevoyage.email_template_reservation_statut_change', False)
-                if template:
-                    template.send_mail(record.id, force_send=True)
-            
+            motif = record._motif_refus_annulation()
+            if motif:
+                if len(self) == 1:
+                    raise UserError(motif)
+                refusees[record] = motif
+        annulees = self - self.browse([r.id for r in refusees])
+        if annulees:
+            annulees.write({'statut': 'annulee'})
+            body = _('Réservation annulée par %s') % self.env.user.name
+            annulees._message_log_batch(bodies={record.id: body for record in annulees})
+            # Email de notification mis en file d'attente
+            annulees._mettre_emails_en_file('agencevoyage.email_template_reservation_statut_change', 'statut')
+        
+        if len(self) == 1:
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
                     'title': _('Réservation annulée'),
-                    'message': _('La réservation %s a été annulée.') % record.name,
+                    'message': _('La réservation %s a été annulée.') % self.name,
                     'type': 'warning',
                     'sticky': False,
                 }
             }
+        return self._notification_bilan(_('Annulation des réservations'), annulees, _('annulée(s)'), refusees)
+    
+    def action_mettre_en_option(self):
+        """Retient les places des voyageurs le temps que le client paie ou se décide"""
+        self.ensure_one()
+        if self.statut != 'en_attente':
+            raise UserError(_('Seule une réservation en attente peut être mise en option.'))
+        if not self.voyageur_ids:
+            raise UserError(_('Veuillez ajouter au moins un voyageur avant de mettre des places en option.'))
+        # Une nouvelle option remplace celle en cours (prolongation)
+        self.option_ids._liberer('liberee')
+        option = self.env['agencevoyage.option.place'].create({
+            'voyage_id': self.voyage_id.id,
+            'reservation_id': self.id,
+            'nombre_places': self.total_personnes,
+        })
+        self.message_post(body=_('%d place(s) en option jusqu\'au %s') % (
+            option.nombre_places, fields.Datetime.to_string(option.date_expiration)))
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Places en option'),
+                'message': _('%d place(s) retenue(s) pour la réservation %s.') % (option.nombre_places, self.name),
+                'type': 'success',
+                'sticky': False,
+            }
+        }
     
     def action_envoyer_rappel_paiement(self):
         """Envoie un email de rappel de paiement au client"""
@@ -345,10 +487,8 @@ class Reservation(models.Model):
             if record.reste_a_payer <= 0:
                 raise UserError(_('Il n\'y a pas de montant restant à payer pour cette réservation.'))
             
-            # Envoyer email de rappel
-            template = self.env.ref('agencevoyage.email_template_rappel_paiement', False)
-            if template:
-                template.send_mail(record.id, force_send=True)
+            # Email de rappel mis en file d'attente
+            if record._mettre_emails_en_file('agencevoyage.email_template_rappel_paiement', 'rappel'):
                 record.message_post(body=_('Rappel de paiement envoyé par %s') % self.env.user.name)
             else:
                 raise UserError(_('Le template d\'email de rappel de paiement n\'a pas été trouvé.'))
@@ -364,97 +504,109 @@ class Reservation(models.Model):
                 }
             }
     
-    def action_export_excel(self):
-        """Exporte les réservations en Excel"""
-        try:
-            import xlsxwriter
-        except ImportError:
-            raise UserError(_('Le module xlsxwriter n\'est pas installé. Veuillez l\'installer avec: pip install xlsxwriter'))
-        
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-        worksheet = workbook.add_worksheet('Réservations')
-        
-        # En-têtes
-        headers = ['Numéro', 'Date', 'Client', 'Voyage', 'Statut', 'Personnes', 'Montant Total', 'Déjà Payé', 'Reste à Payer']
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header)
-        
-        # Données
-        for row, record in enumerate(self, start=1):
-            worksheet.write(row, 0, record.name or '')
-            worksheet.write(row, 1, record.date_reservation.strftime('%d/%m/%Y') if record.date_reservation else '')
-            worksheet.write(row, 2, record.client_id.name if record.client_id else '')
-            worksheet.write(row, 3, record.voyage_id.titre_voyage if record.voyage_id else '')
-            worksheet.write(row, 4, dict(record._fields['statut'].selection).get(record.statut, ''))
-            worksheet.write(row, 5, record.total_personnes)
-            worksheet.write(row, 6, record.montant_total)
-            worksheet.write(row, 7, record.deja_paye)
-            worksheet.write(row, 8, record.reste_a_payer)
-        
-        workbook.close()
-        output.seek(0)
+    def _mettre_emails_en_file(self, template_xmlid, type_email):
+        """Met en file d'attente l'email du modèle pour les réservations, sans attendre le serveur SMTP.
         
-        # Créer l'attachement
-        filename = f'reservations_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'type': 'binary',
-            'datas': base64.b64encode(output.read()),
-            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        })
+        Le modèle est rendu par lots pour toutes les réservations dont le client
+        a un email ; la file d'attente des emails est déclenchée aussitôt. Au-delà
+        du débit configuré, les lots suivants sont programmés de minute en minute.
         
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
+        :return: le modèle d'email (False s'il n'existe pas)
+        """
+        template = self.env.ref(template_xmlid, False)
+        reservations = self.filtered(lambda r: r.client_id.email)
+        if not template or not reservations:
+            return template
+        debit = int(self.env['ir.config_parameter'].sudo().get_param(
+            'agencevoyage.emails_par_minute', EMAILS_PAR_MINUTE)) or EMAILS_PAR_MINUTE
+        maintenant = fields.Datetime.now()
+        dates = []
+        for rang, lot in enumerate(split_every(debit, reservations.ids, list)):
+            date_envoi = maintenant + timedelta(minutes=rang)
+            template.send_mail_batch(lot, email_values={
+                'type_email_agence': type_email,
+                'scheduled_date': date_envoi if rang else False,
+            })
+            dates.append(date_envoi)
+        self.env.ref('mail.ir_cron_mail_scheduler_action')._trigger(dates)
+        return template
     
-    def action_export_csv(self):
-        """Exporte les réservations en CSV"""
-        import csv
-        
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';')
-        
-        # En-têtes
-        writer.writerow(['Numéro', 'Date', 'Client', 'Voyage', 'Statut', 'Personnes', 'Montant Total', 'Déjà Payé', 'Reste à Payer'])
-        
-        # Données
-        for record in self:
-            writer.writerow([
-                record.name or '',
-                record.date_reservation.strftime('%d/%m/%Y') if record.date_reservation else '',
-                record.client_id.name if record.client_id else '',
-                record.voyage_id.titre_voyage if record.voyage_id else '',
-                dict(record._fields['statut'].selection).get(record.statut, ''),
-                record.total_personnes,
-                record.montant_total,
-                record.deja_paye,
-                record.reste_a_payer,
-            ])
-        
-        output.seek(0)
-        
-        # Créer l'attachement
-        filename = f'reservations_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'type': 'binary',
-            'datas': base64.b64encode(output.getvalue().encode('utf-8-sig')),
-            'mimetype': 'text/csv',
-        })
-        
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
+    @api.model
+    def _get_colonnes_export(self):
+        """Colonnes de l'export Excel / CSV des réservations"""
+        return [
+            (_('Numéro'), 'name'),
+            (_('Date'), 'date_reservation'),
+            (_('Client'), 'client_id.display_name'),
+            (_('Voyage'), 'voyage_id.titre_voyage'),
+            (_('Statut'), 'statut'),
+            (_('Personnes'), 'total_personnes'),
+            (_('Montant Total'), 'montant_total'),
+            (_('Déjà Payé'), 'deja_paye'),
+            (_('Reste à Payer'), 'reste_a_payer'),
+        ]
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Génère automatiquement les numéros de réservation, en un seul appel à la séquence"""
+        sans_numero = [vals for vals in vals_list if vals.get('name', 'Nouveau') == 'Nouveau']
+        numeros = self.env['ir.sequence']._next_by_code_lot('agencevoyage.reservation', len(sans_numero))
+        for vals, numero in zip(sans_numero, numeros):
+            vals['name'] = numero or 'Nouveau'
+        reservations = super(Reservation, self).create(vals_list)
+        reservations._synchroniser_places()
+        return reservations
+    
+    def write(self, vals):
+        if 'voyage_id' in vals:
+            # Les places tenues sont rendues à l'ancien voyage avant le changement
+            self._liberer_places()
+        if vals.get('statut') in ('confirmee', 'annulee', 'terminee'):
+            # Les places en option sont rendues avant d'être prises par la confirmation
+            self.option_ids._liberer('convertie' if vals['statut'] == 'confirmee' else 'liberee')
+        result = super(Reservation, self).write(vals)
+        if {'statut', 'voyage_id'} & set(vals):
+            self._synchroniser_places()
+        return result
+    
+    def unlink(self):
+        self._liberer_places()
+        self.option_ids._liberer('liberee')
+        return super(Reservation, self).unlink()
+    
+    def _auto_init(self):
+        # La colonne ajoutée reçoit la valeur par défaut (0) : les places des réservations
+        # confirmées existantes sont reprises juste après sa création
+        nouvelle_colonne = not column_exists(self.env.cr, self._table, 'places_bloquees')
+        result = super(Reservation, self)._auto_init()
+        if nouvelle_colonne:
+            self._initialiser_places_bloquees()
+        return result
     
     @api.model
-    def create(self, vals):
-        """Génère automatiquement le numéro de réservation"""
-        if vals.get('name', 'Nouveau') == 'Nouveau':
-            vals['name'] = self.env['ir.sequence'].next_by_code('agencevoyage.reservation') or 'Nouveau'
-        return super(Reservation, self).create(vals)
+    def _initialiser_places_bloquees(self):
+        """Places tenues des réservations créées avant le compteur de places des voyages.
+
+        Une réservation confirmée tient une place par voyageur ; les places
+        réservées et disponibles des voyages sont recalculées d'après ces places.
+        """
+        self.env.flush_all()
+        self.env.cr.execute("""
+            UPDATE agencevoyage_reservation r
+               SET places_bloquees = CASE WHEN r.statut = 'confirmee' AND r.voyage_id IS NOT NULL
+                                          THEN (SELECT COUNT(*) FROM agencevoyage_voyageur v
+                                                 WHERE v.reservation_id = r.id)
+                                          ELSE 0 END
+        """)
+        self.env.cr.execute("""
+            UPDATE agencevoyage_voyage v
+               SET place_reserve = t.places,
+                   place_disponible = v.place_total - t.places - COALESCE(v.place_optionnee, 0)
+              FROM (SELECT voyage.id, COALESCE(SUM(r.places_bloquees), 0) AS places
+                      FROM agencevoyage_voyage voyage
+                 LEFT JOIN agencevoyage_reservation r ON r.voyage_id = voyage.id
+                  GROUP BY voyage.id) t
+             WHERE t.id = v.id
+        """)
+        self.env.invalidate_all()
 
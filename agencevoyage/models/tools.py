@@ -0,0 +1,8 @@
+import re
+import unicodedata
+
+
+def normaliser(texte):
+    """Texte en minuscules, sans accents ni ponctuation (en-têtes de fichiers, noms à comparer)"""
+    texte = unicodedata.normalize('NFKD', texte or '').encode('ascii', 'ignore').decode()
+    return ' '.join(re.findall(r'[a-z0-9]+', texte.lower()))
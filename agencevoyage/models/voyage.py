@@ -1,5 +1,8 @@
-from odoo import models, fields, api
-from odoo.exceptions import ValidationError
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError, UserError
+
+# Repas inclus dans le prix des réservations (les collations ne sont pas facturées)
+REPAS_FACTURES = ('petit_dejeuner', 'dejeuner', 'diner')
 
 
 class Voyage(models.Model):
@@ -69,10 +72,18 @@ class Voyage(models.Model):
     )
     place_reserve = fields.Integer(
         string='Places réservées',
-        compute='_compute_place_reserve',
-        store=True,
-        tracking=True,
-        help='Nombre de places déjà réservées (calculé automatiquement)'
+        readonly=True,
+        default=0,
+        copy=False,
+        help='Nombre de places tenues par les réservations confirmées '
+             '(mis à jour à chaque confirmation, annulation ou changement de voyageurs)'
+    )
+    place_optionnee = fields.Integer(
+        string='Places en option',
+        readonly=True,
+        default=0,
+        copy=False,
+        help='Places retenues temporairement par les options en cours (paiement en ligne, client au guichet)'
     )
     
     # Relation avec les réservations
@@ -146,20 +157,78 @@ class Voyage(models.Model):
         string='Équipements'
     )
     
-    @api.depends('reservation_ids', 'reservation_ids.statut', 'reservation_ids.total_personnes')
-    def _compute_place_reserve(self):
-        """Calcule automatiquement le nombre de places réservées depuis les réservations confirmées"""
+    # Coûts des composants agrégés par voyage (utilisés pour le prix des réservations)
+    cout_restauration_personne = fields.Float(
+        string='Restauration par personne',
+        compute='_compute_couts_composants',
+        store=True,
+        digits=(16, 2),
+        help='Somme des repas facturés (petit-déjeuner, déjeuner, dîner) pour une personne'
+    )
+    cout_guide_forfait = fields.Float(
+        string='Forfait guides',
+        compute='_compute_couts_composants',
+        store=True,
+        digits=(16, 2),
+        help='Prix des guides, facturé une fois par réservation'
+    )
+    cout_equipement_personne = fields.Float(
+        string='Équipement par personne',
+        compute='_compute_couts_composants',
+        store=True,
+        digits=(16, 2)
+    )
+    
+    def _ajuster_places(self, reservees=0, optionnees=0):
+        """Ajoute des places réservées et/ou en option (négatif pour en libérer) aux compteurs du voyage.
+
+        La mise à jour est une seule requête conditionnelle : une prise de places
+        ne s'applique que s'il en reste assez, et la ligne du voyage reste
+        verrouillée jusqu'à la fin de la transaction. Deux confirmations ou
+        options simultanées des dernières places ne peuvent donc pas surréserver
+        le voyage. Faute de place, les options échues du voyage sont d'abord
+        libérées sans attendre la tâche planifiée.
+        """
+        self.ensure_one()
+        if not reservees and not optionnees:
+            return
+        for tentative in range(2):
+            self.flush_recordset(['place_total', 'place_reserve', 'place_optionnee', 'place_disponible'])
+            self.env.cr.execute("""
+                UPDATE agencevoyage_voyage
+                   SET place_reserve = place_reserve + %(reservees)s,
+                       place_optionnee = place_optionnee + %(optionnees)s,
+                       place_disponible = place_total - place_reserve - place_optionnee - %(reservees)s - %(optionnees)s
+                 WHERE id = %(id)s
+                   AND (%(reservees)s + %(optionnees)s <= 0
+                        OR place_reserve + place_optionnee + %(reservees)s + %(optionnees)s <= place_total)
+             RETURNING place_reserve
+            """, {'id': self.id, 'reservees': reservees, 'optionnees': optionnees})
+            mis_a_jour = self.env.cr.fetchone()
+            self.invalidate_recordset(['place_reserve', 'place_optionnee', 'place_disponible'])
+            if mis_a_jour or tentative or not self.env['agencevoyage.option.place']._expirer_options(self.ids):
+                break
+        if not mis_a_jour:
+            raise UserError(_(
+                'Pas assez de places disponibles. '
+                'Places nécessaires: %d, Places disponibles: %d'
+            ) % (reservees + optionnees, self.place_disponible))
+    
+    @api.depends('restauration_ids.prix', 'restauration_ids.type_repas', 'guide_ids.prix', 'equipement_ids.prix')
+    def _compute_couts_composants(self):
+        """Agrège une fois par voyage les prix des composants facturés dans les réservations"""
         for record in self:
-            # Compter uniquement les réservations confirmées
-            reservations_confirmees = record.reservation_ids.filtered(
-                lambda r: r.statut == 'confirmee'
+            record.cout_restauration_personne = sum(
+                restauration.prix for restauration in record.restauration_ids
+                if restauration.type_repas in REPAS_FACTURES
             )
-            record.place_reserve = sum(reservations_confirmees.mapped('total_personnes'))
+            record.cout_guide_forfait = sum(record.guide_ids.mapped('prix'))
+            record.cout_equipement_personne = sum(record.equipement_ids.mapped('prix'))
     
-    @api.depends('place_total', 'place_reserve')
+    @api.depends('place_total', 'place_reserve', 'place_optionnee')
     def _compute_place_disponible(self):
         for record in self:
-            record.place_disponible = record.place_total - record.place_reserve
+            record.place_disponible = record.place_total - record.place_reserve - record.place_optionnee
     
     @api.depends('date_debut', 'date_fin')
     def _compute_statut_voyage(self):
@@ -177,6 +246,30 @@ class Voyage(models.Model):
             else:
                 record.statut_voyage = 'planifie'
     
+    def action_recalculer_prix_reservations(self):
+        """Ouvre le recalcul des prix des réservations après un changement de tarif"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'Recalculer les prix des réservations',
+            'res_model': 'agencevoyage.recalcul.prix',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {'default_voyage_id': self.id},
+        }
+    
+    def action_importer_groupe(self):
+        """Ouvre l'import d'un groupe de voyageurs (fichier CSV ou XLSX)"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'Importer un groupe',
+            'res_model': 'agencevoyage.import.groupe',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {'default_voyage_id': self.id},
+        }
+    
     # Contraintes
     @api.constrains('date_debut', 'date_fin')
     def _check_dates(self):
@@ -185,11 +278,13 @@ class Voyage(models.Model):
                 if record.date_fin < record.date_debut:
                     raise ValidationError("La date de fin doit être postérieure à la date de début.")
     
-    @api.constrains('place_reserve', 'place_total')
+    @api.constrains('place_reserve', 'place_optionnee', 'place_total')
     def _check_places(self):
         for record in self:
             if record.place_reserve < 0:
                 raise ValidationError("Le nombre de places réservées ne peut pas être négatif.")
             if record.place_reserve > record.place_total:
                 raise ValidationError("Le nombre de places réservées (%d) ne peut pas dépasser le nombre total de places (%d)." % (record.place_reserve, record.place_total))
+            if record.place_reserve + record.place_optionnee > record.place_total:
+                raise ValidationError("Les places réservées et en option (%d) ne peuvent pas dépasser le nombre total de places (%d)." % (record.place_reserve + record.place_optionnee, record.place_total))
 
@@ -30,4 +30,22 @@ class Voyageur(models.Model):
         help='Âge du voyageur (pour les enfants)'
     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        voyageurs = super(Voyageur, self).create(vals_list)
+        # Une réservation confirmée prend une place de plus par voyageur
+        voyageurs.reservation_id._synchroniser_places()
+        return voyageurs
 
+    def write(self, vals):
+        reservations = self.reservation_id
+        result = super(Voyageur, self).write(vals)
+        if 'reservation_id' in vals:
+            (reservations | self.reservation_id)._synchroniser_places()
+        return result
+
+    def unlink(self):
+        reservations = self.reservation_id
+        result = super(Voyageur, self).unlink()
+        reservations._synchroniser_places()
+        return result
@@ -1,5 +1,14 @@
 from . import test_reservation
 from . import test_caisse
+from . import test_caisse_concurrence
+from . import test_reservation_concurrence
 from . import test_paiement
 from . import test_voyage
-
+from . import test_export_job
+from . import test_releve_bancaire
+from . import test_paiement_ingestion
+from . import test_balance_agee
+from . import test_option_place
+from . import test_import_groupe
+from . import test_client
+from . import test_rapport
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+from datetime import date, timedelta
+
+
+class TestBalanceAgee(TransactionCase):
+    """Tests pour la balance âgée des clients"""
+
+    def setUp(self):
+        super(TestBalanceAgee, self).setUp()
+        
+        self.client = self.env['agencevoyage.client'].create({
+            'nom': 'Dupont',
+            'prenom': 'Jean',
+            'email': 'jean.dupont@test.com',
+            'telephone': '0123456789',
+            'adresse': '123 Rue Test',
+            'nationalite': 'Française',
+            'sexe': 'masculin',
+        })
+        destination = self.env['agencevoyage.destination'].create({
+            'nom_lieu': 'Paris',
+            'ville': 'Paris',
+            'pays': 'France',
+            'adresse': 'Paris, France',
+        })
+        aujourdhui = date.today()
+        self.voyage_futur = self._voyage(destination, aujourdhui + timedelta(days=20))
+        self.voyage_passe = self._voyage(destination, aujourdhui - timedelta(days=70))
+        
+        # 1 000 dus par réservation (2 adultes à 500)
+        self._reservation(self.voyage_futur, aujourdhui - timedelta(days=10))
+        self._reservation(self.voyage_futur, aujourdhui - timedelta(days=45))
+        self._reservation(self.voyage_passe, aujourdhui - timedelta(days=80))
+        self._reservation(self.voyage_passe, aujourdhui - timedelta(days=120))
+        # Non confirmée : hors balance
+        self._reservation(self.voyage_futur, aujourdhui, statut='en_attente')
+
+    def _voyage(self, destination, date_debut):
+        return self.env['agencevoyage.voyage'].create({
+            'titre_voyage': 'Voyage %s' % date_debut,
+            'destination_id': destination.id,
+            'ville_depart': 'Lyon',
+            'date_debut': date_debut,
+            'date_fin': date_debut + timedelta(days=7),
+            'prix_adulte': 500.0,
+            'prix_enfant': 300.0,
+            'place_total': 20,
+        })
+
+    def _reservation(self, voyage, date_reservation, statut='confirmee'):
+        return self.env['agencevoyage.reservation'].create({
+            'client_id': self.client.id,
+            'voyage_id': voyage.id,
+            'date_reservation': date_reservation,
+            'statut': statut,
+            'voyageur_ids': [
+                (0, 0, {'nom': 'Voyageur 1', 'type_voyageur': 'adulte'}),
+                (0, 0, {'nom': 'Voyageur 2', 'type_voyageur': 'adulte'}),
+            ],
+        })
+
+    def _ligne(self, base_calcul):
+        self.env.flush_all()
+        return self.env['agencevoyage.balance.agee'].search([
+            ('client_id', '=', self.client.id), ('base_calcul', '=', base_calcul),
+        ])
+
+    def test_tranches_depuis_reservation(self):
+        """Test des tranches d'ancienneté depuis la date de réservation"""
+        ligne = self._ligne('reservation')
+        self.assertEqual(ligne.nombre_reservations, 4)
+        self.assertEqual(ligne.montant_0_30, 1000.0)
+        self.assertEqual(ligne.montant_31_60, 1000.0)
+        self.assertEqual(ligne.montant_61_90, 1000.0)
+        self.assertEqual(ligne.montant_plus_90, 1000.0)
+        self.assertEqual(ligne.montant_total, 4000.0)
+        self.assertEqual(ligne.anciennete_max, 120)
+
+    def test_tranches_depuis_depart(self):
+        """Test des tranches d'ancienneté depuis la date de départ et prise en compte des paiements"""
+        reservation = self.env['agencevoyage.reservation'].search([
+            ('voyage_id', '=', self.voyage_passe.id)], limit=1)
+        self.env['agencevoyage.paiement'].create({
+            'reservation_id': reservation.id,
+            'client_id': self.client.id,
+            'type_paiement': 'encaissement',
+            'montant': 400.0,
+            'date_paiement': date.today(),
+            'mode_paiement': 'especes',
+        })
+        ligne = self._ligne('depart')
+        # Départs à venir dans la première tranche, départ il y a 70 jours dans la troisième
+        self.assertEqual(ligne.montant_0_30, 2000.0)
+        self.assertEqual(ligne.montant_61_90, 1600.0)
+        self.assertEqual(ligne.montant_plus_90, 0.0)
+        self.assertEqual(ligne.montant_total, 3600.0)
+        
+        # Regroupement du pivot sur la vue
+        groupes = self.env['agencevoyage.balance.agee']._read_group(
+            [('base_calcul', '=', 'depart'), ('client_id', '=', self.client.id)],
+            ['client_id'], ['montant_61_90:sum'])
+        self.assertEqual(groupes[0][1], 1600.0)
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from odoo.tests.common import TransactionCase
-from odoo.exceptions import ValidationError
-from datetime import date
+from odoo.exceptions import ValidationError, UserError
+from odoo.addons.agencevoyage.models.caisse import SEQUENCEMENT_CLE
+from datetime import date, timedelta
+import io
 
 
 class TestCaisse(TransactionCase):
@@ -21,6 +23,13 @@ class TestCaisse(TransactionCase):
             'sexe': 'masculin',
         })
 
+    def _sequencer(self):
+        """Séquence les registres comme après la validation de la transaction (jamais validée en test)"""
+        Caisse = self.env['agencevoyage.caisse']
+        planifie = self.env.cr.postcommit.data.pop(SEQUENCEMENT_CLE, {'positions': {}})
+        for registre_id, position in planifie['positions'].items():
+            Caisse._sequencer_registre(registre_id, position)
+
     def test_create_encaissement(self):
         """Test de création d'un encaissement"""
         # Créer un nouveau paiement pour ce test
@@ -112,3 +121,235 @@ class TestCaisse(TransactionCase):
         caisse.action_annuler()
         self.assertEqual(caisse.statut, 'annule')
 
+
+    def test_operation_antidatee_recalcule_suite(self):
+        """Test qu'une opération antidatée décale le solde des opérations suivantes"""
+        op_recente = self.env['agencevoyage.caisse'].create({
+            'date_operation': date.today(),
+            'type_operation': 'encaissement',
+            'montant': 1000.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        solde_avant_initial = op_recente.solde_avant
+        
+        # Insérer une opération dans le passé
+        self.env['agencevoyage.caisse'].create({
+            'date_operation': date.today() - timedelta(days=10),
+            'type_operation': 'encaissement',
+            'montant': 250.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        # La transaction du caissier n'écrit que sa propre opération
+        self.assertEqual(op_recente.solde_avant, solde_avant_initial)
+        
+        self._sequencer()
+        self.assertEqual(op_recente.solde_avant, solde_avant_initial + 250.0)
+        self.assertEqual(op_recente.solde_apres, solde_avant_initial + 1250.0)
+
+    def test_annulation_recalcule_suite(self):
+        """Test que l'annulation d'une opération recalcule les opérations suivantes"""
+        op1 = self.env['agencevoyage.caisse'].create({
+            'date_operation': date.today() - timedelta(days=1),
+            'type_operation': 'encaissement',
+            'montant': 400.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        op2 = self.env['agencevoyage.caisse'].create({
+            'date_operation': date.today(),
+            'type_operation': 'decaissement',
+            'montant': 100.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        self.assertEqual(op2.solde_avant, op1.solde_apres)
+        
+        op1.action_annuler()
+        self.assertEqual(op1.solde_apres, op1.solde_avant)
+        self._sequencer()
+        self.assertEqual(op2.solde_avant, op1.solde_avant)
+        self.assertEqual(op2.solde_apres, op1.solde_avant - 100.0)
+
+    def test_checkpoint_journalier(self):
+        """Test de la clôture journalière et de son invalidation"""
+        Checkpoint = self.env['agencevoyage.caisse.checkpoint']
+        jour = date.today() - timedelta(days=2)
+        op = self.env['agencevoyage.caisse'].create({
+            'date_operation': jour,
+            'type_operation': 'encaissement',
+            'montant': 600.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        Checkpoint._creer_checkpoints()
+        checkpoint = Checkpoint.search([('date', '=', jour)])
+        self.assertEqual(len(checkpoint), 1)
+        self.assertEqual(checkpoint.solde, op.solde_apres)
+        
+        solde_cloture = checkpoint.solde
+
+        # Une opération antérieure invalide la clôture, réécrite par le séquencement
+        self.env['agencevoyage.caisse'].create({
+            'date_operation': jour - timedelta(days=1),
+            'type_operation': 'decaissement',
+            'montant': 100.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        self.assertEqual(Checkpoint.search([('date', '=', jour)]).solde, solde_cloture)
+        self._sequencer()
+        checkpoint = Checkpoint.search([('date', '=', jour)])
+        self.assertEqual(len(checkpoint), 1)
+        self.assertEqual(checkpoint.solde, solde_cloture - 100.0)
+        self.assertEqual(checkpoint.solde, op.solde_apres)
+        self.assertEqual(op.solde_actuel, op._get_solde_avant_position(op.registre_id.id, 'infinity'))
+
+    def test_solde_actuel_maintenu(self):
+        """Test que le solde actuel déjà lu suit les créations, annulations et suppressions"""
+        Caisse = self.env['agencevoyage.caisse']
+        registre = self.env['agencevoyage.caisse.registre']._get_registre_utilisateur()
+        solde_initial = Caisse._get_solde_avant_position(registre.id, 'infinity')
+        op1 = Caisse.create({
+            'date_operation': date.today(),
+            'type_operation': 'encaissement',
+            'montant': 800.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        self.assertEqual(op1.solde_actuel, solde_initial + 800.0)
+        solde_consolide = op1.solde_consolide
+        
+        # Même enregistrement relu : la valeur en cache ne doit pas survivre à la création
+        op2 = Caisse.create({
+            'date_operation': date.today() - timedelta(days=3),
+            'type_operation': 'decaissement',
+            'montant': 150.0,
+            'mode_paiement': 'cheque',
+            'statut': 'valide',
+        })
+        self.assertEqual(op1.solde_actuel, solde_initial + 650.0)
+        self.assertEqual(op1.solde_consolide, solde_consolide - 150.0)
+        self.assertEqual(op2.solde_actuel, solde_initial + 650.0)
+        
+        op1.action_annuler()
+        self.assertEqual(op1.solde_actuel, solde_initial - 150.0)
+        self.assertEqual(op2.solde_actuel, solde_initial - 150.0)
+        
+        op2.unlink()
+        self.assertEqual(op1.solde_actuel, solde_initial)
+        self.assertEqual(op1.solde_actuel, Caisse._get_solde_avant_position(registre.id, 'infinity'))
+        
+        # Le séquencement reprend la position de l'opération supprimée
+        self._sequencer()
+        self.assertFalse(self.env['agencevoyage.caisse.recalcul'].search([('registre_id', '=', registre.id)]))
+        self.assertEqual(op1.solde_actuel, solde_initial)
+        self.assertEqual(op1.solde_avant, solde_initial)
+
+    def test_periode_cloturee(self):
+        """Test qu'une période clôturée est figée"""
+        jour = date.today() - timedelta(days=5)
+        op = self.env['agencevoyage.caisse'].create({
+            'date_operation': jour,
+            'type_operation': 'encaissement',
+            'montant': 300.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        cloture = self.env['agencevoyage.caisse.cloture'].create({
+            'type_cloture': 'journaliere',
+            'date_cloture': jour,
+        })
+        self.assertEqual(cloture.solde, op.solde_apres)
+        self.assertTrue(op.periode_cloturee)
+        
+        with self.assertRaises(UserError):
+            op.write({'montant': 350.0})
+        with self.assertRaises(UserError):
+            op.action_annuler()
+        with self.assertRaises(UserError):
+            op.unlink()
+        with self.assertRaises(UserError):
+            self.env['agencevoyage.caisse'].create({
+                'date_operation': jour - timedelta(days=1),
+                'type_operation': 'encaissement',
+                'montant': 50.0,
+                'mode_paiement': 'especes',
+                'statut': 'valide',
+            })
+        
+        # Les opérations après la clôture restent possibles et partent du solde figé
+        op_apres = self.env['agencevoyage.caisse'].create({
+            'date_operation': jour + timedelta(days=1),
+            'type_operation': 'encaissement',
+            'montant': 20.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        self.assertEqual(op_apres.solde_avant, cloture.solde)
+
+    def test_registres_independants(self):
+        """Test que chaque registre a sa propre chaîne de soldes et que le total est consolidé"""
+        Caisse = self.env['agencevoyage.caisse']
+        guichet_a = self.env['agencevoyage.caisse.registre'].create({'name': 'Guichet A', 'code': 'TEST-A'})
+        guichet_b = self.env['agencevoyage.caisse.registre'].create({'name': 'Guichet B', 'code': 'TEST-B'})
+        consolide_initial = Caisse.new({'registre_id': guichet_a.id}).solde_consolide
+        
+        op_a = Caisse.create({
+            'registre_id': guichet_a.id,
+            'date_operation': date.today(),
+            'type_operation': 'encaissement',
+            'montant': 500.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        op_b = Caisse.create({
+            'registre_id': guichet_b.id,
+            'date_operation': date.today(),
+            'type_operation': 'encaissement',
+            'montant': 200.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        
+        self.assertEqual(op_a.solde_avant, 0.0)
+        self.assertEqual(op_b.solde_avant, 0.0)
+        self.assertEqual(op_a.solde_actuel, 500.0)
+        self.assertEqual(op_b.solde_actuel, 200.0)
+        self.assertEqual(op_a.solde_consolide, consolide_initial + 700.0)
+        
+        # Transférer l'opération vers l'autre registre recalcule les deux chaînes
+        op_a.registre_id = guichet_b
+        self._sequencer()
+        self.assertEqual(guichet_a._get_solde(), 0.0)
+        self.assertEqual(guichet_b._get_solde(), 700.0)
+        self.assertEqual(op_a.solde_avant, 0.0)
+        self.assertEqual(op_b.solde_avant, 500.0)
+        self.assertEqual(op_b.solde_apres, 700.0)
+
+    def test_export_csv(self):
+        """Test de l'export CSV du journal de caisse par lots"""
+        operations = self.env['agencevoyage.caisse'].create({
+            'date_operation': date.today(),
+            'type_operation': 'decaissement',
+            'montant': 75.0,
+            'mode_paiement': 'cheque',
+            'statut': 'valide',
+        })
+        operations |= self.env['agencevoyage.caisse'].create({
+            'date_operation': date.today(),
+            'type_operation': 'encaissement',
+            'montant': 125.0,
+            'mode_paiement': 'especes',
+            'statut': 'valide',
+        })
+        fichier = io.BytesIO()
+        operations._ecrire_export(fichier, 'csv')
+        lignes = fichier.getvalue().decode('utf-8-sig').splitlines()
+        
+        self.assertEqual(len(lignes), 3)
+        self.assertTrue(lignes[0].startswith('Numéro;Date;Registre;Type'))
+        self.assertIn('Décaissement', lignes[1])
+        self.assertIn('Chèque', lignes[1])
+        self.assertIn(date.today().strftime('%d/%m/%Y'), lignes[2])
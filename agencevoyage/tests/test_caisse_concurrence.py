@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import threading
+from datetime import date, timedelta
+
+import odoo
+from odoo import api, SUPERUSER_ID
+from odoo.tests.common import BaseCase, get_db_name, tagged
+
+
+@tagged('-at_install', 'post_install')
+class TestCaisseConcurrence(BaseCase):
+    """Tests d'enregistrement simultané d'opérations de caisse.
+
+    Contrairement aux autres tests, chaque caissier travaille dans sa propre
+    transaction validée : les données sont supprimées à la fin du test.
+    """
+
+    NOMBRE_CAISSIERS = 4
+    OPERATIONS_PAR_CAISSIER = 10
+
+    def setUp(self):
+        super(TestCaisseConcurrence, self).setUp()
+        self.registry = odoo.registry(get_db_name())
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            self.registre_id = env['agencevoyage.caisse.registre'].create({
+                'name': 'Guichet concurrence',
+                'code': 'TEST-CONCURRENCE',
+            }).id
+        self.addCleanup(self._nettoyer)
+
+    def _nettoyer(self):
+        with self.registry.cursor() as cr:
+            cr.execute("SELECT id FROM agencevoyage_caisse WHERE registre_id = %s", (self.registre_id,))
+            operation_ids = tuple(row[0] for row in cr.fetchall()) or (0,)
+            cr.execute("""
+                DELETE FROM mail_message
+                 WHERE (model = 'agencevoyage.caisse' AND res_id IN %s)
+                    OR (model = 'agencevoyage.caisse.registre' AND res_id = %s)
+            """, (operation_ids, self.registre_id))
+            cr.execute("DELETE FROM agencevoyage_caisse WHERE registre_id = %s", (self.registre_id,))
+            cr.execute("DELETE FROM agencevoyage_caisse_registre WHERE id = %s", (self.registre_id,))
+
+    def _caissier(self, numero, depart, erreurs, jours=1):
+        """Enregistre des opérations, une transaction par opération.
+
+        :param jours: nombre de journées sur lesquelles les opérations sont
+            réparties (aujourd'hui et les jours précédents, dans le désordre)
+        """
+        depart.wait()
+        try:
+            for i in range(self.OPERATIONS_PAR_CAISSIER):
+                with self.registry.cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    env['agencevoyage.caisse'].create({
+                        'registre_id': self.registre_id,
+                        'date_operation': date.today() - timedelta(days=(numero + 3 * i) % jours),
+                        'type_operation': 'decaissement' if i % 4 == 3 else 'encaissement',
+                        'montant': 10.0 * (numero + 1) + i,
+                        'mode_paiement': 'especes',
+                        'statut': 'valide',
+                    })
+        except Exception as e:
+            erreurs.append(e)
+
+    def _enregistrer_en_parallele(self, jours=1):
+        depart = threading.Barrier(self.NOMBRE_CAISSIERS)
+        erreurs = []
+        caissiers = [
+            threading.Thread(target=self._caissier, args=(numero, depart, erreurs, jours))
+            for numero in range(self.NOMBRE_CAISSIERS)
+        ]
+        for caissier in caissiers:
+            caissier.start()
+        for caissier in caissiers:
+            caissier.join()
+        return erreurs
+
+    def test_enregistrements_simultanes(self):
+        """Test que les soldes restent cohérents quand plusieurs caissiers enregistrent en même temps"""
+        # Aucune transaction de caissier n'a échoué (pas de conflit de sérialisation)
+        self.assertEqual(self._enregistrer_en_parallele(), [])
+        self._verifier_journal()
+
+    def test_operations_antidatees_simultanees(self):
+        """Test que des opérations antidatées enregistrées en même temps n'entrent pas en conflit"""
+        # Les soldes des opérations suivantes sont réécrits par le séquencement, pas par les caissiers
+        self.assertEqual(self._enregistrer_en_parallele(jours=5), [])
+        self._verifier_journal()
+
+    def _verifier_journal(self):
+        """Vérifie le séquencement, la chaîne des soldes et les clôtures journalières du registre"""
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            registre = env['agencevoyage.caisse.registre'].browse(self.registre_id)
+            operations = env['agencevoyage.caisse'].search(
+                [('registre_id', '=', self.registre_id)], order='date_operation, id')
+            self.assertEqual(len(operations), self.NOMBRE_CAISSIERS * self.OPERATIONS_PAR_CAISSIER)
+
+            # Toutes les opérations ont été séquencées, sans trou ni doublon
+            self.assertFalse(operations.filtered('a_sequencer'))
+            self.assertEqual(sorted(operations.mapped('sequence_registre')), list(range(1, len(operations) + 1)))
+            self.assertEqual(registre.derniere_sequence, len(operations))
+
+            # La chaîne des soldes est continue et le solde du registre égal au total du journal
+            solde = 0.0
+            for operation in operations:
+                self.assertAlmostEqual(operation.solde_avant, solde, places=2)
+                solde += operation._get_mouvement()
+                self.assertAlmostEqual(operation.solde_apres, solde, places=2)
+            self.assertAlmostEqual(registre.solde, solde, places=2)
+            self.assertAlmostEqual(registre._get_solde(), solde, places=2)
+
+            # Les clôtures des journées terminées reprennent le solde de la dernière opération du jour
+            for checkpoint in env['agencevoyage.caisse.checkpoint'].search([('registre_id', '=', self.registre_id)]):
+                derniere = operations.filtered(lambda o: o.date_operation <= checkpoint.date)[-1:]
+                self.assertAlmostEqual(checkpoint.solde, derniere.solde_apres, places=2)
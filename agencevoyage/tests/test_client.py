@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+from datetime import date, timedelta
+
+
+class TestClient(TransactionCase):
+    """Tests pour le modèle Client"""
+
+    def setUp(self):
+        super(TestClient, self).setUp()
+        Client = self.env['agencevoyage.client']
+        valeurs = {
+            'adresse': '123 Rue Test',
+            'nationalite': 'Française',
+            'sexe': 'masculin',
+        }
+        self.dupont = Client.create(dict(valeurs, nom='Dupont', prenom='Jean', telephone='0612345678',
+                                         numero_cin='CIN-784512', numero_passport='PA1122334'))
+        self.dupontel = Client.create(dict(valeurs, nom='Dupontel', prenom='Alain', telephone='0698765432'))
+        self.martin = Client.create(dict(valeurs, nom='Martin', prenom='Paul', telephone='0711223344'))
+        self.valeurs = valeurs
+
+    def _trouver(self, saisie):
+        return [client_id for client_id, nom in self.env['agencevoyage.client'].name_search(saisie, limit=10)]
+
+    def test_recherche_par_identifiant(self):
+        """Test que la recherche d'un client porte sur le nom, le téléphone, la CIN et le passeport"""
+        self.assertEqual(self._trouver('Jean Dupont'), [self.dupont.id])
+        self.assertEqual(self._trouver('06123456'), [self.dupont.id])
+        self.assertEqual(self._trouver('784512'), [self.dupont.id])
+        self.assertEqual(self._trouver('pa1122'), [self.dupont.id])
+        self.assertEqual(self._trouver('Martin'), [self.martin.id])
+        self.assertFalse(self._trouver('Introuvable'))
+
+    def test_recherche_classee_par_ressemblance(self):
+        """Test que les clients les plus ressemblants à la saisie sont proposés en premier"""
+        if not self.env.registry.has_trigram:
+            self.skipTest('Extension pg_trgm non installée')
+        # Ordre alphabétique : Alain Dupontel puis Jean Dupont ; « Jean Dupont » ressemble plus à la saisie
+        self.assertEqual(self._trouver('Dupont'), [self.dupont.id, self.dupontel.id])
+        self.assertEqual(self._trouver('Dupontel'), [self.dupontel.id])
+
+    def test_cles_de_blocage(self):
+        """Test des clés normalisées comparées par la détection des doublons"""
+        client = self.env['agencevoyage.client'].create(dict(
+            self.valeurs, nom='DUPONT', prenom='Jean', telephone='+33 6 12 34 56 78',
+            numero_cin=' cin 784-512 ', email=' Jean.Dupont@Test.com '))
+        self.assertEqual(client.cle_nom, self.dupont.cle_nom)
+        self.assertEqual(client.cle_telephone, self.dupont.cle_telephone)
+        self.assertEqual(client.cle_cin, self.dupont.cle_cin)
+        self.assertEqual(client.cle_email, 'jean.dupont@test.com')
+        self.assertNotEqual(self.martin.cle_nom, self.dupont.cle_nom)
+
+    def test_detection_doublons(self):
+        """Test que seuls les clients partageant assez d'identifiants sont proposés à la fusion"""
+        Client = self.env['agencevoyage.client']
+        # Même nom (écrit autrement) et même téléphone : doublon
+        saisie_guichet = Client.create(dict(self.valeurs, nom='DUPONT', prenom='Jean', telephone='+33 6 12 34 56 78'))
+        # Même téléphone, autre nom (famille) : pas un doublon
+        Client.create(dict(self.valeurs, nom='Dupont', prenom='Marie', telephone='06 12 34 56 78'))
+        # Même CIN : doublon
+        homonyme = Client.create(dict(self.valeurs, nom='Martin', prenom='Paulo', telephone='0799999999',
+                                      numero_cin='cin784512'))
+
+        groupes = self.env['agencevoyage.client.doublon']._detecter()
+
+        self.assertEqual(len(groupes), 1)
+        self.assertEqual(groupes.client_ids, self.dupont | saisie_guichet | homonyme)
+        self.assertEqual(groupes.client_principal_id, self.dupont)
+        self.assertEqual(groupes.score, 60)
+        self.assertIn('CIN', groupes.raisons)
+        # Une proposition en cours n'est pas proposée une seconde fois
+        self.assertFalse(self.env['agencevoyage.client.doublon']._detecter())
+        groupes.action_ignorer()
+        self.assertFalse(self.env['agencevoyage.client.doublon']._detecter())
+
+    def test_fusion_doublons(self):
+        """Test que la fusion rattache réservations et paiements au client conservé"""
+        doublon = self.env['agencevoyage.client'].create(dict(
+            self.valeurs, nom='DUPONT', prenom='Jean', telephone='06 12 34 56 78', email='jean@test.com'))
+        destination = self.env['agencevoyage.destination'].create({
+            'nom_lieu': 'Paris',
+            'ville': 'Paris',
+            'pays': 'France',
+            'adresse': 'Paris, France',
+        })
+        voyage = self.env['agencevoyage.voyage'].create({
+            'titre_voyage': 'Voyage Test Paris',
+            'destination_id': destination.id,
+            'ville_depart': 'Lyon',
+            'date_debut': date.today() + timedelta(days=30),
+            'date_fin': date.today() + timedelta(days=37),
+            'prix_adulte': 500.0,
+            'prix_enfant': 300.0,
+            'place_total': 20,
+        })
+        reservations = self.env['agencevoyage.reservation'].create([{
+            'date_reservation': date.today(),
+            'voyage_id': voyage.id,
+            'client_id': doublon.id,
+        } for i in range(3)])
+        paiement = self.env['agencevoyage.paiement'].create({
+            'client_id': doublon.id,
+            'type_paiement': 'encaissement',
+            'montant': 100.0,
+            'date_paiement': date.today(),
+            'mode_paiement': 'especes',
+        })
+
+        groupe = self.env['agencevoyage.client.doublon']._detecter()
+        self.assertEqual(groupe.client_ids, self.dupont | doublon)
+        groupe.action_fusionner()
+
+        self.assertEqual(groupe.state, 'fusionne')
+        self.assertFalse(doublon.exists())
+        self.assertEqual(reservations.client_id, self.dupont)
+        self.assertEqual(paiement.client_id, self.dupont)
+        # Coordonnées manquantes reprises du doublon
+        self.assertEqual(self.dupont.email, 'jean@test.com')
+        self.assertEqual(self.dupont.numero_cin, 'CIN-784512')
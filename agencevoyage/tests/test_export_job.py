@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+from datetime import date
+from unittest.mock import patch
+
+
+class TestExportJob(TransactionCase):
+    """Tests pour le modèle ExportJob"""
+
+    def setUp(self):
+        super(TestExportJob, self).setUp()
+
+        self.operations = self.env['agencevoyage.caisse']
+        for montant in (10.0, 20.0, 30.0, 40.0, 50.0):
+            self.operations |= self.env['agencevoyage.caisse'].create({
+                'date_operation': date.today(),
+                'type_operation': 'encaissement',
+                'montant': montant,
+                'mode_paiement': 'especes',
+                'statut': 'valide',
+            })
+        self.job = self.env['agencevoyage.export.job'].create({
+            'model_name': 'agencevoyage.caisse',
+            'format_export': 'csv',
+            'domaine': str([('id', 'in', self.operations.ids)]),
+        })
+
+    def test_export_par_parties(self):
+        """Test que l'export est construit par parties puis assemblé"""
+        with patch('odoo.addons.agencevoyage.models.export_job.EXPORT_JOB_PARTIE', 2):
+            self.assertTrue(self.job._traiter_partie())
+            self.assertEqual(self.job.state, 'en_cours')
+            self.assertEqual(self.job.total, 5)
+            self.assertEqual(self.job.nombre_lignes, 2)
+            self.assertEqual(self.job.dernier_id, self.operations.sorted('id')[1].id)
+            self.assertEqual(len(self.job.partie_ids), 1)
+
+            while self.job._traiter_partie():
+                pass
+
+        self.assertEqual(self.job.state, 'termine')
+        self.assertEqual(self.job.progression, 100.0)
+        self.assertFalse(self.job.partie_ids)
+        lignes = self.job.attachment_id.raw.decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lignes), 6)
+        self.assertTrue(lignes[0].startswith('Numéro;Date'))
+        # Les lignes sont exportées par ordre d'identifiant
+        self.assertTrue(lignes[1].startswith(self.operations.sorted('id')[0].name))
+
+    def test_reprise_apres_interruption(self):
+        """Test qu'un export interrompu reprend à la dernière partie enregistrée"""
+        with patch('odoo.addons.agencevoyage.models.export_job.EXPORT_JOB_PARTIE', 3):
+            self.job._traiter_partie()
+            # Simule un export interrompu par une erreur puis relancé
+            self.job.write({'state': 'erreur', 'message_erreur': 'Arrêt du serveur'})
+            self.job.action_relancer()
+            self.assertEqual(self.job.state, 'en_cours')
+            self.assertEqual(self.job.nombre_lignes, 3)
+
+            self.assertTrue(self.job._traiter_partie())
+            self.assertEqual(self.job.nombre_lignes, 5)
+            self.assertFalse(self.job._traiter_partie())
+
+        lignes = self.job.attachment_id.raw.decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lignes), 6)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+from odoo.exceptions import UserError
+from odoo.addons.agencevoyage.models import import_groupe
+from datetime import date, timedelta
+from unittest.mock import patch
+import base64
+import io
+
+
+class TestImportGroupe(TransactionCase):
+    """Tests pour l'import d'un groupe de voyageurs"""
+
+    def setUp(self):
+        super(TestImportGroupe, self).setUp()
+
+        self.client = self.env['agencevoyage.client'].create({
+            'nom': 'Lycée',
+            'prenom': 'Voltaire',
+            'email': 'lycee.voltaire@test.com',
+            'telephone': '0123456789',
+            'adresse': '1 Rue Test',
+            'nationalite': 'Française',
+            'sexe': 'masculin',
+        })
+        destination = self.env['agencevoyage.destination'].create({
+            'nom_lieu': 'Rome',
+            'ville': 'Rome',
+            'pays': 'Italie',
+            'adresse': 'Rome, Italie',
+        })
+        self.voyage = self.env['agencevoyage.voyage'].create({
+            'titre_voyage': 'Voyage scolaire Rome',
+            'destination_id': destination.id,
+            'ville_depart': 'Lyon',
+            'date_debut': date.today() + timedelta(days=30),
+            'date_fin': date.today() + timedelta(days=35),
+            'prix_adulte': 500.0,
+            'prix_enfant': 300.0,
+            'place_total': 100,
+        })
+
+    def _importer(self, contenu, **vals):
+        assistant = self.env['agencevoyage.import.groupe'].create(dict({
+            'voyage_id': self.voyage.id,
+            'client_id': self.client.id,
+            'fichier': base64.b64encode(contenu),
+            'nom_fichier': 'groupe.csv',
+        }, **vals))
+        assistant.action_importer()
+        return assistant
+
+    def test_import_csv_par_groupe(self):
+        """Test de l'import CSV : une réservation par groupe, avec voyageurs, chambres et prix"""
+        contenu = (
+            'Groupe;Nom;Prénom;Type;Âge;Chambre\n'
+            'Classe A;Martin;Paul;Adulte;45;Simple\n'
+            'Classe A;Durand;Léa;Enfant;15;Triple\n'
+            'Classe A;Petit;Hugo;enfant;14;triple\n'
+            '\n'
+            'Classe B;Moreau;Anne;adulte;38;double\n'
+            'Classe B;Roux;Tom;enfant;15;double\n'
+            'Classe B;Blanc;Inès;enfant;15;double\n'
+        ).encode('utf-8')
+        assistant = self._importer(contenu)
+
+        self.assertEqual(assistant.state, 'importe')
+        self.assertEqual(assistant.nombre_voyageurs, 6)
+        classe_a, classe_b = assistant.reservation_ids.sorted('id')
+        self.assertEqual(classe_a.voyageur_ids.mapped('nom'), ['Paul Martin', 'Léa Durand', 'Hugo Petit'])
+        self.assertEqual((classe_a.nombre_adultes, classe_a.nombre_enfants), (1, 2))
+        self.assertEqual(classe_a.prix_transport, 500.0 + 2 * 300.0)
+        self.assertEqual(classe_a.client_id, self.client)
+        self.assertEqual(classe_a.statut, 'en_attente')
+        # Chambres déduites des voyageurs : 3 en double = 2 chambres, pour la durée du voyage
+        chambres_b = classe_b.chambre_ids
+        self.assertEqual(chambres_b.type_chambre, 'double')
+        self.assertEqual(chambres_b.nombre_chambres, 2)
+        self.assertEqual(chambres_b.nombre_nuits, 5)
+        self.assertEqual(sorted(classe_a.chambre_ids.mapped('type_chambre')), ['simple', 'triple'])
+
+    def test_import_colonne_nom_seule(self):
+        """Test de l'import d'un CSV ne contenant que la colonne Nom (aucun séparateur)"""
+        assistant = self._importer('Nom\nDupont\nMartin\n'.encode('utf-8'))
+
+        self.assertEqual(assistant.nombre_voyageurs, 2)
+        self.assertEqual(assistant.reservation_ids.voyageur_ids.mapped('nom'), ['Dupont', 'Martin'])
+        self.assertFalse(assistant.reservation_ids.chambre_ids)
+
+    def test_import_par_lots(self):
+        """Test qu'un groupe réparti sur plusieurs lots reste une seule réservation, confirmée à la fin"""
+        lignes = ['Nom,Type'] + ['Voyageur %d,adulte' % i for i in range(25)]
+        with patch.object(import_groupe, 'IMPORT_LOT', 10):
+            assistant = self._importer('\n'.join(lignes).encode('utf-8'), confirmer=True)
+
+        reservation = assistant.reservation_ids
+        self.assertEqual(len(reservation), 1)
+        self.assertEqual(reservation.total_personnes, 25)
+        self.assertEqual(reservation.prix_transport, 25 * 500.0)
+        self.assertEqual(reservation.statut, 'confirmee')
+        self.assertEqual(self.voyage.place_reserve, 25)
+
+    def test_confirmation_refusee_garde_l_import(self):
+        """Test qu'une confirmation refusée laisse l'import en place et figure dans le bilan"""
+        self.voyage.place_total = 2
+        for nombre_groupes in (1, 2):
+            lignes = ['Groupe;Nom'] + ['Classe %d;Voyageur %d' % (i % nombre_groupes, i) for i in range(3)]
+            assistant = self.env['agencevoyage.import.groupe'].create({
+                'voyage_id': self.voyage.id,
+                'client_id': self.client.id,
+                'fichier': base64.b64encode('\n'.join(lignes).encode('utf-8')),
+                'nom_fichier': 'groupe.csv',
+                'confirmer': True,
+            })
+            action = assistant.action_importer()
+
+            self.assertEqual(assistant.state, 'importe')
+            self.assertEqual(len(assistant.reservation_ids), nombre_groupes)
+            self.assertIn('en_attente', assistant.reservation_ids.mapped('statut'))
+            self.assertEqual(action['tag'], 'display_notification')
+            self.assertEqual(action['params']['type'], 'warning')
+            self.assertEqual(action['params']['next']['domain'], [('id', 'in', assistant.reservation_ids.ids)])
+            self.assertLessEqual(self.voyage.place_reserve, 2)
+
+    def test_chambres_sur_plusieurs_lots(self):
+        """Test que les chambres d'un groupe réparti sur plusieurs lots sont calculées sur tout le groupe"""
+        lignes = ['Groupe;Nom;Chambre'] + ['Famille;Voyageur %d;double' % i for i in range(4)]
+        with patch.object(import_groupe, 'IMPORT_LOT', 3):
+            assistant = self._importer('\n'.join(lignes).encode('utf-8'))
+
+        chambres = assistant.reservation_ids.chambre_ids
+        self.assertEqual(len(chambres), 1)
+        # 4 voyageurs en double : 2 chambres (et non 2 pour le premier lot de 3 plus 1 pour le suivant)
+        self.assertEqual(chambres.nombre_chambres, 2)
+
+    def test_import_xlsx(self):
+        """Test de l'import d'un fichier XLSX"""
+        if import_groupe.openpyxl is None:
+            self.skipTest('openpyxl non installé')
+        classeur = import_groupe.openpyxl.Workbook()
+        feuille = classeur.active
+        feuille.append(['Nom', 'Prénom', 'Type', 'Âge'])
+        feuille.append(['Garcia', 'Emma', 'enfant', 12])
+        feuille.append(['Garcia', 'Marc', 'adulte', 41])
+        fichier = io.BytesIO()
+        classeur.save(fichier)
+        assistant = self._importer(fichier.getvalue(), nom_fichier='groupe.xlsx')
+
+        self.assertEqual(assistant.reservation_ids.voyageur_ids.mapped('age'), [12, 41])
+        self.assertEqual(assistant.reservation_ids.nombre_enfants, 1)
+
+    def test_import_ligne_invalide(self):
+        """Test qu'une ligne invalide annule l'import en indiquant son numéro"""
+        contenu = 'Nom;Type\nMartin;adulte\nDurand;bébé\n'.encode('utf-8')
+        with self.assertRaisesRegex(UserError, 'Ligne 3'):
+            self._importer(contenu)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from odoo import fields
+from odoo.tests.common import TransactionCase
+from odoo.exceptions import UserError
+from datetime import date, timedelta
+
+
+class TestOptionPlace(TransactionCase):
+    """Tests pour les options de places (places retenues temporairement)"""
+
+    def setUp(self):
+        super(TestOptionPlace, self).setUp()
+
+        self.client = self.env['agencevoyage.client'].create({
+            'nom': 'Dupont',
+            'prenom': 'Jean',
+            'email': 'jean.dupont@test.com',
+            'telephone': '0123456789',
+            'adresse': '123 Rue Test',
+            'nationalite': 'Française',
+            'sexe': 'masculin',
+        })
+        destination = self.env['agencevoyage.destination'].create({
+            'nom_lieu': 'Paris',
+            'ville': 'Paris',
+            'pays': 'France',
+            'adresse': 'Paris, France',
+        })
+        self.voyage = self.env['agencevoyage.voyage'].create({
+            'titre_voyage': 'Voyage Test Paris',
+            'destination_id': destination.id,
+            'ville_depart': 'Lyon',
+            'date_debut': date.today() + timedelta(days=30),
+            'date_fin': date.today() + timedelta(days=37),
+            'prix_adulte': 500.0,
+            'prix_enfant': 300.0,
+            'place_total': 5,
+        })
+        self.reservation = self.env['agencevoyage.reservation'].create({
+            'date_reservation': date.today(),
+            'voyage_id': self.voyage.id,
+            'client_id': self.client.id,
+            'voyageur_ids': [
+                (0, 0, {'nom': f'Voyageur {i}', 'type_voyageur': 'adulte', 'age': 30})
+                for i in range(3)
+            ],
+        })
+
+    def _option(self, nombre_places, **vals):
+        return self.env['agencevoyage.option.place'].create(dict({
+            'voyage_id': self.voyage.id,
+            'nombre_places': nombre_places,
+        }, **vals))
+
+    def test_option_compte_dans_les_places_disponibles(self):
+        """Test qu'une option retient les places et qu'on ne peut pas en retenir plus que le voyage n'en a"""
+        option = self._option(4)
+        self.assertEqual(self.voyage.place_optionnee, 4)
+        self.assertEqual(self.voyage.place_disponible, 1)
+
+        # Les places en option ne peuvent pas être confirmées par une autre réservation
+        with self.assertRaises(UserError):
+            self.reservation.action_confirmer()
+        with self.assertRaises(UserError):
+            self._option(2)
+
+        option.action_liberer()
+        self.assertEqual(option.statut, 'liberee')
+        self.assertEqual(self.voyage.place_optionnee, 0)
+        self.assertEqual(self.voyage.place_disponible, 5)
+
+    def test_option_convertie_a_la_confirmation(self):
+        """Test que la confirmation prend les places de l'option de la réservation"""
+        self.reservation.action_mettre_en_option()
+        option = self.reservation.option_ids
+        self.assertEqual(option.nombre_places, 3)
+        self.assertEqual(option.client_id, self.client)
+        self._option(2)
+        self.assertEqual(self.voyage.place_disponible, 0)
+
+        # Voyage complet, mais les places en option de la réservation lui reviennent
+        self.reservation.action_confirmer()
+        self.assertEqual(option.statut, 'convertie')
+        self.assertEqual(self.voyage.place_reserve, 3)
+        self.assertEqual(self.voyage.place_optionnee, 2)
+        self.assertEqual(self.voyage.place_disponible, 0)
+
+    def test_expiration_des_options(self):
+        """Test de l'expiration des options échues en une requête, et à la demande quand le voyage est complet"""
+        maintenant = fields.Datetime.now()
+        echues = self.env['agencevoyage.option.place'].create([{
+            'voyage_id': self.voyage.id,
+            'nombre_places': 1,
+            'date_expiration': maintenant - timedelta(minutes=1),
+        } for i in range(2)])
+        en_cours = self._option(1, date_expiration=maintenant + timedelta(minutes=10))
+        self.assertEqual(self.voyage.place_disponible, 2)
+
+        self.env.flush_all()
+        with self.assertQueryCount(1):
+            self.assertEqual(self.env['agencevoyage.option.place']._cron_expirer_options(), 2)
+        self.assertEqual(set(echues.mapped('statut')), {'expiree'})
+        self.assertEqual(en_cours.statut, 'active')
+        self.assertEqual(self.voyage.place_optionnee, 1)
+        self.assertEqual(self.voyage.place_disponible, 4)
+
+        # Une option échue non encore balayée est libérée quand ses places manquent
+        en_cours.date_expiration = maintenant - timedelta(minutes=1)
+        autre = self._option(2)
+        self.assertEqual(self.voyage.place_disponible, 2)
+        self.reservation.action_confirmer()
+        self.assertEqual(en_cours.statut, 'expiree')
+        self.assertEqual(autre.statut, 'active')
+        self.assertEqual(self.voyage.place_reserve, 3)
+        self.assertEqual(self.voyage.place_optionnee, 2)
+        self.assertEqual(self.voyage.place_disponible, 0)
@@ -107,3 +107,147 @@ class TestPaiement(TransactionCase):
         self.assertEqual(len(caisse_ops), 1)
         self.assertEqual(caisse_ops.montant, 500.0)
 
+    def _compter_requetes_calcul(self, nombre):
+        """Nombre de requêtes pour recalculer les montants de `nombre` paiements de la réservation"""
+        paiements = self.env['agencevoyage.paiement'].create([{
+            'reservation_id': self.reservation.id,
+            'client_id': self.client.id,
+            'type_paiement': 'encaissement',
+            'montant': 10.0,
+            'date_paiement': date.today(),
+            'mode_paiement': 'especes',
+            'statut': 'paye',
+        } for i in range(nombre)])
+        self.env.flush_all()
+        self.env.invalidate_all()
+        nombre_requetes = self.env.cr.sql_log_count
+        paiements._compute_montants_client()
+        return paiements, self.env.cr.sql_log_count - nombre_requetes
+
+    def test_calcul_montants_par_lot(self):
+        """Test que le calcul du déjà payé ne dépend pas du nombre de paiements du lot"""
+        paiements, requetes_lot_court = self._compter_requetes_calcul(3)
+        self.assertEqual(paiements[0].deja_paye, 20.0)
+        self.assertEqual(paiements[0].reste_a_payer, 970.0)
+        
+        paiements, requetes_lot_long = self._compter_requetes_calcul(30)
+        self.assertEqual(requetes_lot_long, requetes_lot_court)
+        # 3 paiements du premier lot + 29 autres paiements du second lot
+        self.assertEqual(paiements[0].deja_paye, 320.0)
+
+    def _compter_requetes_creation(self, nombre):
+        """Nombre de requêtes pour créer `nombre` paiements payés en un seul appel"""
+        vals_list = [{
+            'client_id': self.client.id,
+            'type_paiement': 'encaissement' if i % 2 else 'decaissement',
+            'montant': 10.0 + i,
+            'date_paiement': date.today(),
+            'mode_paiement': 'virement',
+            'statut': 'paye',
+        } for i in range(nombre)]
+        self.env.flush_all()
+        nombre_requetes = self.env.cr.sql_log_count
+        paiements = self.env['agencevoyage.paiement'].create(vals_list)
+        self.env.flush_all()
+        return paiements, self.env.cr.sql_log_count - nombre_requetes
+
+    def test_creation_par_lot(self):
+        """Banc d'essai : la création en lot ne fait pas une série de requêtes par paiement"""
+        paiements, requetes_lot_court = self._compter_requetes_creation(20)
+        self.assertEqual(len(set(paiements.mapped('name'))), 20)
+        self.assertEqual(self.env['agencevoyage.caisse'].search_count([
+            '|', ('paiement_client_id', 'in', paiements.ids), ('paiement_fournisseur_id', 'in', paiements.ids),
+        ]), 20)
+        
+        paiements, requetes_lot_long = self._compter_requetes_creation(200)
+        self.assertEqual(len(paiements.filtered(lambda p: p.name.startswith('PAY-'))), 100)
+        # 10 fois plus de paiements ne doivent pas coûter 10 fois plus de requêtes
+        self.assertLess(requetes_lot_long, 2 * requetes_lot_court,
+                        'Création de 20 paiements : %s requêtes, de 200 paiements : %s requêtes'
+                        % (requetes_lot_court, requetes_lot_long))
+
+    def _compter_requetes_passage_paye(self, nombre):
+        """Nombre de requêtes pour passer `nombre` paiements en attente à « Payé » en une écriture"""
+        paiements = self.env['agencevoyage.paiement'].create([{
+            'client_id': self.client.id,
+            'type_paiement': 'encaissement',
+            'montant': 25.0,
+            'date_paiement': date.today(),
+            'mode_paiement': 'carte_bancaire',
+            'statut': 'en_attente',
+        } for i in range(nombre)])
+        self.env.flush_all()
+        nombre_requetes = self.env.cr.sql_log_count
+        paiements.write({'statut': 'paye'})
+        self.env.flush_all()
+        return paiements, self.env.cr.sql_log_count - nombre_requetes
+
+    def test_passage_paye_par_lot(self):
+        """Test que le passage à « Payé » d'un lot crée les opérations de caisse en une fois"""
+        paiements, requetes_lot_court = self._compter_requetes_passage_paye(10)
+        caisse_ops = self.env['agencevoyage.caisse'].search([('paiement_client_id', 'in', paiements.ids)])
+        self.assertEqual(len(caisse_ops), 10)
+        
+        # Une seconde écriture ne crée pas de doublon
+        paiements.write({'statut': 'paye'})
+        self.assertEqual(self.env['agencevoyage.caisse'].search_count([('paiement_client_id', 'in', paiements.ids)]), 10)
+        
+        paiements, requetes_lot_long = self._compter_requetes_passage_paye(100)
+        self.assertEqual(self.env['agencevoyage.caisse'].search_count([('paiement_client_id', 'in', paiements.ids)]), 100)
+        self.assertLess(requetes_lot_long, 2 * requetes_lot_court,
+                        'Passage de 10 paiements : %s requêtes, de 100 paiements : %s requêtes'
+                        % (requetes_lot_court, requetes_lot_long))
+
+    def test_numerotation_a_la_creation(self):
+        """Test que le numéro est attribué à la création et non à l'ouverture du formulaire"""
+        Paiement = self.env['agencevoyage.paiement']
+        sequence = self.env.ref('agencevoyage.sequence_paiement_client')
+        numero_suivant = sequence.number_next_actual
+        
+        self.assertEqual(Paiement.default_get(['name'])['name'], 'Nouveau')
+        Paiement.new({'client_id': self.client.id})
+        sequence.invalidate_recordset(['number_next_actual'])
+        self.assertEqual(sequence.number_next_actual, numero_suivant)
+        
+        paiement = Paiement.create({
+            'client_id': self.client.id,
+            'type_paiement': 'encaissement',
+            'montant': 50.0,
+            'date_paiement': date.today(),
+            'mode_paiement': 'especes',
+        })
+        self.assertTrue(paiement.name.startswith('PAY-'))
+        self.assertNotEqual(paiement.copy().name, paiement.name)
+
+    def test_numerotation_par_blocs(self):
+        """Test des blocs de numéros pré-alloués par processus"""
+        sequence = self.env.ref('agencevoyage.sequence_paiement_client')
+        sequence.taille_bloc = 10
+        vals = {
+            'client_id': self.client.id,
+            'type_paiement': 'encaissement',
+            'montant': 50.0,
+            'date_paiement': date.today(),
+            'mode_paiement': 'especes',
+        }
+        premier = self.env['agencevoyage.paiement'].create(vals)
+        sequence.invalidate_recordset(['number_next_actual'])
+        numero_suivant = sequence.number_next_actual
+        
+        # Les paiements suivants sont servis par le bloc du processus sans toucher à la séquence
+        paiements = self.env['agencevoyage.paiement'].create([vals] * 5)
+        sequence.invalidate_recordset(['number_next_actual'])
+        self.assertEqual(sequence.number_next_actual, numero_suivant)
+        noms = (premier | paiements).mapped('name')
+        self.assertEqual(len(set(noms)), 6)
+        self.assertEqual(noms, sorted(noms))
+        
+        # Séquence modifiée par un autre processus (qui ne vide que ses propres blocs) :
+        # le reste du bloc de ce processus est abandonné et un nouveau bloc est tiré
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE ir_sequence SET write_date = write_date + interval '1 second' WHERE id = %s", (sequence.id,))
+        sequence.invalidate_recordset(['write_date'])
+        self.env['agencevoyage.paiement'].create(vals)
+        sequence.invalidate_recordset(['number_next_actual'])
+        self.assertEqual(sequence.number_next_actual, numero_suivant + 10)
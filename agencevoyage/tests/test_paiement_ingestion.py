@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+from datetime import date, timedelta
+
+
+class TestPaiementIngestion(TransactionCase):
+    """Tests pour la réception des paiements des terminaux et passerelles"""
+
+    def setUp(self):
+        super(TestPaiementIngestion, self).setUp()
+        
+        self.client = self.env['agencevoyage.client'].create({
+            'nom': 'Test',
+            'prenom': 'Client',
+            'email': 'client@test.com',
+            'telephone': '0123456789',
+            'adresse': '123 Rue Test',
+            'nationalite': 'Française',
+            'sexe': 'masculin',
+        })
+        destination = self.env['agencevoyage.destination'].create({
+            'nom_lieu': 'Paris',
+            'ville': 'Paris',
+            'pays': 'France',
+            'adresse': 'Paris, France',
+        })
+        voyage = self.env['agencevoyage.voyage'].create({
+            'titre_voyage': 'Voyage Test',
+            'destination_id': destination.id,
+            'ville_depart': 'Lyon',
+            'date_debut': date.today() + timedelta(days=30),
+            'date_fin': date.today() + timedelta(days=37),
+            'prix_adulte': 500.0,
+            'prix_enfant': 300.0,
+            'place_total': 20,
+        })
+        self.reservation = self.env['agencevoyage.reservation'].create({
+            'date_reservation': date.today(),
+            'voyage_id': voyage.id,
+            'client_id': self.client.id,
+            'montant_total': 1000.0,
+        })
+
+    def _lot(self, nombre, prefixe='TPE'):
+        return [{
+            'cle_idempotence': '%s-%04d' % (prefixe, i),
+            'client_id': self.client.id,
+            'montant': 20.0 + i,
+            'mode_paiement': 'carte_bancaire',
+            'date_paiement': date.today().isoformat(),
+        } for i in range(nombre)]
+
+    def test_lot_rejoue(self):
+        """Test qu'un lot rejoué ne crée rien et ne coûte pas une requête par paiement"""
+        Paiement = self.env['agencevoyage.paiement']
+        lot = self._lot(50)
+        resultats = Paiement.ingerer_paiements(lot, 'terminal')
+        self.assertEqual({r['resultat'] for r in resultats}, {'cree'})
+        paiements = Paiement.browse([r['id'] for r in resultats])
+        self.assertEqual(set(paiements.mapped('source_externe')), {'terminal'})
+        self.assertEqual(self.env['agencevoyage.caisse'].search_count([('paiement_client_id', 'in', paiements.ids)]), 50)
+        
+        self.env.flush_all()
+        nombre_requetes = self.env.cr.sql_log_count
+        rejeu = Paiement.ingerer_paiements(lot, 'terminal')
+        self.assertLess(self.env.cr.sql_log_count - nombre_requetes, 10)
+        self.assertEqual({r['resultat'] for r in rejeu}, {'existant'})
+        self.assertEqual([r['id'] for r in rejeu], paiements.ids)
+        self.assertEqual(Paiement.search_count([('cle_idempotence', '=like', 'TPE-%')]), 50)
+
+    def test_resultats_par_paiement(self):
+        """Test que les paiements invalides sont signalés sans bloquer le reste du lot"""
+        lot = self._lot(3, prefixe='WEB')
+        lot[1]['mode_paiement'] = 'bitcoin'
+        lot.append(dict(lot[0]))
+        lot.append({'cle_idempotence': 'WEB-CLIENT', 'client_id': 999999999, 'montant': 10.0,
+                    'mode_paiement': 'virement'})
+        lot.append({'montant': 10.0, 'mode_paiement': 'virement'})
+        resultats = self.env['agencevoyage.paiement'].ingerer_paiements(lot, 'en_ligne')
+        
+        self.assertEqual([r['resultat'] for r in resultats],
+                         ['cree', 'erreur', 'cree', 'existant', 'erreur', 'erreur'])
+        self.assertIn('mode_paiement', resultats[1]['erreur'])
+        self.assertEqual(resultats[3]['id'], resultats[0]['id'])
+        self.assertIn('client_id', resultats[4]['erreur'])
+
+    def test_valeurs_nulles(self):
+        """Test qu'un montant ou un identifiant à zéro est contrôlé comme une valeur, non comme un champ manquant"""
+        lot = self._lot(2, prefixe='ZERO')
+        lot[0]['montant'] = 0
+        lot[1]['client_id'] = 0
+        resultats = self.env['agencevoyage.paiement'].ingerer_paiements(lot, 'en_ligne')
+        
+        self.assertEqual([r['resultat'] for r in resultats], ['erreur', 'erreur'])
+        self.assertNotIn('manquant', resultats[0]['erreur'])
+        self.assertIn('positif', resultats[0]['erreur'])
+        self.assertIn('client_id=0', resultats[1]['erreur'])
+
+    def test_contraintes_du_modele(self):
+        """Test qu'un paiement refusé par une contrainte du modèle n'empêche pas les autres"""
+        lot = self._lot(2, prefixe='RES')
+        # Le montant dépasse le reste à payer de la réservation
+        lot.append({
+            'cle_idempotence': 'RES-TROP',
+            'reservation_id': self.reservation.id,
+            'montant': self.reservation.montant_total * 2,
+            'mode_paiement': 'carte_bancaire',
+        })
+        resultats = self.env['agencevoyage.paiement'].ingerer_paiements(lot, 'en_ligne')
+        self.assertEqual([r['resultat'] for r in resultats], ['cree', 'cree', 'erreur'])
+        self.assertFalse(self.env['agencevoyage.paiement'].search([('cle_idempotence', '=', 'RES-TROP')]))
+        
+        # Le lot corrigé peut être renvoyé tel quel
+        lot[2]['montant'] = 100.0
+        resultats = self.env['agencevoyage.paiement'].ingerer_paiements(lot, 'en_ligne')
+        self.assertEqual([r['resultat'] for r in resultats], ['existant', 'existant', 'cree'])
+        paiement = self.env['agencevoyage.paiement'].browse(resultats[2]['id'])
+        self.assertEqual(paiement.client_id, self.client)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+from odoo.exceptions import UserError
+from odoo.tools.safe_eval import safe_eval, time
+from odoo.addons.agencevoyage.models import ir_actions_report
+from datetime import date, timedelta
+from unittest.mock import patch
+import io
+
+
+class TestRapport(TransactionCase):
+    """Tests pour le rendu par lots et le cache des rapports PDF"""
+
+    def setUp(self):
+        super(TestRapport, self).setUp()
+
+        self.client = self.env['agencevoyage.client'].create({
+            'nom': 'Test',
+            'prenom': 'Client',
+            'email': 'client@test.com',
+            'telephone': '0123456789',
+            'adresse': '123 Rue Test',
+            'nationalite': 'Française',
+            'sexe': 'masculin',
+        })
+        destination = self.env['agencevoyage.destination'].create({
+            'nom_lieu': 'Paris',
+            'ville': 'Paris',
+            'pays': 'France',
+            'adresse': 'Paris, France',
+        })
+        voyage = self.env['agencevoyage.voyage'].create({
+            'titre_voyage': 'Voyage Test',
+            'destination_id': destination.id,
+            'ville_depart': 'Lyon',
+            'date_debut': date.today() + timedelta(days=30),
+            'date_fin': date.today() + timedelta(days=37),
+            'prix_adulte': 500.0,
+            'prix_enfant': 300.0,
+            'place_total': 20,
+        })
+        reservation = self.env['agencevoyage.reservation'].create({
+            'date_reservation': date.today(),
+            'voyage_id': voyage.id,
+            'client_id': self.client.id,
+            'montant_total': 1000.0,
+        })
+        self.paiements = self.env['agencevoyage.paiement'].create([{
+            'reservation_id': reservation.id,
+            'client_id': self.client.id,
+            'type_paiement': 'encaissement',
+            'montant': 100.0,
+            'date_paiement': date.today(),
+            'mode_paiement': 'especes',
+            'statut': 'paye',
+        } for i in range(5)])
+        self.rapport = self.env.ref('agencevoyage.action_report_paiement')
+        self.IrActionsReport = type(self.env['ir.actions.report'])
+
+    def test_impression_de_plusieurs_recus(self):
+        """Test que l'impression des reçus porte sur tous les paiements sélectionnés"""
+        action = self.paiements.action_imprimer_recu()
+        self.assertEqual(action['report_name'], 'agencevoyage.report_paiement')
+        self.assertEqual(action['context']['active_ids'], self.paiements.ids)
+
+        self.paiements[2].statut = 'en_attente'
+        with self.assertRaises(UserError):
+            self.paiements.action_imprimer_recu()
+
+    def test_reimpression_lue_depuis_la_piece_jointe(self):
+        """Test qu'un reçu inchangé est relu depuis sa pièce jointe, et rendu à nouveau après modification"""
+        paiement = self.paiements[0]
+        nom = safe_eval(self.rapport.attachment, {'object': paiement, 'time': time})
+        self.env['ir.attachment'].create({
+            'name': nom,
+            'raw': b'%PDF-1.4 recu en cache',
+            'res_model': 'agencevoyage.paiement',
+            'res_id': paiement.id,
+        })
+
+        with patch.object(self.IrActionsReport, '_run_wkhtmltopdf', side_effect=AssertionError('rendu inattendu')):
+            streams = self.env['ir.actions.report']._render_qweb_pdf_prepare_streams(
+                'agencevoyage.report_paiement', {}, res_ids=paiement.ids)
+        self.assertEqual(streams[paiement.id]['stream'].getvalue(), b'%PDF-1.4 recu en cache')
+
+        # Nouvelle version du paiement, même dans la même seconde : la pièce jointe de l'ancienne n'est plus utilisée
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE agencevoyage_paiement SET write_date = write_date + interval '1 millisecond' WHERE id = %s",
+            (paiement.id,))
+        paiement.invalidate_recordset(['write_date'])
+        self.assertFalse(self.env['ir.actions.report']._lire_pdf_en_cache(self.rapport, paiement.ids))
+
+    def test_anciennes_versions_supprimees(self):
+        """Test que l'impression de la version courante supprime les PDF des versions précédentes"""
+        paiement = self.paiements[0]
+        Attachment = self.env['ir.attachment']
+        courante = Attachment.create({
+            'name': safe_eval(self.rapport.attachment, {'object': paiement, 'time': time}),
+            'raw': b'%PDF-1.4 version courante',
+            'res_model': 'agencevoyage.paiement',
+            'res_id': paiement.id,
+        })
+        ancienne = Attachment.create({
+            'name': 'Recu-%s-20000101000000000000.pdf' % paiement.name,
+            'raw': b'%PDF-1.4 ancienne version',
+            'res_model': 'agencevoyage.paiement',
+            'res_id': paiement.id,
+        })
+        autre = Attachment.create({
+            'name': 'Contrat.pdf',
+            'raw': b'%PDF-1.4 contrat',
+            'res_model': 'agencevoyage.paiement',
+            'res_id': paiement.id,
+        })
+
+        # La préparation des pièces jointes ne supprime rien
+        self.env['ir.actions.report']._prepare_pdf_report_attachment_vals_list(
+            self.rapport, {paiement.id: {'stream': io.BytesIO(b'%PDF-1.4 nouvelle version'), 'attachment': None}})
+        self.assertTrue(ancienne.exists())
+
+        rapports = self.env['ir.actions.report'].with_context(force_report_rendering=True)
+        with patch.object(self.IrActionsReport, '_run_wkhtmltopdf', side_effect=AssertionError('rendu inattendu')):
+            pdf, type_rapport = rapports._render_qweb_pdf('agencevoyage.report_paiement', res_ids=paiement.ids)
+        self.assertEqual(pdf, b'%PDF-1.4 version courante')
+        self.assertFalse(ancienne.exists())
+        self.assertTrue(courante.exists())
+        self.assertTrue(autre.exists())
+
+    def test_rendu_par_lots(self):
+        """Test que les grandes sélections sont rendues par lots, puis relues depuis leurs pièces jointes"""
+        if self.env['ir.actions.report'].get_wkhtmltopdf_state() != 'ok':
+            self.skipTest('wkhtmltopdf non disponible')
+        rapports = self.env['ir.actions.report'].with_context(force_report_rendering=True)
+        run_wkhtmltopdf = self.IrActionsReport._run_wkhtmltopdf
+        with patch.object(ir_actions_report, 'RAPPORT_LOT', 2), \
+                patch.object(self.IrActionsReport, '_run_wkhtmltopdf', autospec=True,
+                             side_effect=run_wkhtmltopdf) as rendu:
+            pdf, type_rapport = rapports._render_qweb_pdf('agencevoyage.report_paiement', res_ids=self.paiements.ids)
+            self.assertEqual(type_rapport, 'pdf')
+            self.assertTrue(pdf.startswith(b'%PDF'))
+            # 5 reçus en lots de 2 : 3 appels à wkhtmltopdf, une pièce jointe par reçu
+            self.assertEqual(rendu.call_count, 3)
+            attachments = self.env['ir.attachment'].search([
+                ('res_model', '=', 'agencevoyage.paiement'),
+                ('res_id', 'in', self.paiements.ids),
+            ])
+            self.assertEqual(sorted(attachments.mapped('res_id')), sorted(self.paiements.ids))
+
+            # Réimpression sans modification : aucun rendu
+            pdf, type_rapport = rapports._render_qweb_pdf('agencevoyage.report_paiement', res_ids=self.paiements.ids)
+            self.assertTrue(pdf.startswith(b'%PDF'))
+            self.assertEqual(rendu.call_count, 3)
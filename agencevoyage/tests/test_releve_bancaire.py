@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+from datetime import date, timedelta
+import base64
+
+
+class TestReleveBancaire(TransactionCase):
+    """Tests pour le rapprochement des relevés bancaires"""
+
+    def setUp(self):
+        super(TestReleveBancaire, self).setUp()
+
+        self.client_dupont = self.env['agencevoyage.client'].create({
+            'nom': 'Dupont',
+            'prenom': 'Marie',
+            'email': 'marie.dupont@test.com',
+            'telephone': '0123456789',
+            'adresse': '1 Rue Test',
+            'nationalite': 'Française',
+            'sexe': 'feminin',
+        })
+        self.client_martin = self.env['agencevoyage.client'].create({
+            'nom': 'Martin',
+            'prenom': 'Paul',
+            'email': 'paul.martin@test.com',
+            'telephone': '0123456780',
+            'adresse': '2 Rue Test',
+            'nationalite': 'Française',
+            'sexe': 'masculin',
+        })
+        self.jour = date.today() - timedelta(days=2)
+
+        Paiement = self.env['agencevoyage.paiement']
+        valeurs = {
+            'type_paiement': 'encaissement',
+            'mode_paiement': 'virement',
+            'statut': 'en_attente',
+            'date_paiement': self.jour,
+        }
+        self.paiement_reference = Paiement.create(dict(
+            valeurs, client_id=self.client_dupont.id, montant=450.0, reference_bancaire='VIR-2024-0001'))
+        self.paiement_dupont = Paiement.create(dict(
+            valeurs, client_id=self.client_dupont.id, montant=300.0))
+        self.paiement_martin = Paiement.create(dict(
+            valeurs, client_id=self.client_martin.id, montant=300.0))
+        self.paiement_seul = Paiement.create(dict(
+            valeurs, client_id=self.client_martin.id, montant=125.5, date_paiement=self.jour - timedelta(days=1)))
+
+    def _importer(self, contenu, nom='releve.csv'):
+        releve = self.env['agencevoyage.releve.bancaire'].create({
+            'name': 'Relevé test',
+            'fichier': base64.b64encode(contenu.encode()),
+            'nom_fichier': nom,
+        })
+        releve.action_importer()
+        return releve
+
+    def test_rapprochement_csv(self):
+        """Test du rapprochement par référence, par montant et nom, par montant et date"""
+        jour = self.jour.strftime('%d/%m/%Y')
+        releve = self._importer(
+            'Date;Montant;Référence;Libellé;Nom\n'
+            '%(jour)s;450,00;VIR 2024 0001;Virement;\n'
+            '%(jour)s;300,00;;Virement reçu;MME MARIE DUPONT\n'
+            '%(jour)s;125,50;;Virement;\n'
+            '%(jour)s;300,00;;Virement reçu;\n'
+            '%(jour)s;999,00;;Inconnu;\n' % {'jour': jour})
+        self.assertEqual(releve.nombre_lignes, 5)
+
+        releve.action_rapprocher()
+        lignes = releve.ligne_ids.sorted('id')
+        self.assertEqual(lignes[0].paiement_id, self.paiement_reference)
+        self.assertEqual(lignes[0].methode, 'reference')
+        self.assertEqual(lignes[1].paiement_id, self.paiement_dupont)
+        self.assertEqual(lignes[1].methode, 'montant_nom')
+        self.assertEqual(lignes[2].paiement_id, self.paiement_seul)
+        self.assertEqual(lignes[2].methode, 'montant_date')
+        # Seul le paiement de Paul Martin reste possible une fois celui de Marie Dupont rapproché
+        self.assertEqual(lignes[3].paiement_id, self.paiement_martin)
+        self.assertEqual(lignes[4].state, 'a_verifier')
+        self.assertEqual(releve.nombre_a_verifier, 1)
+
+        paiements = self.paiement_reference | self.paiement_dupont | self.paiement_martin | self.paiement_seul
+        self.assertEqual(set(paiements.mapped('statut')), {'paye'})
+        self.assertEqual(self.env['agencevoyage.caisse'].search_count([('paiement_client_id', 'in', paiements.ids)]), 4)
+
+    def test_lignes_ambigues_a_verifier(self):
+        """Test qu'une ligne ambiguë est mise à vérifier puis validée manuellement"""
+        releve = self._importer(
+            'Date,Montant,Libellé\n'
+            '%s,300.00,Virement\n' % self.jour.isoformat())
+        releve.action_rapprocher()
+        ligne = releve.ligne_ids
+        self.assertEqual(ligne.state, 'a_verifier')
+        self.assertFalse(ligne.paiement_id)
+        self.assertEqual(self.paiement_dupont.statut, 'en_attente')
+
+        ligne.paiement_id = self.paiement_martin
+        ligne.action_valider_rapprochement()
+        self.assertEqual(ligne.state, 'rapproche')
+        self.assertEqual(ligne.methode, 'manuel')
+        self.assertEqual(self.paiement_martin.statut, 'paye')
+
+    def test_import_camt(self):
+        """Test de l'import d'un relevé XML CAMT.053"""
+        releve = self._importer("""<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+  <BkToCstmrStmt>
+    <Stmt>
+      <Ntry>
+        <Amt Ccy="EUR">450.00</Amt>
+        <CdtDbtInd>CRDT</CdtDbtInd>
+        <BookgDt><Dt>%s</Dt></BookgDt>
+        <NtryDtls>
+          <TxDtls>
+            <Refs><EndToEndId>VIR-2024-0001</EndToEndId></Refs>
+            <RltdPties><Dbtr><Nm>Marie Dupont</Nm></Dbtr></RltdPties>
+            <RmtInf><Ustrd>Acompte voyage</Ustrd></RmtInf>
+          </TxDtls>
+        </NtryDtls>
+      </Ntry>
+      <Ntry>
+        <Amt Ccy="EUR">80.00</Amt>
+        <CdtDbtInd>DBIT</CdtDbtInd>
+        <BookgDt><Dt>%s</Dt></BookgDt>
+      </Ntry>
+    </Stmt>
+  </BkToCstmrStmt>
+</Document>
+""" % (self.jour.isoformat(), self.jour.isoformat()), nom='releve.xml')
+        lignes = releve.ligne_ids.sorted('id')
+        self.assertEqual(len(lignes), 2)
+        self.assertEqual(lignes[0].montant, 450.0)
+        self.assertEqual(lignes[0].reference, 'VIR-2024-0001')
+        self.assertEqual(lignes[0].nom_contrepartie, 'Marie Dupont')
+        self.assertEqual(lignes[1].montant, -80.0)
+
+        releve.action_rapprocher()
+        self.assertEqual(lignes[0].paiement_id, self.paiement_reference)
+        self.assertEqual(lignes[1].state, 'a_verifier')
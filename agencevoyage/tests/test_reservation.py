@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from odoo.tests.common import TransactionCase
 from odoo.exceptions import ValidationError, UserError
+from odoo.addons.base.models.ir_mail_server import MailDeliveryException
 from datetime import date, timedelta
+from unittest.mock import patch
 
 
 class TestReservation(TransactionCase):
@@ -114,6 +116,137 @@ class TestReservation(TransactionCase):
         with self.assertRaises(UserError):
             self.reservation.action_confirmer()
 
+    def test_compteur_places_du_voyage(self):
+        """Test que le compteur de places suit confirmations, voyageurs, changements de voyage et annulations"""
+        voyageurs = self.env['agencevoyage.voyageur'].create([{
+            'reservation_id': self.reservation.id,
+            'nom': f'Voyageur {i}',
+            'type_voyageur': 'adulte',
+            'age': 30,
+        } for i in range(3)])
+        # Une réservation en attente ne tient aucune place
+        self.assertEqual(self.voyage.place_reserve, 0)
+        
+        self.reservation.action_confirmer()
+        self.assertEqual(self.voyage.place_reserve, 3)
+        self.assertEqual(self.voyage.place_disponible, 17)
+        
+        # Ajout et retrait de voyageurs sur une réservation confirmée
+        self.env['agencevoyage.voyageur'].create({
+            'reservation_id': self.reservation.id,
+            'nom': 'Voyageur 3',
+            'type_voyageur': 'enfant',
+            'age': 8,
+        })
+        self.assertEqual(self.voyage.place_reserve, 4)
+        voyageurs[0].unlink()
+        self.assertEqual(self.voyage.place_reserve, 3)
+        self.assertEqual(self.reservation.places_bloquees, 3)
+        
+        # Changement de voyage : les places passent d'un voyage à l'autre
+        autre_voyage = self.voyage.copy({'place_total': 3})
+        self.reservation.voyage_id = autre_voyage
+        self.assertEqual(self.voyage.place_reserve, 0)
+        self.assertEqual(autre_voyage.place_reserve, 3)
+        self.assertEqual(autre_voyage.place_disponible, 0)
+        
+        # Le voyage est complet : un voyageur de plus est refusé
+        with self.assertRaises(UserError):
+            self.env['agencevoyage.voyageur'].create({
+                'reservation_id': self.reservation.id,
+                'nom': 'De trop',
+                'type_voyageur': 'adulte',
+                'age': 30,
+            })
+        
+        self.reservation.action_annuler()
+        self.assertEqual(autre_voyage.place_reserve, 0)
+        self.assertEqual(autre_voyage.place_disponible, 3)
+        self.assertEqual(self.reservation.places_bloquees, 0)
+
+    def test_places_des_reservations_anterieures(self):
+        """Test que les réservations confirmées avant le compteur de places rendent leurs places à l'annulation"""
+        reservation = self._reservation_avec_voyageurs(self.voyage, 3)
+        reservation.action_confirmer()
+        # État d'une base mise à jour : la colonne ajoutée vaut 0, le voyage compte les places
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE agencevoyage_reservation SET places_bloquees = 0 WHERE id = %s", (reservation.id,))
+        self.env.invalidate_all()
+
+        self.env['agencevoyage.reservation']._initialiser_places_bloquees()
+        self.assertEqual(reservation.places_bloquees, 3)
+        self.assertEqual(self.voyage.place_reserve, 3)
+        self.assertEqual(self.voyage.place_disponible, 17)
+
+        # Un voyageur de plus ne tient qu'une place de plus
+        self.env['agencevoyage.voyageur'].create({
+            'reservation_id': reservation.id,
+            'nom': 'Voyageur 3',
+            'type_voyageur': 'adulte',
+            'age': 30,
+        })
+        self.assertEqual(self.voyage.place_reserve, 4)
+
+        reservation.action_annuler()
+        self.assertEqual(reservation.places_bloquees, 0)
+        self.assertEqual(self.voyage.place_reserve, 0)
+        self.assertEqual(self.voyage.place_disponible, 20)
+
+    def _reservation_avec_voyageurs(self, voyage, nombre, **vals):
+        return self.env['agencevoyage.reservation'].create(dict({
+            'date_reservation': date.today(),
+            'voyage_id': voyage.id,
+            'client_id': self.client.id,
+            'voyageur_ids': [
+                (0, 0, {'nom': f'Voyageur {i}', 'type_voyageur': 'adulte', 'age': 30})
+                for i in range(nombre)
+            ],
+        }, **vals))
+
+    def test_confirmation_par_lot(self):
+        """Test de la confirmation d'une sélection : toutes les réservations, groupées par voyage, avec bilan"""
+        petit_voyage = self.voyage.copy({'place_total': 3})
+        grand = self.env['agencevoyage.reservation'].browse()
+        for i in range(5):
+            grand |= self._reservation_avec_voyageurs(self.voyage, 2)
+        premiere = self._reservation_avec_voyageurs(petit_voyage, 2)
+        seconde = self._reservation_avec_voyageurs(petit_voyage, 2)
+        annulee = self._reservation_avec_voyageurs(self.voyage, 1, statut='annulee')
+        selection = grand | premiere | seconde | annulee | self.reservation
+        
+        action = selection.action_confirmer()
+        
+        # Toutes les réservations du grand voyage, la première arrivée sur le petit
+        self.assertEqual(set((grand | premiere).mapped('statut')), {'confirmee'})
+        self.assertEqual(self.voyage.place_reserve, 10)
+        self.assertEqual(petit_voyage.place_reserve, 2)
+        # Refusées : plus de places, réservation annulée, réservation sans voyageur
+        self.assertEqual(seconde.statut, 'en_attente')
+        self.assertEqual(annulee.statut, 'annulee')
+        self.assertEqual(self.reservation.statut, 'en_attente')
+        self.assertEqual(action['params']['type'], 'warning')
+        self.assertIn(seconde.name, action['params']['message'])
+        self.assertTrue(action['params']['message'].startswith('6 '))
+        # Message de confirmation dans le fil de chaque réservation confirmée
+        for reservation in grand | premiere:
+            self.assertTrue(any('Réservation confirmée' in message.body for message in reservation.message_ids))
+
+    def test_annulation_par_lot(self):
+        """Test de l'annulation d'une sélection en une écriture, places rendues aux voyages"""
+        reservations = self._reservation_avec_voyageurs(self.voyage, 2) | self._reservation_avec_voyageurs(self.voyage, 3)
+        reservations.action_confirmer()
+        self.assertEqual(self.voyage.place_reserve, 5)
+        terminee = self._reservation_avec_voyageurs(self.voyage, 1, statut='terminee')
+        
+        action = (reservations | terminee | self.reservation).action_annuler()
+        
+        self.assertEqual(set((reservations | self.reservation).mapped('statut')), {'annulee'})
+        self.assertEqual(terminee.statut, 'terminee')
+        self.assertEqual(self.voyage.place_reserve, 0)
+        self.assertEqual(self.voyage.place_disponible, 20)
+        self.assertIn(terminee.name, action['params']['message'])
+
     def test_validation_date_reservation(self):
         """Test de validation de la date de réservation"""
         # Créer une réservation avec une date après le début du voyage
@@ -168,3 +301,169 @@ class TestReservation(TransactionCase):
         self.assertEqual(self.reservation.deja_paye, 300.0)
         self.assertEqual(self.reservation.reste_a_payer, 700.0)
 
+    def _serveur_smtp(self, echecs=0):
+        """Serveur SMTP de test : refuse les `echecs` premiers envois puis accepte les suivants"""
+        envoyes = []
+        
+        def send_email(server, message, *args, **kwargs):
+            if len(envoyes) < echecs:
+                envoyes.append(None)
+                raise MailDeliveryException('Serveur SMTP indisponible')
+            envoyes.append(message['To'])
+            return message['Message-Id']
+        
+        IrMailServer = type(self.env['ir.mail_server'])
+        return envoyes, patch.multiple(IrMailServer, connect=lambda *args, **kwargs: None, send_email=send_email)
+
+    def _emails_confirmation(self):
+        return self.env['mail.mail'].search([
+            ('type_email_agence', '=', 'confirmation'),
+            ('model', '=', 'agencevoyage.reservation'),
+            ('res_id', '=', self.reservation.id),
+        ])
+
+    def test_email_confirmation_en_file(self):
+        """Test que l'email de confirmation est mis en file et marqué envoyé à la remise"""
+        self.env['agencevoyage.voyageur'].create({
+            'reservation_id': self.reservation.id,
+            'nom': 'Test Voyageur',
+            'type_voyageur': 'adulte',
+        })
+        envoyes, serveur = self._serveur_smtp()
+        with serveur:
+            self.reservation.action_confirmer()
+            # La confirmation ne contacte pas le serveur SMTP
+            self.assertEqual(envoyes, [])
+            email = self._emails_confirmation()
+            self.assertEqual(email.state, 'outgoing')
+            self.assertFalse(self.reservation.email_confirme)
+            
+            email.send()
+        self.assertEqual(envoyes, ['jean.dupont@test.com'])
+        self.assertTrue(self.reservation.email_confirme)
+
+    def test_email_relance_apres_echec(self):
+        """Test de la relance d'un email en échec temporaire"""
+        self.env['agencevoyage.voyageur'].create({
+            'reservation_id': self.reservation.id,
+            'nom': 'Test Voyageur',
+            'type_voyageur': 'adulte',
+        })
+        envoyes, serveur = self._serveur_smtp(echecs=1)
+        with serveur:
+            self.reservation.action_confirmer()
+            email = self._emails_confirmation()
+            email.send()
+            self.assertEqual(email.state, 'exception')
+            self.assertFalse(self.reservation.email_confirme)
+            
+            self.assertEqual(self.env['mail.mail']._cron_relancer_emails_agence(), 1)
+            self.assertEqual(email.state, 'outgoing')
+            self.assertEqual(email.nombre_tentatives, 1)
+            self.assertTrue(email.scheduled_date)
+            
+            email.send()
+        self.assertEqual(envoyes, [None, 'jean.dupont@test.com'])
+        self.assertTrue(self.reservation.email_confirme)
+
+    def test_prix_composants_du_voyage(self):
+        """Test du prix calculé depuis les coûts agrégés du voyage"""
+        self.env['agencevoyage.voyageur'].create([
+            {'reservation_id': self.reservation.id, 'nom': 'Adulte 1', 'type_voyageur': 'adulte'},
+            {'reservation_id': self.reservation.id, 'nom': 'Adulte 2', 'type_voyageur': 'adulte'},
+        ])
+        valeurs = {'voyage_id': self.voyage.id, 'destination_id': self.destination.id, 'jour': 1, 'restaurant': 'Test'}
+        self.env['agencevoyage.restauration'].create(dict(valeurs, type_repas='diner', prix=30.0))
+        self.env['agencevoyage.restauration'].create(dict(valeurs, type_repas='collation', prix=5.0))
+        self.env['agencevoyage.guide'].create({'voyage_id': self.voyage.id, 'nom_guide': 'Guide', 'langue': 'Français', 'prix': 120.0})
+        self.env['agencevoyage.equipement'].create({'voyage_id': self.voyage.id, 'nom_equipement': 'Sac', 'quantite': 1, 'prix': 15.0})
+        self.assertEqual(self.voyage.cout_restauration_personne, 30.0)
+        self.assertEqual(self.voyage.cout_guide_forfait, 120.0)
+        self.assertEqual(self.voyage.cout_equipement_personne, 15.0)
+        
+        # Nouvelle réservation : prix calculés avec les coûts du voyage
+        reservation = self.env['agencevoyage.reservation'].create({
+            'date_reservation': date.today(),
+            'voyage_id': self.voyage.id,
+            'client_id': self.client.id,
+            'voyageur_ids': [
+                (0, 0, {'nom': 'Adulte', 'type_voyageur': 'adulte'}),
+                (0, 0, {'nom': 'Enfant', 'type_voyageur': 'enfant'}),
+            ],
+        })
+        self.assertEqual(reservation.prix_transport, 800.0)
+        self.assertEqual(reservation.prix_restauration, 60.0)
+        self.assertEqual(reservation.prix_guide, 120.0)
+        self.assertEqual(reservation.prix_equipement, 30.0)
+        self.assertEqual(reservation.montant_total, 800.0 + 60.0 + 120.0 + 30.0)
+
+    def test_recalcul_prix_simulation(self):
+        """Test du recalcul des prix : pas de répercussion silencieuse, simulation puis application"""
+        self.env['agencevoyage.voyageur'].create([
+            {'reservation_id': self.reservation.id, 'nom': 'Adulte 1', 'type_voyageur': 'adulte'},
+            {'reservation_id': self.reservation.id, 'nom': 'Adulte 2', 'type_voyageur': 'adulte'},
+        ])
+        annulee = self.env['agencevoyage.reservation'].create({
+            'date_reservation': date.today(),
+            'voyage_id': self.voyage.id,
+            'client_id': self.client.id,
+            'statut': 'annulee',
+            'voyageur_ids': [(0, 0, {'nom': 'Adulte', 'type_voyageur': 'adulte'})],
+        })
+        self.env['agencevoyage.paiement'].create({
+            'reservation_id': self.reservation.id,
+            'client_id': self.client.id,
+            'type_paiement': 'encaissement',
+            'montant': 300.0,
+            'date_paiement': date.today(),
+            'mode_paiement': 'especes',
+        })
+        self.assertEqual(self.reservation.montant_total, 1000.0)
+        
+        # Le changement de tarif ne modifie pas les réservations existantes
+        self.voyage.prix_adulte = 550.0
+        self.env['agencevoyage.guide'].create({'voyage_id': self.voyage.id, 'nom_guide': 'Guide', 'langue': 'Français', 'prix': 50.0})
+        self.env.flush_all()
+        self.assertEqual(self.reservation.montant_total, 1000.0)
+        
+        recalcul = self.env['agencevoyage.recalcul.prix'].create({'voyage_id': self.voyage.id})
+        recalcul.action_simuler()
+        self.assertEqual(recalcul.state, 'simule')
+        # La réservation annulée n'est pas recalculée
+        self.assertEqual(recalcul.ligne_ids.reservation_id, self.reservation)
+        self.assertEqual(recalcul.ligne_ids.ancien_total, 1000.0)
+        self.assertEqual(recalcul.ligne_ids.nouveau_total, 1150.0)
+        self.assertEqual(recalcul.ligne_ids.nouveau_reste, 850.0)
+        self.assertEqual(recalcul.ecart_total, 150.0)
+        # La simulation ne modifie rien
+        self.assertEqual(self.reservation.montant_total, 1000.0)
+        
+        recalcul.action_appliquer()
+        self.assertEqual(self.reservation.montant_total, 1150.0)
+        self.assertEqual(self.reservation.reste_a_payer, 850.0)
+        self.assertEqual(annulee.montant_total, 500.0)
+
+    def test_recalcul_prix_simulation_perimee(self):
+        """Test qu'un recalcul simulé n'est pas appliqué si le tarif a changé depuis la simulation"""
+        self.env['agencevoyage.voyageur'].create([
+            {'reservation_id': self.reservation.id, 'nom': 'Adulte 1', 'type_voyageur': 'adulte'},
+            {'reservation_id': self.reservation.id, 'nom': 'Adulte 2', 'type_voyageur': 'adulte'},
+        ])
+        self.voyage.prix_adulte = 550.0
+        recalcul = self.env['agencevoyage.recalcul.prix'].create({'voyage_id': self.voyage.id})
+        recalcul.action_simuler()
+        self.assertEqual(recalcul.ligne_ids.nouveau_total, 1100.0)
+        
+        # Nouveau tarif entre la simulation et l'application : rien n'est écrit
+        self.voyage.prix_adulte = 600.0
+        with self.assertRaises(UserError):
+            recalcul.action_appliquer()
+        self.assertEqual(self.reservation.montant_total, 1000.0)
+        self.assertEqual(recalcul.state, 'simule')
+        
+        # Nouvelle simulation : les totaux écrits sont ceux qui ont été vérifiés
+        recalcul.action_simuler()
+        self.assertEqual(recalcul.ecart_total, 200.0)
+        recalcul.action_appliquer()
+        self.assertEqual(recalcul.state, 'applique')
+        self.assertEqual(self.reservation.montant_total, 1200.0)
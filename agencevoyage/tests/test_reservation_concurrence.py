@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from psycopg2 import errors
+
+import odoo
+from odoo import api, SUPERUSER_ID
+from odoo.exceptions import UserError
+from odoo.tests.common import BaseCase, get_db_name, tagged
+
+
+@tagged('-at_install', 'post_install')
+class TestReservationConcurrence(BaseCase):
+    """Tests de confirmations simultanées sur les dernières places d'un voyage.
+
+    Chaque agent confirme ses réservations dans des transactions validées,
+    comme des utilisateurs différents : les données sont supprimées à la fin
+    du test.
+    """
+
+    PLACES = 10
+    NOMBRE_AGENTS = 8
+    RESERVATIONS_PAR_AGENT = 3
+    TENTATIVES_MAX = 20
+
+    def setUp(self):
+        super(TestReservationConcurrence, self).setUp()
+        self.registry = odoo.registry(get_db_name())
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            # Client sans email : aucune confirmation n'est mise en file d'envoi
+            client = env['agencevoyage.client'].create({
+                'nom': 'Concurrence',
+                'prenom': 'Client',
+                'telephone': '0123456789',
+                'adresse': '1 Rue Test',
+                'nationalite': 'Française',
+                'sexe': 'masculin',
+            })
+            destination = env['agencevoyage.destination'].create({
+                'nom_lieu': 'Rome',
+                'ville': 'Rome',
+                'pays': 'Italie',
+                'adresse': 'Rome, Italie',
+            })
+            voyage = env['agencevoyage.voyage'].create({
+                'titre_voyage': 'Voyage Test Concurrence',
+                'destination_id': destination.id,
+                'ville_depart': 'Lyon',
+                'date_debut': date.today() + timedelta(days=30),
+                'date_fin': date.today() + timedelta(days=37),
+                'prix_adulte': 500.0,
+                'prix_enfant': 300.0,
+                'place_total': self.PLACES,
+            })
+            reservations = env['agencevoyage.reservation'].create([{
+                'date_reservation': date.today(),
+                'voyage_id': voyage.id,
+                'client_id': client.id,
+                'voyageur_ids': [
+                    (0, 0, {'nom': 'Voyageur %d-%d' % (rang, i), 'type_voyageur': 'adulte', 'age': 30})
+                    for i in range(1 + rang % 2)
+                ],
+            } for rang in range(self.NOMBRE_AGENTS * self.RESERVATIONS_PAR_AGENT)])
+            self.client_id = client.id
+            self.destination_id = destination.id
+            self.voyage_id = voyage.id
+            self.reservation_ids = reservations.ids
+        self.addCleanup(self._nettoyer)
+
+    def _nettoyer(self):
+        with self.registry.cursor() as cr:
+            reservation_ids = tuple(self.reservation_ids)
+            for model, res_ids in [
+                ('agencevoyage.reservation', reservation_ids),
+                ('agencevoyage.voyage', (self.voyage_id,)),
+                ('agencevoyage.destination', (self.destination_id,)),
+                ('agencevoyage.client', (self.client_id,)),
+            ]:
+                cr.execute("DELETE FROM mail_message WHERE model = %s AND res_id IN %s", (model, res_ids))
+                cr.execute("DELETE FROM mail_followers WHERE res_model = %s AND res_id IN %s", (model, res_ids))
+            cr.execute("DELETE FROM agencevoyage_reservation WHERE id IN %s", (reservation_ids,))
+            cr.execute("DELETE FROM agencevoyage_voyage WHERE id = %s", (self.voyage_id,))
+            cr.execute("DELETE FROM agencevoyage_destination WHERE id = %s", (self.destination_id,))
+            cr.execute("DELETE FROM agencevoyage_client WHERE id = %s", (self.client_id,))
+
+    def _confirmer(self, reservation_id):
+        """Confirme une réservation dans sa propre transaction.
+
+        Comme le serveur pour une requête, la transaction est rejouée après un
+        conflit de sérialisation (mise à jour simultanée du même voyage).
+
+        :return: True si la réservation est confirmée, False si le voyage est complet
+        """
+        for tentative in range(self.TENTATIVES_MAX):
+            try:
+                with self.registry.cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    env['agencevoyage.reservation'].browse(reservation_id).action_confirmer()
+                return True
+            except UserError:
+                return False
+            except errors.SerializationFailure:
+                time.sleep(random.uniform(0, 0.01 * 2 ** min(tentative, 6)))
+        raise AssertionError('Confirmation abandonnée après %d tentatives' % self.TENTATIVES_MAX)
+
+    def _agent(self, reservation_ids, depart, resultats, erreurs):
+        depart.wait()
+        try:
+            for reservation_id in reservation_ids:
+                resultats[reservation_id] = self._confirmer(reservation_id)
+        except Exception as e:
+            erreurs.append(e)
+
+    def test_confirmations_simultanees(self):
+        """Test que les confirmations simultanées ne surréservent jamais le voyage"""
+        depart = threading.Barrier(self.NOMBRE_AGENTS)
+        resultats = {}
+        erreurs = []
+        agents = [
+            threading.Thread(target=self._agent, args=(
+                self.reservation_ids[numero::self.NOMBRE_AGENTS], depart, resultats, erreurs))
+            for numero in range(self.NOMBRE_AGENTS)
+        ]
+        for agent in agents:
+            agent.start()
+        for agent in agents:
+            agent.join()
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(len(resultats), len(self.reservation_ids))
+
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            voyage = env['agencevoyage.voyage'].browse(self.voyage_id)
+            reservations = env['agencevoyage.reservation'].browse(self.reservation_ids)
+            confirmees = reservations.filtered(lambda r: r.statut == 'confirmee')
+
+            # Seules les confirmations acceptées sont passées, sans dépasser les places du voyage
+            self.assertEqual(set(confirmees.ids), {rid for rid, confirmee in resultats.items() if confirmee})
+            places_confirmees = sum(confirmees.mapped('total_personnes'))
+            self.assertLessEqual(places_confirmees, self.PLACES)
+            self.assertEqual(voyage.place_reserve, places_confirmees)
+            self.assertEqual(voyage.place_disponible, self.PLACES - places_confirmees)
+            self.assertEqual(confirmees.mapped('places_bloquees'), confirmees.mapped('total_personnes'))
+            self.assertFalse(any((reservations - confirmees).mapped('places_bloquees')))
+
+            # La demande dépasse l'offre : les refus ne laissent pas de place qu'une réservation restante aurait pu prendre
+            refusees = reservations - confirmees
+            self.assertTrue(refusees)
+            self.assertGreater(min(refusees.mapped('total_personnes')), voyage.place_disponible)
@@ -88,7 +88,6 @@ class TestVoyage(TransactionCase):
                 'age': 30,
             })
         
-        voyage._compute_place_reserve()
         self.assertEqual(voyage.place_reserve, 5)
         self.assertEqual(voyage.place_disponible, 15)
 